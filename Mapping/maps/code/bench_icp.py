@@ -0,0 +1,81 @@
+"""
+ICP correspondence-backend benchmark.
+
+Ray-casts two synthetic A2M12-density scans of a small concourse (walls +
+pillars), offsets the second by a known walking-speed motion and times
+icp_2d() with every nn_search backend.  Run on the target board:
+
+    python3 bench_icp.py            # 720 pts, 200 matches per backend
+    python3 bench_icp.py 1440 50
+"""
+import sys
+import time
+
+import numpy as np
+
+from nn_search import build_nn_index
+from world_building2_1 import icp_2d, ICP_MAX_DIST
+
+LIDAR_RATE_HZ = 10.0         # A2M12 default scan frequency
+NOISE_SIGMA_M = 0.01
+
+# (x0, y0, x1, y1) wall segments of a 16 × 10 m hall with four pillars
+_WALLS = [(-8, -5, 8, -5), (8, -5, 8, 5), (8, 5, -8, 5), (-8, 5, -8, -5)]
+for cx, cy in [(-4, -2), (-4, 2), (3, -2), (3, 2)]:
+    _WALLS += [(cx - .3, cy - .3, cx + .3, cy - .3), (cx + .3, cy - .3, cx + .3, cy + .3),
+               (cx + .3, cy + .3, cx - .3, cy + .3), (cx - .3, cy + .3, cx - .3, cy - .3)]
+WALLS = np.array(_WALLS, dtype=np.float64)
+
+
+def synth_scan(x, y, th, n_beams, rng):
+    """Closest wall hit per beam, returned in the sensor frame."""
+    ang = np.linspace(-np.pi, np.pi, n_beams, endpoint=False)
+    dx, dy = np.cos(ang + th), np.sin(ang + th)
+    p  = WALLS[:, :2]
+    e  = WALLS[:, 2:] - p
+    den = dx[:, None] * e[None, :, 1] - dy[:, None] * e[None, :, 0]
+    wx  = p[None, :, 0] - x
+    wy  = p[None, :, 1] - y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (wx * e[None, :, 1] - wy * e[None, :, 0]) / den
+        u = (wx * dy[:, None] - wy * dx[:, None]) / den
+    t[(den == 0) | (t <= 0) | (u < 0) | (u > 1)] = np.inf
+    r = t.min(axis=1) + rng.normal(0, NOISE_SIGMA_M, n_beams)
+    return np.column_stack([r * np.cos(ang), r * np.sin(ang)])
+
+
+def main():
+    n_pts  = int(sys.argv[1]) if len(sys.argv) > 1 else 720
+    n_runs = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    rng    = np.random.default_rng(0)
+
+    # 0.3 m/s and 15 deg/s at 10 Hz — the mapper's speed tip
+    true_dx, true_dy, true_dt = 0.03, 0.0, np.radians(1.5)
+    tgt = synth_scan(0.0, 0.0, 0.0, n_pts, rng)
+    src = synth_scan(true_dx, true_dy, true_dt, n_pts, rng)
+
+    print(f"ICP benchmark — {n_pts} pts/scan, {n_runs} matches per backend")
+    print(f"{'backend':>8} {'build ms':>9} {'match ms':>9} {'scans/s':>9} "
+          f"{'x native':>9} {'err cm':>7} {'fitness':>8} {'iters':>6}")
+    for backend in ("kdtree", "grid", "brute"):
+        runs = n_runs if backend != "brute" else max(1, n_runs // 10)
+
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            index = build_nn_index(tgt, backend, ICP_MAX_DIST)
+        build_ms = 1e3 * (time.perf_counter() - t0) / runs
+
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            dx, dy, dt, fit, iters = icp_2d(src, tgt, tgt_index=index)
+        match_ms = 1e3 * (time.perf_counter() - t0) / runs
+
+        # icp maps src → tgt, i.e. it recovers the motion itself
+        err_cm = 100 * np.hypot(dx - true_dx, dy - true_dy)
+        rate   = 1e3 / (build_ms + match_ms)
+        print(f"{backend:>8} {build_ms:9.2f} {match_ms:9.2f} {rate:9.0f} "
+              f"{rate / LIDAR_RATE_HZ:8.1f}x {err_cm:7.2f} {fit:8.2f} {iters:6d}")
+
+
+if __name__ == "__main__":
+    main()
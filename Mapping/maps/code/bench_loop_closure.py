@@ -0,0 +1,105 @@
+"""
+Loop-closure search benchmark — linear keyframe scan vs scan-context index.
+
+Fills N keyframe slots with synthetic scans from random poses in the
+bench_icp hall, then times one loop-closure search per query both ways:
+
+    linear : ICP against every stored keyframe (the old try_loop_closure
+             without its distance gate, i.e. what it costs once drift
+             makes the gate useless)
+    index  : ScanContextIndex.query + ICP on the top LC_TOP_K only
+
+Linear is only timed up to LINEAR_MAX keyframes; above that it is
+extrapolated from the per-keyframe cost.
+
+    python3 bench_loop_closure.py                  # 50..3000 keyframes
+    python3 bench_loop_closure.py 300 1000
+"""
+import sys
+import time
+
+import numpy as np
+
+from bench_icp import synth_scan, LIDAR_RATE_HZ, WALLS
+from nn_search import build_nn_index
+from place_recognition import ScanContextIndex
+from occupancy_grid import scan_to_world
+from world_building2_1 import (icp_2d, ICP_MAX_DIST, ICP_NN_BACKEND,
+                               LC_TOP_K, LC_MATCH_THRESH, MAX_POINTS_ICP)
+
+LINEAR_MAX = 300
+N_QUERIES  = 10
+SIZES      = (50, 100, 300, 1000, 3000)
+
+
+def _random_pose(rng):
+    x0, y0 = WALLS[:, [0, 2]].min() + 0.5, WALLS[:, [1, 3]].min() + 0.5
+    x1, y1 = WALLS[:, [0, 2]].max() - 0.5, WALLS[:, [1, 3]].max() - 0.5
+    return rng.uniform(x0, x1), rng.uniform(y0, y1), rng.uniform(-np.pi, np.pi)
+
+
+def _lc_icp(src, kf_pts, kf_index):
+    return icp_2d(src, kf_pts, max_iter=20, max_dist=ICP_MAX_DIST * 1.5,
+                  tgt_index=kf_index)
+
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or list(SIZES)
+    rng   = np.random.default_rng(0)
+
+    print(f"Loop-closure search — {MAX_POINTS_ICP} pts/scan, "
+          f"top-{LC_TOP_K}, {N_QUERIES} queries per size")
+    print(f"{'keyframes':>9} {'linear ms':>10} {'index ms':>9} {'query ms':>9} "
+          f"{'speed-up':>9} {'recall':>7} {'% of scan':>10}")
+
+    for n in sizes:
+        poses = [_random_pose(rng) for _ in range(n)]
+        kfs   = []
+        index = ScanContextIndex(n)
+        for i, p in enumerate(poses):
+            pts = synth_scan(*p, MAX_POINTS_ICP, rng)
+            kfs.append((pts, build_nn_index(pts, ICP_NN_BACKEND, ICP_MAX_DIST)))
+            index.add(i, pts, item=i)
+
+        lin_ms = idx_ms = q_ms = 0.0
+        hits   = 0
+        n_lin  = min(n, LINEAR_MAX)
+        for _ in range(N_QUERIES):
+            k = int(rng.integers(n))
+            x, y, th = poses[k]
+            cur = synth_scan(x + rng.normal(0, 0.2), y + rng.normal(0, 0.2),
+                             th + rng.normal(0, 0.3), MAX_POINTS_ICP, rng)
+
+            t0 = time.perf_counter()
+            for pts, kf_index in kfs[:n_lin]:
+                _lc_icp(cur, pts, kf_index)
+            lin_ms += 1e3 * (time.perf_counter() - t0) * n / n_lin
+
+            t0 = time.perf_counter()
+            cands = index.query(cur, LC_TOP_K)
+            t1 = time.perf_counter()
+            best, best_fit = None, LC_MATCH_THRESH
+            for i, _, yaw in cands:
+                fit = _lc_icp(scan_to_world((0.0, 0.0, yaw), cur), *kfs[i])[3]
+                if fit > best_fit:
+                    best, best_fit = i, fit
+            t2 = time.perf_counter()
+            q_ms   += 1e3 * (t1 - t0)
+            idx_ms += 1e3 * (t2 - t0)
+            hits   += best is not None and np.hypot(poses[best][0] - x,
+                                                    poses[best][1] - y) < 1.0
+
+        lin_ms /= N_QUERIES
+        idx_ms /= N_QUERIES
+        q_ms   /= N_QUERIES
+        scan_ms = 1e3 / LIDAR_RATE_HZ
+        tag     = "" if n <= LINEAR_MAX else "*"
+        print(f"{n:>9} {lin_ms:9.1f}{tag or ' '} {idx_ms:9.1f} {q_ms:9.3f} "
+              f"{lin_ms / idx_ms:8.0f}x {hits / N_QUERIES:7.2f} "
+              f"{100 * idx_ms / scan_ms:9.1f}%")
+    print("* extrapolated from the first "
+          f"{LINEAR_MAX} keyframes")
+
+
+if __name__ == "__main__":
+    main()
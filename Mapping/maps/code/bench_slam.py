@@ -0,0 +1,232 @@
+"""
+End-to-end SLAM accuracy / throughput benchmark on the station maps.
+
+Drives a simulated A2M12 (sim_scans.py) around a closed route through
+each station map, feeds every scan to the mapper exactly as the live loop
+does and reports, per map:
+
+    ATE          absolute trajectory error of the online pose estimate
+                 against ground truth (RMSE after a rigid 2-D alignment),
+                 plus the worst single error and the error at the end
+    ICP iters    mean iterations per scan-to-scan match, share at the cap
+    latency      p50 / p95 / p99 / max per pipeline stage (the mapper's
+                 own stage timers, stage_timer.py) and per scan
+    scans/s      scans over time spent inside process_scan()
+    peak RSS     high-water mark of the mapper process
+
+    python3 bench_slam.py                              # all maps, 120 s each
+    python3 bench_slam.py floor5lab_map_edited --seconds 60 --people 6
+    python3 bench_slam.py --json now.json              # save the results
+    python3 bench_slam.py --baseline base.json         # exit 1 on regression
+
+Simulation time is excluded from every figure.  --sync waits for the
+loop-closure worker and the optimiser after each scan and lifts the
+matcher budgets (as replay.py --sync), which makes ATE repeatable across
+runs; latency is then not representative of the robot.
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+
+import numpy as np
+
+import world_building2_1 as wb
+from sim_scans import NOISE_MM, SCAN_RATE_HZ, STATION_MAPS, simulate
+
+PERCENTILES = (50, 95, 99)
+
+# --baseline: relative slack per metric, and an absolute floor so noise
+# on a tiny number does not fail the gate
+GATE = {
+    "ate_rmse_m":     (0.25, 0.02),
+    "scan_p95_ms":    (0.25, 2.0),
+    "scans_per_s":    (0.25, 0.0),     # lower is worse
+    "peak_rss_mb":    (0.15, 10.0),
+}
+
+
+def _peak_rss_mb() -> float:
+    """VmHWM of this process (ru_maxrss is KB on Linux)."""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _reset_peak_rss():
+    """Restart VmHWM so each map reports its own peak (Linux ≥ 4.0)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _xyt_between(a, b):
+    """a⁻¹ ∘ b for (x, y, theta) arrays of shape (…, 3)."""
+    c, s = np.cos(a[..., 2]), np.sin(a[..., 2])
+    dx, dy = b[..., 0] - a[..., 0], b[..., 1] - a[..., 1]
+    return np.stack([c * dx + s * dy, -s * dx + c * dy,
+                     np.arctan2(np.sin(b[..., 2] - a[..., 2]),
+                                np.cos(b[..., 2] - a[..., 2]))], axis=-1)
+
+
+def trajectory_error(est: np.ndarray, gt: np.ndarray):
+    """
+    Returns
+    -------
+    (ate_rmse, ate_max, final_err) in metres, all after the same rigid
+    alignment.  `est` is in the mapper's frame (starts at the origin), `gt`
+    in the map frame.
+    """
+    ref = _xyt_between(gt[0], gt)[:, :2]          # ground truth, start frame
+    p   = est[:, :2]
+    mp, mr = p.mean(axis=0), ref.mean(axis=0)
+    u, _, vt = np.linalg.svd((p - mp).T @ (ref - mr))
+    d  = np.sign(np.linalg.det(vt.T @ u.T))
+    R  = vt.T @ np.diag([1.0, d]) @ u.T
+    err = np.hypot(*((p - mp) @ R.T + mr - ref).T)
+    return float(np.sqrt(np.mean(err ** 2))), float(err.max()), float(err[-1])
+
+
+def run_map(map_name: str, seconds: float, people: int, noise_mm: float,
+            seed: int, sync: bool) -> dict:
+    mapper = wb.SLAMMapper()
+    stages = ("scan", *wb.PIPELINE_STAGES)
+    lat    = {s: [] for s in stages}
+    est, gt = [], []
+    busy_s, proc_i, icp_fail = 0.0, 0, 0
+
+    _reset_peak_rss()
+    for t, pose, angle_deg, dist_mm in simulate(map_name, seconds, people,
+                                                seed, noise_mm):
+        t0  = time.perf_counter()
+        out = wb.process_scan(mapper, proc_i, angle_deg, dist_mm, "bench_slam", t)
+        dt  = time.perf_counter() - t0
+        if out is None:
+            continue
+        busy_s += dt
+        for s in stages:
+            lat[s].append(mapper.timers.last.get(s, 0.0))
+        if sync:
+            mapper.lc_worker.wait(timeout=60.0)
+            mapper.backend.wait(timeout=60.0)
+
+        cur, icp_ok = out
+        icp_fail += not icp_ok
+        est.append((cur.x(), cur.y(), cur.theta()))
+        gt.append(pose)
+        proc_i += 1
+        mapper.scans_processed = proc_i
+        if proc_i % 10 == 0:
+            wb.print_status(mapper, proc_i, proc_i, 0.0, *out)
+
+    mapper.backend.wait(timeout=5.0)
+    mapper.backend.close()
+    mapper.lc_worker.close()
+    mapper.rerenderer.close()
+    mapper.map_writer.close()
+    print(" " * 110, end="\r")
+
+    ate, ate_max, final = trajectory_error(np.array(est), np.array(gt))
+    it_mean, it_cap = mapper.icp_iter_stats()
+    res = {
+        "map":          map_name,
+        "scans":        proc_i,
+        "ate_rmse_m":   ate,
+        "ate_max_m":    ate_max,
+        "final_err_m":  final,
+        "loop_closures": mapper.lc_count,
+        "icp_failures": icp_fail,
+        "icp_iters_mean": it_mean,
+        "icp_iters_capped": it_cap,
+        "scans_per_s":  proc_i / max(busy_s, 1e-9),
+        "peak_rss_mb":  _peak_rss_mb(),
+    }
+    for s, v in lat.items():
+        v = np.asarray(v) if v else np.zeros(1)
+        for q in PERCENTILES:
+            res[f"{s}_p{q}_ms"] = float(np.percentile(v, q))
+        res[f"{s}_max_ms"] = float(v.max())
+    return res
+
+
+def print_report(res: dict):
+    print(f"\n── {res['map']}  ({res['scans']} scans, "
+          f"{res['scans'] / SCAN_RATE_HZ:.0f} s simulated)")
+    print(f"  ATE rmse / max   : {res['ate_rmse_m']:.3f} / {res['ate_max_m']:.3f} m"
+          f"   (end {res['final_err_m']:.3f} m)")
+    print(f"  Loop closures    : {res['loop_closures']}   "
+          f"ICP failures: {res['icp_failures']}")
+    print(f"  ICP iterations   : mean {res['icp_iters_mean']:.1f}   "
+          f"{100 * res['icp_iters_capped']:.0f}% hit the cap")
+    print(f"  Throughput       : {res['scans_per_s']:.1f} scans/s   "
+          f"peak RSS {res['peak_rss_mb']:.0f} MB")
+    print(f"  {'stage':<14}" + "".join(f"{'p%d' % q:>8}" for q in PERCENTILES)
+          + f"{'max':>8}   ms")
+    for s in ("scan", *wb.PIPELINE_STAGES):
+        print(f"  {s:<14}" + "".join(f"{res[f'{s}_p{q}_ms']:8.2f}" for q in PERCENTILES)
+              + f"{res[f'{s}_max_ms']:8.2f}")
+
+
+def check_baseline(results: list, baseline: list) -> list:
+    """Regressions against a previous --json, as printable strings."""
+    base = {r["map"]: r for r in baseline}
+    bad  = []
+    for r in results:
+        b = base.get(r["map"])
+        if b is None:
+            continue
+        for key, (rel, floor) in GATE.items():
+            worse = b[key] - r[key] if key == "scans_per_s" else r[key] - b[key]
+            if worse > max(rel * abs(b[key]), floor):
+                bad.append(f"{r['map']}: {key} {b[key]:.3f} → {r[key]:.3f}")
+    return bad
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("maps", nargs="*", default=STATION_MAPS,
+                    help="map yaml paths or station map names (default: all)")
+    ap.add_argument("--seconds", type=float, default=120.0,
+                    help="simulated run length per map (default 120)")
+    ap.add_argument("--people", type=int, default=3)
+    ap.add_argument("--noise-mm", type=float, default=NOISE_MM)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sync", action="store_true",
+                    help="wait for background workers, no time budgets")
+    ap.add_argument("--json", help="write the results here")
+    ap.add_argument("--baseline", help="results of an earlier --json to gate against")
+    args = ap.parse_args()
+
+    wb.AUTOSAVE_EVERY = 0
+    if args.sync:
+        wb.CSM_BUDGET_MS    = float("inf")
+        wb.LC_CSM_BUDGET_MS = float("inf")
+
+    print(f"SLAM benchmark — {args.seconds:g} s per map, {args.people} people, "
+          f"{args.noise_mm:g} mm noise, seed {args.seed}"
+          + (", synchronous" if args.sync else ""))
+    results = []
+    for m in args.maps:
+        results.append(run_map(m, args.seconds, args.people, args.noise_mm,
+                               args.seed, args.sync))
+        print_report(results[-1])
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults → {args.json}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            bad = check_baseline(results, json.load(f))
+        if bad:
+            print("\n[FAIL] Regressions against " + args.baseline + ":")
+            for line in bad:
+                print("  " + line)
+            sys.exit(1)
+        print(f"\n[OK] No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
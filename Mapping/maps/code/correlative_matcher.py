@@ -0,0 +1,208 @@
+import time
+
+import cv2
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  MULTI-RESOLUTION CORRELATIVE SCAN MATCHING  (branch and bound)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  A scan is scored against a likelihood field: every cell holds
+#  exp(−d² / 2σ²), d = distance to the nearest obstacle, and a pose's
+#  score is the mean field value under the transformed points (0 … 1).
+#
+#  Level k of the field pyramid holds, in each cell, the max over the
+#  2^k × 2^k block of level-0 cells starting there.  Scoring a scan on
+#  level k at translation offset (ox, oy) is therefore an upper bound
+#  for every offset in [ox, ox + 2^k) × [oy, oy + 2^k), which lets the
+#  search discard whole blocks of translations after one gather
+#  (Olson 2009; the same scheme as Cartographer's fast CSM).
+#
+#  The search is exhaustive over the window — no local minima, which is
+#  what ICP lacks in open space — and holds to a wall-clock budget.  The
+#  top level, every rotation × every coarse block, is the bulk of the
+#  work, so it is scored a few rotations at a time from the initial
+#  heading outwards and stops at TOP_SHARE of the budget; the rest is
+#  left for the descent, which checks the budget between nodes.  Out of
+#  time, the best leaf found so far is returned, from the headings
+#  nearest the initial guess.
+
+TOP_SHARE  = 0.5            # share of the budget the top level may use
+TOP_CHUNK  = 8              # rotations scored per step of the top level
+
+
+def compose_xyt(a, b):
+    """(x, y, theta) composition a ∘ b, without gtsam."""
+    c, s = np.cos(a[2]), np.sin(a[2])
+    return (a[0] + c * b[0] - s * b[1],
+            a[1] + s * b[0] + c * b[1],
+            float(np.arctan2(np.sin(a[2] + b[2]), np.cos(a[2] + b[2]))))
+
+
+class LikelihoodField:
+    """
+    Field pyramid over an obstacle mask.  Cell (i, j) of `levels[0]`
+    covers world [x0 + j·res, x0 + (j+1)·res) × [y0 + i·res, …).
+    """
+    __slots__ = ('res', 'origin', 'levels')
+
+    def __init__(self, occupied: np.ndarray, origin_xy, res: float,
+                 sigma: float, depth: int):
+        self.res    = res
+        self.origin = (float(origin_xy[0]), float(origin_xy[1]))
+
+        free = np.where(occupied, 0, 255).astype(np.uint8)
+        d    = cv2.distanceTransform(free, cv2.DIST_L2, 5) * (res / sigma)
+        base = np.exp(-0.5 * d * d).astype(np.float32)
+
+        self.levels = [base]
+        for k in range(1, depth + 1):
+            h, prev = 1 << (k - 1), self.levels[-1]
+            nxt = prev.copy()
+            np.maximum(nxt[:-h], prev[h:], out=nxt[:-h])
+            np.maximum(nxt[:, :-h], nxt[:, h:].copy(), out=nxt[:, :-h])
+            self.levels.append(nxt)
+
+    @classmethod
+    def from_points(cls, pts: np.ndarray, res: float, sigma: float,
+                    depth: int, margin: float):
+        """Field around a point set, padded by `margin` metres."""
+        lo = pts.min(axis=0) - margin
+        hi = pts.max(axis=0) + margin
+        w, h = (np.ceil((hi - lo) / res).astype(int) + 1)
+        occ = np.zeros((h, w), dtype=bool)
+        c = np.floor((pts - lo) / res).astype(np.intp)
+        occ[c[:, 1], c[:, 0]] = True
+        return cls(occ, lo, res, sigma, depth)
+
+    @property
+    def depth(self) -> int:
+        return len(self.levels) - 1
+
+    def score(self, level: int, cx: np.ndarray, cy: np.ndarray) -> np.ndarray:
+        """
+        Mean field value per candidate.  cx, cy are (..., N) cell
+        coordinates of the block origin; blocks hanging off the low edge
+        are clipped onto it (still an upper bound), blocks past the high
+        edge score zero.
+        """
+        grid = self.levels[level]
+        h, w = grid.shape
+        blk  = 1 << level
+        ok   = (cx > -blk) & (cx < w) & (cy > -blk) & (cy < h)
+        v    = grid[np.clip(cy, 0, h - 1), np.clip(cx, 0, w - 1)]
+        return np.where(ok, v, 0.0).mean(axis=-1)
+
+
+class CorrelativeMatcher:
+    """
+    Branch-and-bound search of (x, y, theta) around an initial pose.
+
+    Parameters
+    ----------
+    budget_ms : wall-clock limit of one match; once it runs out the best
+                leaf so far is returned and `timeouts` is incremented
+    min_score : poses scoring below this are never reported
+    """
+
+    def __init__(self, budget_ms: float, min_score: float):
+        self.budget_ms = budget_ms
+        self.min_score = min_score
+        self.timeouts   = 0
+        self.last_ms    = 0.0
+        self.max_ms     = 0.0
+        self.last_nodes = 0
+
+    def match(self, field: LikelihoodField, pts: np.ndarray, pose0,
+              win_xy: float, win_th: float, t0: float | None = None):
+        """
+        Best pose of sensor-frame `pts` in the field's frame within
+        ±win_xy metres and ±win_th radians of `pose0`.  The budget runs
+        from perf_counter() time `t0` (default: now), so a caller can
+        count its own setup, such as building the field, against it.
+
+        Returns
+        -------
+        ((x, y, theta), score)   or  (None, best_score) below min_score
+        """
+        if t0 is None:
+            t0 = time.perf_counter()
+        deadline = t0 + self.budget_ms / 1e3
+        top_end  = t0 + TOP_SHARE * self.budget_ms / 1e3
+        res, D   = field.res, field.depth
+
+        # angular step: the farthest point moves at most one cell
+        r_max = float(np.hypot(pts[:, 0], pts[:, 1]).max())
+        d_th  = np.arccos(np.clip(1 - res * res / (2 * r_max * r_max), -1, 1))
+        n_th  = int(np.ceil(win_th / d_th)) if win_th > 0 else 0
+        thetas = pose0[2] + d_th * np.arange(-n_th, n_th + 1)
+
+        # discretised points for every rotation, translated to pose0
+        c, s = np.cos(thetas)[:, None], np.sin(thetas)[:, None]
+        wx = pose0[0] + c * pts[:, 0] - s * pts[:, 1]
+        wy = pose0[1] + s * pts[:, 0] + c * pts[:, 1]
+        cx = np.floor((wx - field.origin[0]) / res).astype(np.intp)   # (T, N)
+        cy = np.floor((wy - field.origin[1]) / res).astype(np.intp)
+
+        # top level: blocks of 2^D offsets tiling [-w, w]², nearest
+        # headings first, until its share of the budget is spent
+        w    = int(np.ceil(win_xy / res))
+        blk  = 1 << D
+        offs = np.arange(-w, w + 1, blk)
+        ox, oy = (a.ravel() for a in np.meshgrid(offs, offs))
+        self._timed_out = False
+        by_turn = np.argsort(np.abs(np.arange(len(thetas)) - n_th), kind="stable")
+        done, rows = [], []
+        for i in range(0, len(by_turn), TOP_CHUNK):
+            if rows and time.perf_counter() > top_end:
+                self._timed_out = True
+                break
+            ts = by_turn[i:i + TOP_CHUNK]
+            rows.append(field.score(D, cx[ts, None, :] + ox[None, :, None],
+                                    cy[ts, None, :] + oy[None, :, None]))   # (chunk, K)
+            done.append(ts)
+        done, sc = np.concatenate(done), np.concatenate(rows)
+        ti, ki = np.unravel_index(np.argsort(sc, axis=None)[::-1], sc.shape)
+        top = [(sc[t, k], done[t], ox[k], oy[k]) for t, k in zip(ti, ki)]
+
+        self._best  = (None, self.min_score)
+        self._nodes = 0
+        self._search(field, cx, cy, top, D, w, deadline)
+
+        self.last_ms    = 1e3 * (time.perf_counter() - t0)
+        self.max_ms     = max(self.max_ms, self.last_ms)
+        self.last_nodes = self._nodes
+        if self._timed_out:
+            self.timeouts += 1
+
+        leaf, score = self._best
+        if leaf is None:
+            return None, score
+        t, dx, dy = leaf
+        return (pose0[0] + dx * res, pose0[1] + dy * res,
+                float(thetas[t])), float(score)
+
+    def _search(self, field, cx, cy, cands, depth, w, deadline):
+        """Best-first DFS: visit children of the best bound first, prune."""
+        for score, t, ox, oy in cands:
+            if score <= self._best[1]:
+                return                       # sorted — nothing better follows
+            if time.perf_counter() > deadline:
+                self._timed_out = True
+                return
+            self._nodes += 1
+            if depth == 0:
+                self._best = ((t, ox, oy), score)
+                continue
+            h   = 1 << (depth - 1)
+            cox = np.array([ox, ox + h, ox, ox + h])
+            coy = np.array([oy, oy, oy + h, oy + h])
+            keep = (cox <= w) & (coy <= w)
+            cox, coy = cox[keep], coy[keep]
+            sc  = field.score(depth - 1, cx[t] + cox[:, None], cy[t] + coy[:, None])
+            order = np.argsort(sc)[::-1]
+            self._search(field, cx, cy,
+                         [(sc[i], t, cox[i], coy[i]) for i in order],
+                         depth - 1, w, deadline)
+            if self._timed_out:
+                return
@@ -0,0 +1,70 @@
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  KEYFRAME STORE  (preallocated ring of keyframe scans and poses)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The mapper keeps the newest MAX_KEYFRAMES keyframes for loop-closure
+#  lookups, the re-renderer and session saves.  They live in three
+#  arrays allocated once: a float32 point tensor with a count per slot,
+#  an (N, 3) matrix of painted poses, and the pose ids and distances
+#  driven.  Adding a keyframe copies its points into the next slot and
+#  overwrites the oldest once the ring is full, so a long run allocates
+#  nothing per keyframe.  Points are float32 because a keyframe scan
+#  only needs millimetre precision; that halves their memory.
+#
+#  Queries over every keyframe are single array operations:
+#  find(pose_id) is one comparison, and slots() lists the slots oldest
+#  first without touching the points.
+
+
+class KeyframeStore:
+    """
+    Ring of the newest `capacity` keyframes.  Slot i holds keyframe
+    `pose_ids[i]` (-1 = empty), painted at `poses[i]` = (x, y, theta),
+    `odom[i]` metres driven before it, and its first `counts[i]` rows
+    of `points[i]`.
+    """
+
+    def __init__(self, capacity: int, max_points: int):
+        self.capacity  = capacity
+        self.points    = np.zeros((capacity, max_points, 2), dtype=np.float32)
+        self.counts    = np.zeros(capacity, dtype=np.int32)
+        self.poses     = np.zeros((capacity, 3), dtype=np.float64)
+        self.pose_ids  = np.full(capacity, -1, dtype=np.int64)
+        self.odom      = np.zeros(capacity, dtype=np.float64)
+        self.added     = 0          # keyframes ever appended
+        self.truncated = 0          # scans longer than max_points
+
+    def __len__(self) -> int:
+        return min(self.added, self.capacity)
+
+    def append(self, pose_id: int, pose_xyt, pts: np.ndarray, odom_dist: float) -> int:
+        """Store a keyframe over the oldest slot once full.  Returns its slot."""
+        i = self.added % self.capacity
+        n = min(len(pts), self.points.shape[1])
+        self.points[i, :n] = pts[:n]
+        self.counts[i]     = n
+        self.poses[i]      = pose_xyt
+        self.pose_ids[i]   = pose_id
+        self.odom[i]       = odom_dist
+        self.truncated    += n < len(pts)
+        self.added        += 1
+        return i
+
+    def slots(self) -> np.ndarray:
+        """Occupied slots, oldest keyframe first."""
+        return np.arange(self.added - len(self), self.added) % self.capacity
+
+    def find(self, pose_id: int) -> int | None:
+        """Slot holding keyframe `pose_id`, or None if it is not (or no longer) kept."""
+        hit = np.flatnonzero(self.pose_ids == pose_id)
+        return int(hit[0]) if len(hit) else None
+
+    def pts(self, i: int) -> np.ndarray:
+        """(N, 2) view of slot i's points — overwritten once the ring wraps."""
+        return self.points[i, :self.counts[i]]
+
+    def memory_bytes(self) -> int:
+        return sum(a.nbytes for a in (self.points, self.counts, self.poses,
+                                      self.pose_ids, self.odom))
@@ -0,0 +1,553 @@
+"""
+Shared LiDAR driver — one process owns the RPLidar, everyone else reads.
+
+Only one program can hold /dev/ttyUSB0, so the mapper, the obstacle
+tracker and Nav2 could not run together.  This driver reads the serial
+port once and publishes every revolution twice:
+
+    shared memory   a ring of raw scans (ShmScanRing) that any local
+                    Python process attaches to by name, read in place
+    ROS 2           sensor_msgs/LaserScan on /laser, the topic the Nav2
+                    costmaps in pepper_nav2_params.yaml listen on
+
+    python3 lidar_mux.py                               # serial → ring + /laser
+    python3 lidar_mux.py --no-ros                      # ring only
+    python3 lidar_mux.py --record run.scanlog          # also log for replay.py
+    python3 lidar_mux.py --replay floor10_3.scanlog    # serve a log, no LiDAR
+
+    python3 world_building2_1.py --shm hcrt_scans      # consumers
+    LIDAR_SHM = "hcrt_scans"                           # lidar_code_final.py
+"""
+import argparse
+import os
+import threading
+import time
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+from lidar_reader import LidarReader
+from scan_ingest import raw_arrays
+
+# ═══════════════════════════════════════════════════════════════════
+#  SHARED-MEMORY SCAN RING
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The ring is ScanRing laid out in one shared-memory segment:
+#
+#      header    i64 magic, version, slots, max_points, written,
+#                    reconnects, closed, failed
+#      heartbeat f64 time.time() of the driver's last sign of life
+#      per slot  i64 seq, i32 count, f64 stamp, and max_points samples
+#                of f32 angle (deg), f32 dist (mm), u8 quality
+#
+#  One writer, any number of readers.  Readers never lock: each slot's
+#  seq is set to -1 while the writer fills it and to the scan's sequence
+#  number once it is complete, so a reader that finds the expected seq
+#  has a whole revolution.  take_newest() hands out views straight into
+#  the segment.  They stay valid until the writer comes round to the
+#  same slot again, `slots` revolutions later; a consumer that holds a
+#  scan longer checks intact(seq) afterwards, or copies it.
+#
+#  Each reader keeps its own position, so one slow consumer only drops
+#  scans for itself.
+
+SHM_NAME     = "hcrt_scans"
+SHM_SLOTS    = 16           # 1.6 s of A2M12 at 10 Hz before a slot is reused
+SHM_POINTS   = 2048         # samples per revolution — match SCAN_MAX_POINTS
+SHM_POLL_S   = 0.002        # reader poll interval while waiting for a scan
+HEARTBEAT_S  = 0.5          # driver heartbeat period
+STALE_S      = 3.0          # readers treat the driver as gone after this
+
+MAGIC   = 0x4843525453434E31          # "HCRTSCN1"
+VERSION = 1
+
+_H_MAGIC, _H_VERSION, _H_SLOTS, _H_POINTS, _H_WRITTEN, _H_RECONNECTS, \
+    _H_CLOSED, _H_FAILED = range(8)
+_HEADER_WORDS = 8
+
+
+def _layout(slots: int, max_points: int):
+    """(name, dtype, shape, offset) of every array, and the total size."""
+    fields = [("header",    np.int64,   (_HEADER_WORDS,)),
+              ("heartbeat", np.float64, (1,)),
+              ("seq",       np.int64,   (slots,)),
+              ("stamps",    np.float64, (slots,)),
+              ("counts",    np.int32,   (slots,)),
+              ("angle_deg", np.float32, (slots, max_points)),
+              ("dist_mm",   np.float32, (slots, max_points)),
+              ("quality",   np.uint8,   (slots, max_points))]
+    out, off = [], 0
+    for name, dtype, shape in fields:
+        off = -(-off // 8) * 8                           # 8-byte align
+        out.append((name, dtype, shape, off))
+        off += int(np.prod(shape)) * np.dtype(dtype).itemsize
+    return out, off
+
+
+class ShmScanRing:
+    """
+    Scan ring in a named shared-memory segment.  create() makes the
+    writer's end, with the same push()/push_arrays()/close() as ScanRing,
+    so a LidarReader fills it directly.  attach() opens a reader's end,
+    with the take_newest()/drop_pct that run_slam expects of a ring.
+
+    Metrics (reader)
+    ----------------
+    written   scans published since this reader attached
+    taken     scans returned
+    dropped   scans never taken
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, owner: bool,
+                 borrowed: bool = False):
+        self.name      = shm.name
+        self._shm      = shm
+        self._owner    = owner
+        self._borrowed = borrowed           # mapping belongs to another ShmScanRing
+        slots, max_points = (int(v) for v in
+                             np.ndarray(4, np.int64, shm.buf)[_H_SLOTS:_H_POINTS + 1])
+        for name, dtype, shape, off in _layout(slots, max_points)[0]:
+            setattr(self, name, np.ndarray(shape, dtype, shm.buf, off))
+        self.slots     = slots
+        self.truncated = 0                  # writer: scans longer than max_points
+        self._first    = int(self.header[_H_WRITTEN])
+        self._last     = self._first        # reader: sequence number last taken
+        self.written   = 0
+        self.taken     = 0
+        self.dropped   = 0
+
+    # ── opening ───────────────────────────────────────────────────────
+
+    @classmethod
+    def create(cls, name: str = SHM_NAME, slots: int = SHM_SLOTS,
+               max_points: int = SHM_POINTS) -> "ShmScanRing":
+        """
+        New segment `name`.  A segment left behind by a driver that died
+        is replaced; one whose driver is still alive is an error.
+        """
+        size = _layout(slots, max_points)[1]
+        try:
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        except FileExistsError:
+            old = cls.attach(name)
+            alive = old.driver_alive
+            old.detach()
+            if alive:
+                raise RuntimeError(f"shared ring '{name}' is in use by a running driver")
+            print(f"[WARN] Replacing stale shared ring '{name}'.")
+            _unlink(name)
+            shm = shared_memory.SharedMemory(name, create=True, size=size)
+        header = np.ndarray(_HEADER_WORDS, np.int64, shm.buf)
+        header[:] = 0
+        header[[_H_SLOTS, _H_POINTS]] = slots, max_points
+        header[[_H_MAGIC, _H_VERSION]] = MAGIC, VERSION
+        del header
+        ring = cls(shm, owner=True)
+        ring.seq[:] = 0
+        ring.beat()
+        return ring
+
+    @classmethod
+    def attach(cls, name: str = SHM_NAME) -> "ShmScanRing":
+        """Reader's end of an existing segment; FileNotFoundError if there is none."""
+        try:
+            shm = shared_memory.SharedMemory(name, track=False)     # Python ≥ 3.13
+        except TypeError:
+            shm = shared_memory.SharedMemory(name)
+            # Before 3.13 every process that opens a segment registers it
+            # with its resource tracker, which unlinks it at exit — a
+            # reader quitting would tear the ring down under the driver.
+            resource_tracker.unregister(shm._name, "shared_memory")
+        head = np.ndarray(2, np.int64, shm.buf)
+        ok   = head[_H_MAGIC] == MAGIC and head[_H_VERSION] == VERSION
+        del head
+        if not ok:
+            shm.close()
+            raise ValueError(f"shared memory '{name}' is not a scan ring")
+        return cls(shm, owner=False)
+
+    def reader(self) -> "ShmScanRing":
+        """
+        A reader's end over this ring's own mapping, for a consumer inside
+        the driver.  attach() by name would drop the driver's resource
+        tracker registration, so the segment would no longer be cleaned up
+        after a crash, and unlinking it at exit would raise in the tracker.
+        """
+        return ShmScanRing(self._shm, owner=False, borrowed=True)
+
+    # ── writer ────────────────────────────────────────────────────────
+
+    def push(self, scan, stamp: float):
+        """Store one iter_scans() revolution of (quality, angle, dist)."""
+        arr = raw_arrays(scan)
+        self.push_arrays(arr[:, 1], arr[:, 2], stamp, arr[:, 0])
+
+    def push_arrays(self, angle_deg, dist_mm, stamp: float, quality=None):
+        seq  = int(self.header[_H_WRITTEN]) + 1
+        slot = (seq - 1) % self.slots
+        n    = min(len(angle_deg), self.angle_deg.shape[1])
+        self.seq[slot]          = -1            # readers skip a slot being filled
+        self.angle_deg[slot, :n] = angle_deg[:n]
+        self.dist_mm[slot, :n]   = dist_mm[:n]
+        self.quality[slot, :n]   = 0 if quality is None else quality[:n]
+        self.counts[slot]        = n
+        self.stamps[slot]        = stamp
+        self.seq[slot]           = seq
+        self.header[_H_WRITTEN]  = seq
+        self.heartbeat[0]        = time.time()
+        self.truncated += n < len(angle_deg)
+
+    def beat(self, reconnects: int | None = None, failed: bool = False):
+        """Driver heartbeat, with its reconnect count and give-up flag."""
+        if reconnects is not None:
+            self.header[_H_RECONNECTS] = reconnects
+        if failed:
+            self.header[_H_FAILED] = 1
+        self.heartbeat[0] = time.time()
+
+    def close(self):
+        """End of stream: readers return None from now on."""
+        self.header[_H_CLOSED] = 1
+
+    def unlink(self):
+        """Remove the segment name (writer, at exit).  Attached readers keep their mapping."""
+        if self._owner:
+            self._shm.unlink()
+
+    # ── reader ────────────────────────────────────────────────────────
+
+    def take_newest(self, timeout: float, quality: bool = False):
+        """
+        Wait up to `timeout` s for a scan newer than the last one taken.
+
+        Returns
+        -------
+        (seq, stamp, angle_deg, dist_mm) views into the segment, plus
+        quality if asked,  or None on timeout / close
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = int(self.header[_H_WRITTEN])
+            if seq > self._last:
+                slot = (seq - 1) % self.slots
+                if self.seq[slot] == seq:
+                    n     = self.counts[slot]
+                    stamp = float(self.stamps[slot])
+                    item  = (seq, stamp, self.angle_deg[slot, :n], self.dist_mm[slot, :n])
+                    if quality:
+                        item += (self.quality[slot, :n],)
+                    if self.seq[slot] == seq:   # not overwritten while reading the count
+                        self.dropped += seq - self._last - 1
+                        self.taken   += 1
+                        self.written  = seq - self._first
+                        self._last    = seq
+                        return item
+            if self.closed or time.monotonic() >= deadline:
+                return None
+            time.sleep(SHM_POLL_S)
+
+    def intact(self, seq: int) -> bool:
+        """True while the slot of scan `seq` still holds it."""
+        return int(self.seq[(seq - 1) % self.slots]) == seq
+
+    @property
+    def closed(self) -> bool:
+        return bool(self.header[_H_CLOSED])
+
+    @property
+    def reconnects(self) -> int:
+        return int(self.header[_H_RECONNECTS])
+
+    @property
+    def failed(self) -> bool:
+        return bool(self.header[_H_FAILED])
+
+    @property
+    def driver_alive(self) -> bool:
+        return not self.closed and time.time() - self.heartbeat[0] < STALE_S
+
+    @property
+    def drop_pct(self) -> float:
+        return 100.0 * self.dropped / max(self.written, 1)
+
+    def detach(self):
+        """
+        Release this process's mapping.  Views handed out by take_newest()
+        that are still referenced keep it open until they are freed.
+        """
+        for name, *_ in _layout(0, 0)[0]:
+            self.__dict__.pop(name, None)
+        if self._borrowed:
+            return
+        try:
+            self._shm.close()
+        except BufferError:
+            pass
+
+
+def _unlink(name: str):
+    shm = shared_memory.SharedMemory(name)
+    shm.close()
+    shm.unlink()
+
+
+class MuxSource:
+    """
+    Scan source for run_slam() fed by a running lidar_mux.py: the same
+    ring / failed / reconnects / is_alive() / stop() as a LidarReader.
+    """
+
+    def __init__(self, name: str = SHM_NAME):
+        self.ring        = ShmScanRing.attach(name)
+        self._reconnects = 0
+        self._failed     = None
+        self._stopped    = False
+
+    @property
+    def reconnects(self) -> int:
+        if not self._stopped:
+            self._reconnects = self.ring.reconnects
+        return self._reconnects
+
+    @property
+    def failed(self):
+        if not self._stopped and self.ring.failed:
+            self._failed = "lidar_mux.py gave up on the LiDAR"
+        return self._failed
+
+    def is_alive(self) -> bool:
+        return not self._stopped and self.ring.driver_alive
+
+    def stop(self, timeout: float = 0.0):
+        if not self._stopped:
+            self._reconnects = self.reconnects      # keep the last values
+            self._failed     = self.failed
+            self._stopped    = True
+            self.ring.detach()
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  LASERSCAN PUBLISHER
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The RPLidar reports samples at irregular angles, clockwise from the
+#  sensor's forward axis; LaserScan wants uniformly spaced ranges,
+#  counter-clockwise.  Each revolution is binned into `bins` sectors
+#  over [-π, π), keeping the nearest return per sector, with its
+#  quality as the intensity.  Sectors without a return are +inf, as
+#  REP 117 asks for "nothing within range".
+
+class LaserScanBinner:
+    """Raw revolution → (ranges, intensities) of a LaserScan, without ROS."""
+
+    def __init__(self, bins: int, range_min_m: float, range_max_m: float):
+        self.bins      = bins
+        self.range_min = range_min_m
+        self.range_max = range_max_m
+        self.increment = 2 * np.pi / bins
+
+    def bin(self, angle_deg: np.ndarray, dist_mm: np.ndarray, quality: np.ndarray):
+        r    = dist_mm * np.float32(1e-3)
+        keep = (r >= self.range_min) & (r <= self.range_max)
+        r    = r[keep]
+        ccw  = -np.radians(angle_deg[keep])                     # A2M12 turns clockwise
+        b    = np.rint((ccw + np.pi) / self.increment).astype(np.intp) % self.bins
+        order  = np.lexsort((r, b))                             # nearest first per bin
+        b, r   = b[order], r[order]
+        first  = np.ones(len(b), dtype=bool)
+        first[1:] = b[1:] != b[:-1]
+        ranges = np.full(self.bins, np.inf, dtype=np.float32)
+        intens = np.zeros(self.bins, dtype=np.float32)
+        ranges[b[first]] = r[first]
+        intens[b[first]] = quality[keep][order][first]
+        return ranges, intens
+
+
+class LaserScanPublisher(threading.Thread):
+    """
+    Publishes every revolution of a shared ring as sensor_msgs/LaserScan
+    from its own rclpy node.  It is just another reader of the driver's ring.
+
+    Metrics
+    -------
+    published   scans sent
+    max_ms      worst binning + publish time
+    """
+
+    def __init__(self, ring: ShmScanRing, topic: str, frame_id: str, bins: int,
+                 range_min_m: float, range_max_m: float):
+        super().__init__(name="laserscan-publisher", daemon=True)
+        import rclpy                      # optional: only when publishing is on
+        from rclpy.qos import qos_profile_sensor_data
+        from rclpy.time import Time
+        from sensor_msgs.msg import LaserScan
+
+        self._rclpy, self._Time, self._Scan = rclpy, Time, LaserScan
+        if not rclpy.ok():
+            rclpy.init()
+        self.node   = rclpy.create_node("lidar_mux")
+        self._pub   = self.node.create_publisher(LaserScan, topic, qos_profile_sensor_data)
+        self.ring   = ring.reader()
+        self.binner = LaserScanBinner(bins, range_min_m, range_max_m)
+        self.frame_id  = frame_id
+        self.published = 0
+        self.max_ms    = 0.0
+        self._stop_evt = threading.Event()
+        self.start()
+
+    def run(self):
+        last_stamp = None
+        while not self._stop_evt.is_set():
+            item = self.ring.take_newest(timeout=0.5, quality=True)
+            if item is None:
+                if self.ring.closed:
+                    break
+                continue
+            _, stamp, angle_deg, dist_mm, quality = item
+            t0 = time.perf_counter()
+            period = stamp - last_stamp if last_stamp is not None else 0.0
+            last_stamp = stamp
+            try:
+                self._publish(stamp, period, angle_deg, dist_mm, quality)
+            except Exception as e:
+                print(f"\n[WARN] LaserScan publish failed: {e}")
+            self.max_ms = max(self.max_ms, 1e3 * (time.perf_counter() - t0))
+        self.ring.detach()
+        self.node.destroy_node()
+
+    def _publish(self, stamp, period, angle_deg, dist_mm, quality):
+        ranges, intens = self.binner.bin(angle_deg, dist_mm, quality)
+        b   = self.binner
+        msg = self._Scan()
+        msg.header.stamp    = self._Time(nanoseconds=int(stamp * 1e9)).to_msg()
+        msg.header.frame_id = self.frame_id
+        msg.angle_min       = -np.pi
+        msg.angle_max       = -np.pi + (b.bins - 1) * b.increment
+        msg.angle_increment = b.increment
+        msg.scan_time       = period
+        msg.time_increment  = period / b.bins
+        msg.range_min       = b.range_min
+        msg.range_max       = b.range_max
+        msg.ranges          = ranges.tolist()
+        msg.intensities     = intens.tolist()
+        self._pub.publish(msg)
+        self.published += 1
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_evt.set()
+        self.join(timeout)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  DRIVER
+# ═══════════════════════════════════════════════════════════════════
+
+PORT_NAME              = '/dev/ttyUSB0'
+BAUDRATE               = 256000
+MAX_RECONNECT_ATTEMPTS = 10
+RECONNECT_DELAY_S      = 3.0
+
+LASER_TOPIC = "/laser"      # pepper_nav2_params.yaml: scan_topic / costmap source
+LASER_FRAME = "laser"
+LASER_BINS  = 1440          # 0.25° — A2M12 ≈ 1600 samples a revolution at 10 Hz
+RANGE_MIN_M = 0.15          # self-filter, as SELF_FILTER_DIST in lidar_code_final.py
+RANGE_MAX_M = 12.0          # A2M12 rated range
+
+
+class LogSource(threading.Thread):
+    """Serves a scan log (scan_log.py) into the ring in real time, looping — a stand-in LiDAR."""
+
+    def __init__(self, path: str, ring: ShmScanRing, loop: bool):
+        super().__init__(name="log-source", daemon=True)
+        from scan_log import ScanLog
+        self.log        = ScanLog(path)
+        self.ring       = ring
+        self.loop       = loop
+        self.reconnects = 0
+        self.failed     = None
+        self._stop_evt  = threading.Event()
+
+    def run(self):
+        ts = self.log.timestamps
+        while not self._stop_evt.is_set() and len(self.log):
+            t_wall0 = time.monotonic()
+            for i in range(len(self.log)):
+                t, angle_deg, dist_mm, quality = self.log.scan(i)
+                delay = t_wall0 + (t - ts[0]) - time.monotonic()
+                if delay > 0 and self._stop_evt.wait(delay):
+                    break
+                self.ring.push_arrays(angle_deg, dist_mm, time.time(), quality)
+            if not self.loop:
+                break
+        self.ring.close()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_evt.set()
+        self.join(timeout)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--port", default=PORT_NAME)
+    ap.add_argument("--shm", default=SHM_NAME, help=f"shared ring name (default {SHM_NAME})")
+    ap.add_argument("--topic", default=LASER_TOPIC)
+    ap.add_argument("--frame", default=LASER_FRAME)
+    ap.add_argument("--no-ros", action="store_true", help="shared ring only, no LaserScan")
+    ap.add_argument("--record", metavar="LOG", help="also write a scan log for replay.py")
+    ap.add_argument("--replay", metavar="LOG", help="serve a scan log instead of the LiDAR")
+    ap.add_argument("--loop", action="store_true", help="with --replay: start over at the end")
+    args = ap.parse_args()
+    if args.record and os.path.exists(args.record):
+        ap.error(f"{args.record} exists — a recording is never overwritten")
+
+    ring = ShmScanRing.create(args.shm)
+    if args.replay:
+        source = LogSource(args.replay, ring, args.loop)
+    else:
+        from scan_log import ScanLogWriter
+        recorder = ScanLogWriter(args.record) if args.record else None
+        source   = LidarReader(args.port, BAUDRATE, ring, MAX_RECONNECT_ATTEMPTS,
+                               RECONNECT_DELAY_S, recorder=recorder)
+
+    publisher = None
+    if not args.no_ros:
+        try:
+            publisher = LaserScanPublisher(ring, args.topic, args.frame, LASER_BINS,
+                                           RANGE_MIN_M, RANGE_MAX_M)
+        except ImportError as e:
+            print(f"[WARN] No LaserScan publishing ({e}) — shared ring only.")
+
+    print("=" * 60)
+    print("  LiDAR multiplexer")
+    print("=" * 60)
+    print(f"  Scan source      : {args.replay or args.port}"
+          + (f"  (recording → {args.record})" if args.record and not args.replay else ""))
+    print(f"  Shared ring      : '{args.shm}', {ring.slots} slots, "
+          f"{ring._shm.size / 1e6:.1f} MB")
+    print("  LaserScan        : " + (f"{args.topic}  (frame {args.frame}, {LASER_BINS} bins)"
+                                       if publisher else "off"))
+    print("  Ctrl-C to stop.\n")
+
+    source.start()
+    try:
+        while source.is_alive():
+            source.join(HEARTBEAT_S)
+            ring.beat(source.reconnects, failed=source.failed is not None)
+            print(f"  scans {int(ring.header[_H_WRITTEN]):>7d}   reconnects {source.reconnects}"
+                  + (f"   published {publisher.published}" if publisher else ""), end="\r")
+    except KeyboardInterrupt:
+        print("\n\nCtrl-C — stopping…")
+    finally:
+        source.stop()
+        ring.close()
+        if publisher is not None:
+            publisher.stop()
+        served = int(ring.header[_H_WRITTEN])
+        ring.unlink()
+        ring.detach()
+        print(f"\n  {served} scans served.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+import threading
+import time
+
+import numpy as np
+from rplidar import RPLidar
+
+from scan_ingest import raw_arrays
+
+# ═══════════════════════════════════════════════════════════════════
+#  LIDAR READER THREAD + SCAN RING BUFFER
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The reader thread does nothing but drain the serial port, so the
+#  RPLidar driver's input buffer never backs up however long the mapper
+#  spends on a scan.  Each full revolution is copied into the next slot
+#  of a preallocated ring; the processing loop always takes the newest
+#  one and every scan it skipped is counted as a drop.  Dropping thus
+#  follows the actual processing speed instead of a fixed 1-in-N.
+#
+#  Serial errors are handled here as well: the reader reconnects on its
+#  own and the processing loop only sees a gap in the sequence numbers.
+
+
+class ScanRing:
+    """
+    Fixed-size ring of raw scans: slot i holds `counts[i]` samples in
+    `angle_deg[i]` / `dist_mm[i]`, received at `stamps[i]` (time.time()).
+    One writer, one reader.
+    """
+
+    def __init__(self, slots: int, max_points: int):
+        self.angle_deg = np.zeros((slots, max_points), dtype=np.float32)
+        self.dist_mm   = np.zeros((slots, max_points), dtype=np.float32)
+        self.counts    = np.zeros(slots, dtype=np.int32)
+        self.stamps    = np.zeros(slots, dtype=np.float64)
+        self.slots     = slots
+        self.written   = 0          # scans pushed (= sequence number of the newest)
+        self.taken     = 0
+        self.dropped   = 0          # scans never taken
+        self.truncated = 0          # scans longer than max_points
+        self._last     = 0          # sequence number last taken
+        self._closed   = False
+        self._cond     = threading.Condition()
+
+    def push(self, scan, stamp: float):
+        """Store one iter_scans() revolution of (quality, angle, dist)."""
+        arr = raw_arrays(scan)
+        self.push_arrays(arr[:, 1], arr[:, 2], stamp)
+
+    def push_arrays(self, angle_deg, dist_mm, stamp: float):
+        n = min(len(angle_deg), self.angle_deg.shape[1])
+        with self._cond:
+            slot = self.written % self.slots
+            self.angle_deg[slot, :n] = angle_deg[:n]
+            self.dist_mm[slot, :n]   = dist_mm[:n]
+            self.counts[slot]        = n
+            self.stamps[slot]        = stamp
+            self.truncated += n < len(angle_deg)
+            self.written   += 1
+            self._cond.notify()
+
+    def take_newest(self, timeout: float):
+        """
+        Wait up to `timeout` s for a scan newer than the last one taken.
+
+        Returns
+        -------
+        (seq, stamp, angle_deg, dist_mm) copies,  or None on timeout / close
+        """
+        with self._cond:
+            if not self._cond.wait_for(
+                    lambda: self.written > self._last or self._closed, timeout):
+                return None
+            if self.written <= self._last:
+                return None
+            seq  = self.written
+            slot = (seq - 1) % self.slots
+            n    = self.counts[slot]
+            ang  = self.angle_deg[slot, :n].copy()
+            dist = self.dist_mm[slot, :n].copy()
+            self.dropped += seq - self._last - 1
+            self.taken   += 1
+            self._last    = seq
+            stamp = float(self.stamps[slot])
+        return seq, stamp, ang, dist
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def drop_pct(self) -> float:
+        return 100.0 * self.dropped / max(self.written, 1)
+
+
+class LidarReader(threading.Thread):
+    """
+    Owns the RPLidar connection.  Reconnects on any driver error; gives
+    up after `max_reconnects` consecutive failures and sets `failed`.
+    With a `recorder` (scan_log.ScanLogWriter) every revolution is also
+    logged, timestamped on arrival, for replay.py.
+    """
+
+    def __init__(self, port: str, baudrate: int, ring: ScanRing,
+                 max_reconnects: int, reconnect_delay_s: float,
+                 recorder=None):
+        super().__init__(name="lidar-reader", daemon=True)
+        self.port              = port
+        self.baudrate          = baudrate
+        self.ring              = ring
+        self.max_reconnects    = max_reconnects
+        self.reconnect_delay_s = reconnect_delay_s
+        self.recorder          = recorder
+        self.reconnects        = 0
+        self.failed            = None   # last error once the reader gives up
+        self._lidar            = None
+        self._stop_evt         = threading.Event()
+
+    def run(self):
+        attempts = 0
+        while not self._stop_evt.is_set():
+            try:
+                print(f"[INFO] Connecting to LiDAR on {self.port}…")
+                self._lidar = RPLidar(self.port, baudrate=self.baudrate)
+                time.sleep(0.5)   # let the motor spin up
+                print("[INFO] LiDAR connected.\n")
+                for scan in self._lidar.iter_scans():
+                    t = time.time()
+                    self.ring.push(scan, t)
+                    if self.recorder is not None:
+                        self.recorder.write(t, scan)
+                    attempts = 0          # reset once data flows again
+                    if self._stop_evt.is_set():
+                        break
+            except Exception as e:
+                attempts += 1
+                print(f"\n[WARN] LiDAR error (attempt {attempts}/"
+                      f"{self.max_reconnects}): {e}")
+                if attempts >= self.max_reconnects:
+                    print("[ERROR] Too many reconnect failures — reader stopped.")
+                    self.failed = str(e)
+                    break
+                self.reconnects += 1
+                self._stop_evt.wait(self.reconnect_delay_s)
+            finally:
+                self._disconnect()
+        if self.recorder is not None:
+            self.recorder.close()
+        self.ring.close()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_evt.set()
+        self.join(timeout)
+
+    def _disconnect(self):
+        lidar, self._lidar = self._lidar, None
+        if lidar is None:
+            return
+        try:
+            lidar.stop()
+            lidar.disconnect()
+        except Exception:
+            pass
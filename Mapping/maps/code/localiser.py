@@ -0,0 +1,306 @@
+"""
+Localisation against a saved map — no mapping, no pose graph.
+
+Loads a map_server map written by world_building2_1.py, turns it into a
+likelihood field once and then tracks the LiDAR pose on that field scan
+by scan.  A far lighter job than AMCL on the Pi, and it finds the robot
+by itself at start-up or after it has been carried somewhere else.
+
+    python3 localiser.py ../floor10_3.yaml                        # live LiDAR
+    python3 localiser.py ../floor10_3.yaml --pose 1.0 -2.0 90     # known start
+    python3 localiser.py ../floor10_3.yaml --log run.scanlog      # recorded scans
+    python3 localiser.py ../floor10_3.yaml --topic /amcl_pose     # publish (ROS 2)
+
+Each scan starts from the last pose moved on by the constant-velocity
+prior.  A Gauss-Newton fit on the bilinear-interpolated field then
+refines the pose, with one constant-time lookup per point.  If the fit
+scores poorly, a small correlative search around the prediction
+recovers it.  After LOC_LOST_SCANS poor scans in a row the robot counts
+as lost, and a branch-and-bound search over the whole map and every
+heading relocalises it.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from correlative_matcher import CorrelativeMatcher, LikelihoodField, compose_xyt
+from lidar_reader import LidarReader, ScanRing
+from map_writer import read_map_files
+from motion_model import MotionPredictor, between_xyt
+from scan_config import (BAUDRATE, DIST_MAX_MM, DIST_MIN_MM, ICP_MIN_POINTS,
+                         MAP_FRAME, MAX_RECONNECT_ATTEMPTS, MOTION_MAX_GAP_S,
+                         PORT_NAME, RECONNECT_DELAY_S, SCAN_MAX_POINTS,
+                         SCAN_RING_SLOTS, downsample)
+from scan_ingest import ScanParser
+
+# ── Field ────────────────────────────────────────────────────────────
+LOC_SIGMA_M          = 0.10     # field falloff; wider than the mapper's for a wider basin
+LOC_DEPTH            = 7        # pyramid levels: top blocks 128 cells (6.4 m) for the global search
+LOC_MAX_POINTS       = 360
+
+# ── Tracking ─────────────────────────────────────────────────────────
+LOC_GN_ITERS         = 8
+LOC_MIN_SCORE        = 0.55     # mean field value of a trusted fit
+LOC_WINDOW_M         = 0.5      # local correlative search when the fit is poor …
+LOC_WINDOW_DEG       = 20.0
+LOC_BUDGET_MS        = 30.0     # … within this budget
+LOC_LOST_SCANS       = 10       # poor scans in a row before a global search
+
+# ── Global relocalisation ────────────────────────────────────────────
+LOC_GLOBAL_MIN_SCORE = 0.60
+LOC_GLOBAL_MIN_POINTS = 60      # a sparse scan fits too many places to search everywhere
+LOC_GLOBAL_BUDGET_MS = 5000.0
+
+
+class MapLikelihood:
+    """
+    A saved map as a likelihood-field pyramid in the map frame (the
+    mapper's world frame: the yaml origin is the lower-left cell).
+    """
+
+    def __init__(self, yaml_path: str, sigma: float = LOC_SIGMA_M, depth: int = LOC_DEPTH):
+        occ_p, meta = read_map_files(yaml_path)
+        self.res    = float(meta["resolution"])
+        self.origin = tuple(float(v) for v in meta["origin"][:2])
+        self.field  = LikelihoodField(occ_p > float(meta.get("occupied_thresh", 0.65)),
+                                      self.origin, self.res, sigma, depth)
+        h, w = occ_p.shape
+        self.centre = (self.origin[0] + 0.5 * w * self.res,
+                       self.origin[1] + 0.5 * h * self.res)
+        self.radius = 0.5 * np.hypot(w, h) * self.res
+
+    def refine(self, pts: np.ndarray, pose, iters: int = LOC_GN_ITERS):
+        """
+        Gauss-Newton on Σ (1 − f(T·p))² over the bilinear field f.
+
+        Returns
+        -------
+        ((x, y, theta), score, cov)  score = mean f at the result, cov the
+        3×3 covariance from the final normal equations (None if singular)
+        """
+        g      = self.field.levels[0]
+        h, w   = g.shape
+        res    = self.res
+        x, y, th = pose
+        px, py = pts[:, 0], pts[:, 1]
+        cov    = None
+        for it in range(iters + 1):
+            c, s = np.cos(th), np.sin(th)
+            u = (x + c * px - s * py - self.origin[0]) / res - 0.5
+            v = (y + s * px + c * py - self.origin[1]) / res - 0.5
+            j0, i0 = np.floor(u).astype(np.intp), np.floor(v).astype(np.intp)
+            ok = (j0 >= 0) & (j0 < w - 1) & (i0 >= 0) & (i0 < h - 1)
+            j0, i0 = np.where(ok, j0, 0), np.where(ok, i0, 0)
+            fu, fv = u - j0, v - i0
+            f00, f01 = g[i0, j0], g[i0, j0 + 1]
+            f10, f11 = g[i0 + 1, j0], g[i0 + 1, j0 + 1]
+            f = np.where(ok, (1 - fv) * ((1 - fu) * f00 + fu * f01)
+                         + fv * ((1 - fu) * f10 + fu * f11), 0.0)
+            score = float(f.mean())
+            gx = np.where(ok, (1 - fv) * (f01 - f00) + fv * (f11 - f10), 0.0) / res
+            gy = np.where(ok, (1 - fu) * (f10 - f00) + fu * (f11 - f01), 0.0) / res
+            J  = -np.column_stack([gx, gy, gx * (-s * px - c * py) + gy * (c * px - s * py)])
+            r  = 1.0 - f
+            H  = J.T @ J
+            try:
+                step = np.linalg.solve(H + 1e-9 * np.eye(3), -J.T @ r)
+                cov  = np.linalg.inv(H) * (r @ r) / max(len(r) - 3, 1)
+            except np.linalg.LinAlgError:
+                cov = None
+                break
+            if it == iters or np.hypot(step[0], step[1]) < 1e-4 and abs(step[2]) < 1e-4:
+                break
+            x, y, th = x + step[0], y + step[1], th + step[2]
+        return (x, y, float(np.arctan2(np.sin(th), np.cos(th)))), score, cov
+
+
+class ScanLocaliser:
+    """
+    Pose tracking on a MapLikelihood.  track() takes sensor-frame points
+    (the mapper's parser output) and returns the pose, or None while lost.
+
+    Metrics
+    -------
+    recoveries / relocalisations   local / global searches that succeeded
+    lost_scans                     scans with no trusted pose
+    skipped                        scans too sparse to match
+    """
+
+    def __init__(self, lmap: MapLikelihood, pose=None):
+        self.map       = lmap
+        self.pose      = pose             # None → global search on the first scan
+        self.score     = 0.0
+        self.cov       = None
+        self.motion    = MotionPredictor(MOTION_MAX_GAP_S)
+        self.local     = CorrelativeMatcher(LOC_BUDGET_MS, LOC_MIN_SCORE)
+        self.globl     = CorrelativeMatcher(LOC_GLOBAL_BUDGET_MS, LOC_GLOBAL_MIN_SCORE)
+        self.recoveries      = 0
+        self.relocalisations = 0
+        self.lost_scans      = 0
+        self.skipped         = 0
+        self._poor     = 0
+
+    def track(self, pts: np.ndarray, stamp: float | None = None):
+        scan = downsample(pts, LOC_MAX_POINTS)
+        if self.pose is None:
+            if len(scan) < LOC_GLOBAL_MIN_POINTS:
+                self.skipped += 1
+                return None
+            return self._relocalise(scan, stamp)
+        if len(scan) < ICP_MIN_POINTS:
+            self.skipped += 1
+            return None
+
+        pred = compose_xyt(self.pose, self.motion.predict(stamp))
+        pose, score, cov = self.map.refine(scan, pred)
+        if score < LOC_MIN_SCORE:
+            seed, _ = self.local.match(self.map.field, scan, pred, LOC_WINDOW_M,
+                                       np.radians(LOC_WINDOW_DEG))
+            if seed is not None:
+                pose, score, cov = self.map.refine(scan, seed)
+                self.recoveries += score >= LOC_MIN_SCORE
+
+        if score < LOC_MIN_SCORE:
+            # coast on the prediction; untrusted, so not reported
+            self._poor += 1
+            self.lost_scans += 1
+            self.motion.update(stamp, between_xyt(self.pose, pred), True)
+            self.pose = pred
+            if self._poor >= LOC_LOST_SCANS:
+                self.pose = None          # kidnapped: search everywhere next scan
+            return None
+
+        self._poor = 0
+        self.motion.update(stamp, between_xyt(self.pose, pose), True)
+        self.pose, self.score, self.cov = pose, score, cov
+        return pose
+
+    def _relocalise(self, scan, stamp):
+        """Branch and bound over the whole map, every heading."""
+        seed, score = self.globl.match(self.map.field, scan, (*self.map.centre, 0.0),
+                                       self.map.radius, np.pi)
+        if seed is not None:
+            pose, score, cov = self.map.refine(scan, seed)
+            if score >= LOC_MIN_SCORE:
+                self.relocalisations += 1
+                self._poor = 0
+                self.motion.update(stamp, (0.0, 0.0, 0.0), False)
+                self.pose, self.score, self.cov = pose, score, cov
+                print(f"\n[INFO] Localised at x={pose[0]:+.2f} y={pose[1]:+.2f} "
+                      f"th={np.degrees(pose[2]):+.1f}d  (score {score:.2f}, "
+                      f"{self.globl.last_ms:.0f} ms)")
+                return pose
+        self.lost_scans += 1
+        return None
+
+
+class PosePublisher:
+    """geometry_msgs/PoseWithCovarianceStamped on `topic` (ROS 2, optional)."""
+
+    def __init__(self, topic: str, frame_id: str):
+        import rclpy                      # optional: only with --topic
+        from geometry_msgs.msg import PoseWithCovarianceStamped
+        if not rclpy.ok():
+            rclpy.init()
+        self._Msg     = PoseWithCovarianceStamped
+        self.node     = rclpy.create_node("scan_localiser")
+        self.pub      = self.node.create_publisher(PoseWithCovarianceStamped, topic, 10)
+        self.frame_id = frame_id
+
+    def publish(self, pose, cov):
+        msg = self._Msg()
+        msg.header.stamp    = self.node.get_clock().now().to_msg()
+        msg.header.frame_id = self.frame_id
+        p = msg.pose.pose
+        p.position.x, p.position.y = float(pose[0]), float(pose[1])
+        p.orientation.z = float(np.sin(pose[2] / 2))
+        p.orientation.w = float(np.cos(pose[2] / 2))
+        if cov is not None:
+            c6 = np.zeros((6, 6))
+            c6[np.ix_([0, 1, 5], [0, 1, 5])] = cov
+            msg.pose.covariance = c6.ravel().tolist()
+        self.pub.publish(msg)
+
+    def close(self):
+        self.node.destroy_node()
+
+
+def run(loc: ScanLocaliser, source, parser: ScanParser, publisher=None):
+    """Localise the newest scan of `source.ring` until it stops or Ctrl-C."""
+    ring, n, ms = source.ring, 0, []
+    try:
+        while True:
+            item = ring.take_newest(timeout=1.0)
+            if item is None:
+                if source.failed is not None or not source.is_alive():
+                    break
+                continue
+            _, stamp, angle_deg, dist_mm = item
+            t0   = time.perf_counter()
+            pts  = parser.points(angle_deg, dist_mm)
+            pose = loc.track(pts, stamp) if len(pts) >= ICP_MIN_POINTS else None
+            ms.append(1e3 * (time.perf_counter() - t0))
+            n += 1
+            if pose is None:
+                print(f"scan={n:6d}  LOST  ({loc.lost_scans} scans)", " " * 40, end="\r")
+                continue
+            if publisher is not None:
+                publisher.publish(pose, loc.cov)
+            print(f"scan={n:6d}  drop={ring.drop_pct:3.0f}%  "
+                  f"x={pose[0]:+.2f}m  y={pose[1]:+.2f}m  "
+                  f"th={np.degrees(pose[2]):+5.1f}d  score={loc.score:.2f}  "
+                  f"{ms[-1]:5.1f} ms", end="\r")
+    except KeyboardInterrupt:
+        print("\n\nCtrl-C — stopping.")
+
+    ms = np.asarray(ms) if ms else np.zeros(1)
+    print(f"\n  Scans localised  :   {n - loc.lost_scans}/{n}  "
+          f"({loc.recoveries} local recoveries, {loc.relocalisations} global)")
+    print(f"  Time per scan    :   p50 {np.percentile(ms, 50):.1f} ms  "
+          f"p95 {np.percentile(ms, 95):.1f} ms  max {ms.max():.0f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("map", help="map yaml written by world_building2_1.py")
+    ap.add_argument("--pose", nargs=3, type=float, metavar=("X", "Y", "DEG"),
+                    help="start pose in the map frame (default: global search)")
+    ap.add_argument("--log", help="scan log to localise instead of the LiDAR")
+    ap.add_argument("--speed", type=float, default=1.0, help="with --log: replay speed")
+    ap.add_argument("--topic", help="publish PoseWithCovarianceStamped here (ROS 2)")
+    ap.add_argument("--frame", default=MAP_FRAME)
+    args = ap.parse_args()
+
+    t0   = time.perf_counter()
+    lmap = MapLikelihood(args.map)
+    h, w = lmap.field.levels[0].shape
+    print(f"  Map              : {args.map}  ({w} x {h} px, field built in "
+          f"{1e3 * (time.perf_counter() - t0):.0f} ms)")
+    pose = None if args.pose is None else (args.pose[0], args.pose[1],
+                                           np.radians(args.pose[2]))
+    loc       = ScanLocaliser(lmap, pose)
+    parser    = ScanParser(DIST_MIN_MM, DIST_MAX_MM, ccw=True)
+    publisher = None
+    if args.topic:
+        try:
+            publisher = PosePublisher(args.topic, args.frame)
+        except Exception as e:
+            print(f"\n[WARN] No ROS 2 pose publishing ({e}).")
+
+    ring = ScanRing(SCAN_RING_SLOTS, SCAN_MAX_POINTS)
+    if args.log:
+        from scan_log import LogPlayer, ScanLog
+        source = LogPlayer(ScanLog(args.log), ring, args.speed)
+    else:
+        source = LidarReader(PORT_NAME, BAUDRATE, ring,
+                             MAX_RECONNECT_ATTEMPTS, RECONNECT_DELAY_S)
+    source.start()
+    run(loc, source, parser, publisher)
+    source.stop()
+    if publisher is not None:
+        publisher.close()
+
+
+if __name__ == "__main__":
+    main()
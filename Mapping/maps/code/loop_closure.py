@@ -0,0 +1,195 @@
+import multiprocessing as mp
+import queue
+import signal
+import time
+from collections import deque
+
+from nn_search import build_nn_index
+from place_recognition import ScanContextIndex
+
+# ═══════════════════════════════════════════════════════════════════
+#  ASYNCHRONOUS LOOP-CLOSURE WORKER
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The scan loop hands every new keyframe to a worker process and carries
+#  on.  The worker owns the scan-context index and the keyframe NN
+#  indices, and for each keyframe it:
+#
+#      1. queries the index for the best top_k older keyframes
+#      2. verifies each candidate with `verify_fn` (correlative search
+#         around the descriptor yaw, then ICP — see verify_loop_closure)
+#      3. adds the keyframe to the index
+#      4. posts one result (match or not) back to the scan loop
+#
+#  The scan loop drains the results with poll(), which never blocks, and
+#  turns matches into BetweenFactorPose2 constraints.  A process rather
+#  than a thread: ICP on a few hundred points is mostly interpreter time
+#  and would compete with the scan loop for the GIL.
+#
+#  With submaps (submaps.py) keyframes are only searched (index=False)
+#  and finished submaps are only indexed (search=False), so every
+#  candidate is a dense multi-scan target.
+#
+#  Every submitted keyframe produces exactly one result, so
+#  submitted − completed is the worker backlog.
+
+
+class LoopClosure:
+    """A verified match: `rel` takes keyframe `kf_id`'s frame to `cur_id`'s."""
+    __slots__ = ('kf_id', 'cur_id', 'rel', 'fitness')
+
+    def __init__(self, kf_id, cur_id, rel, fitness):
+        self.kf_id   = kf_id
+        self.cur_id  = cur_id
+        self.rel     = rel           # (dx, dy, dtheta)
+        self.fitness = fitness
+
+
+def _worker_main(in_q, out_q, verify_fn, capacity, top_k, skip_recent,
+                 match_thresh, nn_backend, nn_cell):
+    """Worker-process loop; exits on a None message."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)     # main decides shutdown
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, signal.SIG_IGN)  # stage-timer dump is main's
+    index = ScanContextIndex(capacity)
+
+    while True:
+        msg = in_q.get()
+        if msg is None:
+            return
+        pose_id, pts, target, min_pose_id, frozen_below, search, add, t_submit = msg
+        t0   = time.monotonic()
+        best = None
+        try:
+            if search:
+                best_fit = match_thresh
+                for (kf_pts, kf_index, kf_target), kf_id, yaw in index.query(
+                        pts, top_k, skip_recent, min_pose_id, frozen_below):
+                    match = verify_fn(pts, kf_pts, kf_index, yaw, kf_target)
+                    if match is not None and match[1] > best_fit:
+                        rel, best_fit = match
+                        best = (kf_id, rel, best_fit)
+            if add:
+                index.add(pose_id, pts,
+                          item=(pts, build_nn_index(pts, nn_backend, nn_cell), target))
+        except Exception as e:
+            print(f"\n[WARN] Loop-closure worker: {e}")
+        out_q.put((pose_id, t_submit, 1e3 * (time.monotonic() - t0), best))
+
+
+class LoopClosureWorker:
+    """
+    Scan-side handle of the worker process.  submit() and poll() are the
+    only calls made from the scan loop and neither waits on the worker.
+
+    Metrics
+    -------
+    backlog          keyframes submitted but not yet answered
+    searched         keyframes queued for a search
+    skipped          keyframes indexed without a search (backlog full)
+    indexed_only     keyframes submitted with search=False
+    latency_ms       recent submit → result times, as seen by poll()
+    max_latency_ms   worst submit → result time
+    search_ms        recent worker compute times per keyframe
+    """
+
+    def __init__(self, verify_fn, capacity: int, top_k: int, skip_recent: int,
+                 match_thresh: float, max_backlog: int,
+                 nn_backend: str, nn_cell: float):
+        self.max_backlog    = max_backlog
+        self.submitted      = 0
+        self.completed      = 0
+        self.searched       = 0
+        self.skipped        = 0
+        self.indexed_only   = 0
+        self.found          = 0
+        self.latency_ms     = deque(maxlen=100)
+        self.search_ms      = deque(maxlen=100)
+        self.max_latency_ms = 0.0
+        self._warned_dead   = False
+        self._ready         = []        # drained but not yet handed out
+
+        self._in_q  = mp.Queue()
+        self._out_q = mp.Queue()
+        self._proc  = mp.Process(
+            target=_worker_main, name="loop-closure", daemon=True,
+            args=(self._in_q, self._out_q, verify_fn, capacity, top_k,
+                  skip_recent, match_thresh, nn_backend, nn_cell))
+        self._proc.start()
+
+    @property
+    def backlog(self) -> int:
+        return self.submitted - self.completed
+
+    def submit(self, pose_id: int, pts, min_pose_id: int = 0,
+               frozen_below: int = 0, search: bool = True, index: bool = True,
+               target=None):
+        """
+        Queue a keyframe.  While the backlog is full it is still added to
+        the index but not searched, so the worker catches up instead of
+        falling further behind.  search=False only indexes it (keyframes
+        reloaded from a saved session, finished submaps); index=False only
+        searches it.  `target` is stored with an indexed entry and passed
+        to verify_fn when it is a candidate (a submap's wall cells).
+        """
+        if not self._proc.is_alive():
+            if not self._warned_dead:
+                print("\n[WARN] Loop-closure worker exited — loop closure disabled")
+                self._warned_dead = True
+            return
+        if not search:
+            self.indexed_only += 1
+        elif self.backlog >= self.max_backlog:
+            search = False
+            self.skipped += 1
+        else:
+            self.searched += 1
+        self._in_q.put((pose_id, pts, target, min_pose_id, frozen_below, search,
+                        index, time.monotonic()))
+        self.submitted += 1
+
+    def poll(self) -> list[LoopClosure]:
+        """Every result that has arrived since the last call."""
+        while self._drain(block=False):
+            pass
+        found, self._ready = self._ready, []
+        return found
+
+    def wait(self, timeout: float):
+        """
+        Block until every submitted keyframe has been answered (replay
+        --sync only).  Results stay queued for the next poll().
+        """
+        deadline = time.monotonic() + timeout
+        while self.backlog and self._proc.is_alive():
+            if not self._drain(block=True, timeout=deadline - time.monotonic()):
+                return
+
+    def _drain(self, block: bool, timeout: float = 0.0) -> bool:
+        try:
+            msg = self._out_q.get(block, max(timeout, 0.0) if block else None)
+        except queue.Empty:
+            return False
+        pose_id, t_submit, search_ms, best = msg
+        lat = 1e3 * (time.monotonic() - t_submit)
+        self.completed += 1
+        self.latency_ms.append(lat)
+        self.search_ms.append(search_ms)
+        self.max_latency_ms = max(self.max_latency_ms, lat)
+        if best is not None:
+            kf_id, rel, fit = best
+            self._ready.append(LoopClosure(kf_id, pose_id, rel, fit))
+            self.found += 1
+        return True
+
+    def mean_latency_ms(self) -> float:
+        return sum(self.latency_ms) / len(self.latency_ms) if self.latency_ms else 0.0
+
+    def close(self, timeout: float = 2.0):
+        if self._proc.is_alive():
+            self._in_q.put(None)
+            self._proc.join(timeout)
+            if self._proc.is_alive():
+                self._proc.terminate()
+        self._in_q.cancel_join_thread()
+        self._out_q.cancel_join_thread()
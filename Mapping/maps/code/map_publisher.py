@@ -0,0 +1,211 @@
+import array
+import threading
+import time
+
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  LIVE MAP PUBLISHING  (ROS 2 OccupancyGrid + OccupancyGridUpdate)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  RViz and Nav2 can follow the map while it is being built.  A full
+#  nav_msgs/OccupancyGrid goes out on /map when the explored area
+#  outgrows the last one, and every few seconds for subscribers that
+#  join late.  Between full grids only the cells that changed are sent,
+#  as one map_msgs/OccupancyGridUpdate patch over their bounding box on
+#  /map_updates.
+#
+#  Changed cells are cheap to find because stored tiles are never
+#  written in place (TiledLogOddsMap): a tile whose object is not the
+#  one published last time has changed.  Those tiles are compared in
+#  published values (-1 unknown, 0 free, 100 occupied, same thresholds
+#  as the PGM), so log-odds changes that do not flip a cell cost no
+#  bandwidth.  All of this runs on the publisher's thread over a map
+#  snapshot; the scan loop only takes the snapshot.
+
+UNKNOWN, FREE, OCCUPIED = -1, 0, 100
+
+
+class GridPatcher:
+    """
+    Turns successive map snapshots into full grids and patches, without
+    any ROS dependency.
+
+    Parameters
+    ----------
+    tile                   : tile size of the TiledLogOddsMap, cells
+    occ_thresh/free_thresh : log-odds thresholds, as for the PGM
+    pad_tiles              : margin around the explored tiles in a full
+                             grid, so growth does not force a new one at
+                             every step
+    """
+
+    def __init__(self, tile: int, occ_thresh: int, free_thresh: int, pad_tiles: int):
+        self.tile = tile
+        self.pad  = pad_tiles
+        v = np.arange(256, dtype=np.uint8).view(np.int8)     # int8 value of each byte
+        self.lut = np.full(256, UNKNOWN, dtype=np.int8)
+        self.lut[v <= free_thresh] = FREE
+        self.lut[v >= occ_thresh]  = OCCUPIED
+        self.extent = None                # (tx0, ty0, tx1, ty1) of the last full grid
+        self._sent  = {}                  # tile key → tile object last published
+
+    def values(self, cells: np.ndarray) -> np.ndarray:
+        return self.lut[cells.view(np.uint8)]
+
+    def full(self, snap):
+        """
+        (cx0, cy0, grid) over the explored tiles plus padding, grid rows
+        = +y, and remember everything in it as published.
+        """
+        t = self.tile
+        txs = [k[0] for k in snap.tiles] or [0]
+        tys = [k[1] for k in snap.tiles] or [0]
+        tx0, ty0 = min(txs) - self.pad, min(tys) - self.pad
+        tx1, ty1 = max(txs) + self.pad, max(tys) + self.pad
+        self.extent = (tx0, ty0, tx1, ty1)
+        self._sent  = dict(snap.tiles)
+        grid = snap.window(tx0 * t, ty0 * t, (tx1 - tx0 + 1) * t, (ty1 - ty0 + 1) * t)
+        return tx0 * t, ty0 * t, self.values(grid)
+
+    def needs_full(self, snap) -> bool:
+        """True before the first grid or once a tile lies outside it."""
+        if self.extent is None:
+            return True
+        tx0, ty0, tx1, ty1 = self.extent
+        return any(not (tx0 <= tx <= tx1 and ty0 <= ty <= ty1) for tx, ty in snap.tiles)
+
+    def patch(self, snap):
+        """
+        (x, y, patch) — offset in cells from the full grid's origin and
+        the changed bounding box's values — or None if nothing changed.
+        """
+        t = self.tile
+        changed = [k for k, tile in snap.tiles.items() if self._sent.get(k) is not tile]
+        changed += [k for k in self._sent if k not in snap.tiles]     # tiles dropped
+        x0 = y0 = np.inf
+        x1 = y1 = -np.inf
+        for key in changed:
+            new, old = snap.tiles.get(key), self._sent.get(key)
+            new = self.values(new) if new is not None else np.full((t, t), UNKNOWN, np.int8)
+            old = self.values(old) if old is not None else np.full((t, t), UNKNOWN, np.int8)
+            rows = np.flatnonzero((new != old).any(axis=1))
+            if len(rows) == 0:
+                continue
+            cols = np.flatnonzero((new != old).any(axis=0))
+            x0, x1 = min(x0, key[0] * t + cols[0]), max(x1, key[0] * t + cols[-1])
+            y0, y1 = min(y0, key[1] * t + rows[0]), max(y1, key[1] * t + rows[-1])
+        self._sent = dict(snap.tiles)
+        if x1 < x0:
+            return None
+        x0, y0, x1, y1 = int(x0), int(y0), int(x1), int(y1)
+        vals = self.values(snap.window(x0, y0, x1 - x0 + 1, y1 - y0 + 1))
+        return x0 - self.extent[0] * t, y0 - self.extent[1] * t, vals
+
+
+class RosMapPublisher(threading.Thread):
+    """
+    Publishes map snapshots on `topic` and `topic`_updates from its own
+    rclpy node.  submit() keeps only the newest snapshot, like MapWriter.
+
+    Metrics
+    -------
+    fulls / patches          messages sent
+    full_bytes / patch_bytes cell payload sent
+    max_ms                   worst conversion + publish time
+    """
+
+    def __init__(self, resolution: float, tile: int, occ_thresh: int,
+                 free_thresh: int, full_every_s: float, pad_tiles: int = 2,
+                 frame_id: str = "map", topic: str = "map"):
+        super().__init__(name="map-publisher", daemon=True)
+        import rclpy                      # optional: only when publishing is on
+        from rclpy.qos import DurabilityPolicy, QoSProfile
+        from map_msgs.msg import OccupancyGridUpdate
+        from nav_msgs.msg import OccupancyGrid
+
+        self._rclpy = rclpy
+        self._Grid, self._Update = OccupancyGrid, OccupancyGridUpdate
+        if not rclpy.ok():
+            rclpy.init()
+        self.node = rclpy.create_node("slam_map_publisher")
+        latched   = QoSProfile(depth=1, durability=DurabilityPolicy.TRANSIENT_LOCAL)
+        self._pub_full  = self.node.create_publisher(OccupancyGrid, topic, latched)
+        self._pub_patch = self.node.create_publisher(OccupancyGridUpdate,
+                                                     f"{topic}_updates", 10)
+
+        self.patcher      = GridPatcher(tile, occ_thresh, free_thresh, pad_tiles)
+        self.resolution   = resolution
+        self.frame_id     = frame_id
+        self.full_every_s = full_every_s
+        self.fulls        = 0
+        self.patches      = 0
+        self.full_bytes   = 0
+        self.patch_bytes  = 0
+        self.max_ms       = 0.0
+        self._last_full   = 0.0
+        self._job         = None
+        self._closed      = False
+        self._cond        = threading.Condition()
+        self.start()
+
+    def submit(self, snap):
+        with self._cond:
+            if not self._closed:
+                self._job = snap
+                self._cond.notify_all()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or self._closed)
+                if self._job is None:
+                    break
+                snap, self._job = self._job, None
+            t0 = time.perf_counter()
+            try:
+                self._publish(snap)
+            except Exception as e:
+                print(f"\n[WARN] Map publish failed: {e}")
+            self.max_ms = max(self.max_ms, 1e3 * (time.perf_counter() - t0))
+        self.node.destroy_node()
+
+    def _publish(self, snap):
+        now = time.monotonic()
+        stamp = self.node.get_clock().now().to_msg()
+        if self.patcher.needs_full(snap) or now - self._last_full > self.full_every_s:
+            cx0, cy0, grid = self.patcher.full(snap)
+            msg = self._Grid()
+            msg.header.stamp, msg.header.frame_id = stamp, self.frame_id
+            msg.info.map_load_time = stamp
+            msg.info.resolution    = self.resolution
+            msg.info.height, msg.info.width = grid.shape
+            msg.info.origin.position.x    = cx0 * self.resolution
+            msg.info.origin.position.y    = cy0 * self.resolution
+            msg.info.origin.orientation.w = 1.0
+            msg.data = array.array('b', grid.tobytes())
+            self._pub_full.publish(msg)
+            self._last_full  = now
+            self.fulls      += 1
+            self.full_bytes += grid.size
+            return
+
+        patch = self.patcher.patch(snap)
+        if patch is None:
+            return
+        x, y, vals = patch
+        msg = self._Update()
+        msg.header.stamp, msg.header.frame_id = stamp, self.frame_id
+        msg.x, msg.y = x, y
+        msg.height, msg.width = vals.shape
+        msg.data = array.array('b', vals.tobytes())
+        self._pub_patch.publish(msg)
+        self.patches     += 1
+        self.patch_bytes += vals.size
+
+    def close(self, timeout: float = 5.0):
+        """Publish the queued snapshot, then stop."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join(timeout)
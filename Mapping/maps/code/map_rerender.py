@@ -0,0 +1,154 @@
+import threading
+import time
+
+import numpy as np
+
+from occupancy_grid import TiledLogOddsMap
+
+# ═══════════════════════════════════════════════════════════════════
+#  RE-RENDERING TILES FROM OPTIMISED KEYFRAME POSES
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The live map paints every scan once, with the pose known at the time.
+#  When a loop closure (or a late optimisation) moves keyframes away from
+#  the pose their scan was painted with, the tiles under those scans hold
+#  walls in the wrong place.  The re-renderer takes the keyframes that
+#  moved, collects the tiles their scans cover at the old and the new
+#  pose, and repaints just those tiles from scratch with every retained
+#  keyframe that reaches them, each at its current pose.  The scan loop
+#  swaps the new tiles in when it next polls.
+#
+#  Two kinds of content are not reproduced and are accepted losses.
+#  The first is the intermediate scans between keyframes: the repainted
+#  tiles are built from keyframes only.  The second is any scan painted
+#  into a dirty tile while the job ran.  Both are repainted by the next
+#  scans through that area.  Tiles allocated before the oldest retained
+#  keyframe are left alone, since their content cannot be rebuilt.
+
+
+def _pose_moved(a, b, move_m: float, move_rad: float) -> bool:
+    dth = np.arctan2(np.sin(a[2] - b[2]), np.cos(a[2] - b[2]))
+    return np.hypot(a[0] - b[0], a[1] - b[1]) > move_m or abs(dth) > move_rad
+
+
+class RerenderResult:
+    __slots__ = ('tiles', 'moved', 'keyframes', 'ms')
+
+    def __init__(self, tiles, moved, keyframes, ms):
+        self.tiles     = tiles       # key → int8 tile, or None = now empty
+        self.moved     = moved       # [(pose_id, (x, y, theta))] now painted there
+        self.keyframes = keyframes   # keyframes repainted
+        self.ms        = ms
+
+
+class KeyframeRerenderer(threading.Thread):
+    """
+    Background repaint of tiles under moved keyframes.  One job at a
+    time; submit() while busy is refused.
+
+    Parameters
+    ----------
+    tile, rule  : geometry and log-odds rule of the live TiledLogOddsMap
+    scan_cells  : (pose_xyt, pts) → (fx, fy, hx, hy) global cell arrays,
+                  the same function the live map update uses
+    """
+
+    def __init__(self, tile: int, rule, scan_cells, move_m: float, move_deg: float):
+        super().__init__(name="map-rerender", daemon=True)
+        self.tile       = tile
+        self.rule       = rule
+        self.scan_cells = scan_cells
+        self.move_m     = move_m
+        self.move_rad   = np.radians(move_deg)
+        self.jobs       = 0
+        self.tiles_done = 0
+        self.max_ms     = 0.0
+        self._job       = None
+        self._result    = None
+        self._closed    = False
+        self._cond      = threading.Condition()
+        self.start()
+
+    @property
+    def busy(self) -> bool:
+        return self._job is not None or self._result is not None
+
+    def submit(self, keyframes, born: dict, min_born: int) -> bool:
+        """
+        Queue a repaint if any keyframe moved.
+
+        keyframes : [(pose_id, painted_xyt, current_xyt, pts)] oldest first
+        born      : copy of the live map's tile → allocating stamp
+        min_born  : tiles born before this stamp are never repainted
+
+        Returns
+        -------
+        True if a job was queued
+        """
+        moved = [k for k in keyframes
+                 if _pose_moved(k[1], k[2], self.move_m, self.move_rad)]
+        with self._cond:
+            if not moved or self.busy or self._closed:
+                return False
+            self._job = (keyframes, moved, born, min_born)
+            self._cond.notify_all()
+        return True
+
+    def poll(self):
+        """The finished job's RerenderResult, or None."""
+        with self._cond:
+            res, self._result = self._result, None
+            self._cond.notify_all()
+        return res
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the running job (if any) has a result to poll."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._job is None, timeout)
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or self._closed)
+                if self._job is None:
+                    return
+                job = self._job
+            try:
+                res = self._render(*job)
+            except Exception as e:
+                print(f"\n[WARN] Map re-render failed: {e}")
+                res = None
+            with self._cond:
+                self._job, self._result = None, res
+                self._cond.notify_all()
+
+    def _render(self, keyframes, moved, born, min_born) -> RerenderResult:
+        t0 = time.perf_counter()
+        keys = TiledLogOddsMap(self.tile, self.rule).tile_keys
+
+        dirty = set()
+        for _, painted, pose, pts in moved:
+            for xyt in (painted, pose):
+                fx, fy, hx, hy = self.scan_cells(xyt, pts)
+                dirty |= keys(np.concatenate([fx, hx]), np.concatenate([fy, hy]))
+        dirty = {k for k in dirty if born.get(k, min_born) >= min_born}
+
+        scratch, painted_n = TiledLogOddsMap(self.tile, self.rule), 0
+        for _, _, pose, pts in keyframes:
+            fx, fy, hx, hy = self.scan_cells(pose, pts)
+            if keys(np.concatenate([fx, hx]), np.concatenate([fy, hy])) & dirty:
+                scratch.update(fx, fy, hx, hy)
+                painted_n += 1
+
+        tiles = {k: scratch.tiles.get(k) for k in dirty}
+        ms = 1e3 * (time.perf_counter() - t0)
+        self.jobs       += 1
+        self.tiles_done += len(tiles)
+        self.max_ms      = max(self.max_ms, ms)
+        return RerenderResult(tiles, [(k[0], k[2]) for k in moved], painted_n, ms)
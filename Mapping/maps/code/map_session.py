@@ -0,0 +1,112 @@
+import io
+
+import numpy as np
+
+from map_writer import write_atomic
+
+# ═══════════════════════════════════════════════════════════════════
+#  RESUMABLE MAPPING SESSIONS
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Next to the PGM, the mapper saves what it needs to carry on mapping
+#  later: the log-odds tiles (not the thresholded image), the keyframe
+#  scans with the poses they were painted at, and the pose estimates
+#  the graph held at the end.  A compressed .npz of fixed-type arrays —
+#  mostly-empty int8 tiles shrink to a fraction of their size and no
+#  pickling is involved.
+#
+#  A resumed session treats all of this as fixed: the map is only ever
+#  added to, and the previous session's keyframes serve as loop-closure
+#  anchors for the new poses.
+
+SESSION_VERSION = 1
+
+
+class Session:
+    """
+    A loaded session.
+
+    tiles / born   : TiledLogOddsMap.tiles / .born
+    keyframes      : [(pose_id, (x, y, theta) painted, odom_dist, (N, 2) pts)]
+    estimates      : {pose_id: (x, y, theta)} held by the graph at save time
+    pose_id        : newest pose id of the session
+    odom_dist      : metres driven in the session
+    """
+    __slots__ = ('resolution', 'tile', 'tiles', 'born', 'keyframes',
+                 'estimates', 'pose_id', 'odom_dist')
+
+    @property
+    def last_pose(self):
+        """Final pose estimate, or the newest keyframe's if it was not kept."""
+        if self.pose_id in self.estimates:
+            return self.estimates[self.pose_id]
+        return self.keyframes[-1][1] if self.keyframes else (0.0, 0.0, 0.0)
+
+
+def save_session(path: str, resolution: float, occupancy, keyframes,
+                 estimates: dict, pose_id: int, odom_dist: float):
+    """
+    Atomically write a session.  `keyframes` and `estimates` are in the
+    form Session holds them.
+    """
+    keys = list(occupancy.tiles)
+    t    = occupancy.tile
+    kf_pts = [np.asarray(k[3], dtype=np.float32).reshape(-1, 2) for k in keyframes]
+    est_ids = sorted(estimates)
+
+    buf = io.BytesIO()
+    np.savez_compressed(
+        buf,
+        version    = np.int32(SESSION_VERSION),
+        resolution = np.float64(resolution),
+        tile       = np.int32(t),
+        pose_id    = np.int64(pose_id),
+        odom_dist  = np.float64(odom_dist),
+        tile_keys  = np.array(keys, dtype=np.int32).reshape(-1, 2),
+        tiles      = (np.stack([occupancy.tiles[k] for k in keys]) if keys
+                      else np.zeros((0, t, t), dtype=np.int8)),
+        tile_born  = np.array([occupancy.born.get(k, 0) for k in keys], dtype=np.int64),
+        kf_ids     = np.array([k[0] for k in keyframes], dtype=np.int64),
+        kf_poses   = np.array([k[1] for k in keyframes], dtype=np.float64).reshape(-1, 3),
+        kf_odom    = np.array([k[2] for k in keyframes], dtype=np.float64),
+        kf_counts  = np.array([len(p) for p in kf_pts], dtype=np.int32),
+        kf_pts     = (np.concatenate(kf_pts) if kf_pts
+                      else np.zeros((0, 2), dtype=np.float32)),
+        est_ids    = np.array(est_ids, dtype=np.int64),
+        est_poses  = np.array([estimates[k] for k in est_ids],
+                              dtype=np.float64).reshape(-1, 3),
+    )
+    write_atomic(path, buf.getvalue())
+
+
+def load_session(path: str, resolution: float, tile: int) -> Session:
+    """
+    Read a session saved with the same map resolution and tile size.
+
+    Raises
+    ------
+    ValueError if the file is from another format version or map geometry
+    """
+    with np.load(path, allow_pickle=False) as z:
+        if int(z["version"]) != SESSION_VERSION:
+            raise ValueError(f"{path}: session version {int(z['version'])}, "
+                             f"expected {SESSION_VERSION}")
+        if not np.isclose(z["resolution"], resolution) or int(z["tile"]) != tile:
+            raise ValueError(f"{path}: mapped at {float(z['resolution'])} m / "
+                             f"{int(z['tile'])} px tiles, not {resolution} m / {tile} px")
+        s = Session()
+        s.resolution = float(z["resolution"])
+        s.tile       = int(z["tile"])
+        s.pose_id    = int(z["pose_id"])
+        s.odom_dist  = float(z["odom_dist"])
+
+        keys, tiles, born = z["tile_keys"], z["tiles"], z["tile_born"]
+        s.tiles = {(int(k[0]), int(k[1])): tiles[i] for i, k in enumerate(keys)}
+        s.born  = {(int(k[0]), int(k[1])): int(born[i]) for i, k in enumerate(keys)}
+
+        ends = np.cumsum(z["kf_counts"])
+        pts  = np.split(z["kf_pts"].astype(np.float64), ends[:-1]) if len(ends) else []
+        s.keyframes = [(int(i), tuple(p), float(d), q) for i, p, d, q
+                       in zip(z["kf_ids"], z["kf_poses"], z["kf_odom"], pts)]
+        s.estimates = {int(i): tuple(p) for i, p in zip(z["est_ids"], z["est_poses"])}
+    return s
@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+
+import cv2
+import numpy as np
+import yaml
+
+# ═══════════════════════════════════════════════════════════════════
+#  ATOMIC, BACKGROUND MAP SAVES
+# ═══════════════════════════════════════════════════════════════════
+#
+#  A save writes <name>.pgm and <name>.yaml to temporary files in the
+#  same directory, fsyncs them and renames each over the old one, so a
+#  reader (or a robot that loses power) only ever sees a complete map.
+#
+#  MapWriter runs saves on its own thread.  The scan loop hands it a
+#  render function over a frozen map snapshot and returns at once; the
+#  PGM conversion, encoding and disk I/O all happen on the writer.  At
+#  most one save is queued: a newer request replaces one not started yet.
+
+
+def write_atomic(path: str, data: bytes):
+    """Write `data` to `path` via a fsynced temporary file and a rename."""
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def write_map_files(name: str, img, meta: dict):
+    """
+    Atomically write `img` as <name>.pgm and `meta` (map_server fields
+    other than `image`) as <name>.yaml.
+
+    Returns
+    -------
+    (pgm_path, yaml_path)
+    """
+    pgm, yml = f"{name}.pgm", f"{name}.yaml"
+    ok, buf = cv2.imencode(".pgm", img)
+    if not ok:
+        raise RuntimeError(f"PGM encoding failed for {pgm}")
+    write_atomic(pgm, buf.tobytes())
+    write_atomic(yml, yaml.dump({"image": os.path.basename(pgm), **meta},
+                                 default_flow_style=False).encode())
+    return pgm, yml
+
+
+def read_map_files(yaml_path: str):
+    """
+    Load a map_server map.
+
+    Returns
+    -------
+    occ_p : (H, W) float32 occupancy probability, row 0 = the image's
+            bottom row, so cell (row, col) = (y, x) like the mapper
+    meta  : the yaml fields
+    """
+    with open(yaml_path) as f:
+        meta = yaml.safe_load(f)
+    img_path = os.path.join(os.path.dirname(yaml_path), meta["image"])
+    img = cv2.imread(img_path, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise FileNotFoundError(img_path)
+    if meta.get("negate", 0):
+        img = 255 - img
+    return (255 - np.flipud(img).astype(np.float32)) / 255.0, meta
+
+
+class MapWriter(threading.Thread):
+    """
+    Background saver.  submit(name, render) queues `render()` → (img,
+    meta), written with write_map_files().
+
+    Metrics
+    -------
+    saves / failures   completed / failed saves
+    superseded         queued saves replaced by a newer one before starting
+    last_ms / max_ms   render + write time on the writer thread
+    """
+
+    def __init__(self):
+        super().__init__(name="map-writer", daemon=True)
+        self.saves      = 0
+        self.failures   = 0
+        self.superseded = 0
+        self.last_ms    = 0.0
+        self.max_ms     = 0.0
+        self._job       = None
+        self._busy      = False
+        self._closed    = False
+        self._cond      = threading.Condition()
+        self.start()
+
+    def submit(self, name: str, render):
+        with self._cond:
+            if self._closed:
+                return
+            self.superseded += self._job is not None
+            self._job = (name, render)
+            self._cond.notify_all()
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or self._closed)
+                if self._job is None:
+                    return
+                (name, render), self._job = self._job, None
+                self._busy = True
+            t0 = time.perf_counter()
+            try:
+                img, meta = render()
+                write_map_files(name, img, meta)
+                self.saves += 1
+            except Exception as e:
+                self.failures += 1
+                print(f"\n[WARN] Map save {name} failed: {e}")
+            finally:
+                self.last_ms = 1e3 * (time.perf_counter() - t0)
+                self.max_ms  = max(self.max_ms, self.last_ms)
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until nothing is queued or being written."""
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self._job is None and not self._busy, timeout)
+
+    def close(self, timeout: float = 30.0):
+        """Finish the queued save, then stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join(timeout)
@@ -0,0 +1,143 @@
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  MOTION PRIOR  (initial guess for scan matching)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Scan-to-scan ICP converges in a few iterations when it starts near
+#  the answer.  From the identity it uses most of its budget whenever
+#  the robot moved noticeably since the last processed scan, and every
+#  skipped revolution makes that worse.  The predictor extrapolates the
+#  last accepted scan-to-scan motion to the new scan's timestamp
+#  (constant velocity).  When wheel odometry is available it is used
+#  instead: Pepper's own odometry drifts over metres, but between two
+#  scans it is a good guess and, unlike the extrapolation, it sees the
+#  robot start, stop and turn.
+#
+#  The prediction only seeds the correlative search and ICP; it is never
+#  a factor in the graph.
+
+
+def between_xyt(a, b):
+    """a⁻¹ ∘ b for (x, y, theta) tuples."""
+    c, s = np.cos(a[2]), np.sin(a[2])
+    dx, dy = b[0] - a[0], b[1] - a[1]
+    return (c * dx + s * dy, -s * dx + c * dy,
+            float(np.arctan2(np.sin(b[2] - a[2]), np.cos(b[2] - a[2]))))
+
+
+class NaoqiOdometry(threading.Thread):
+    """
+    Polls Pepper's odometry, ALMotion.getRobotPosition(True), over a qi
+    session and keeps the last `keep` samples stamped with time.time(),
+    the clock the LiDAR reader stamps scans with.
+
+    Parameters
+    ----------
+    url     : naoqi session, e.g. "tcp://192.168.1.10:9559"
+    rate_hz : polling rate
+    """
+
+    def __init__(self, url: str, rate_hz: float, keep: int = 256):
+        super().__init__(name="wheel-odom", daemon=True)
+        import qi                     # optional: only needed on the robot
+        session = qi.Session()
+        session.connect(url)
+        self._motion   = session.service("ALMotion")
+        self.period    = 1.0 / rate_hz
+        self.samples   = deque(maxlen=keep)    # (t, x, y, theta)
+        self.errors    = 0
+        self._lock     = threading.Lock()
+        self._stop_evt = threading.Event()
+        self.start()
+
+    def run(self):
+        while not self._stop_evt.wait(self.period):
+            try:
+                x, y, th = self._motion.getRobotPosition(True)
+            except Exception as e:
+                self.errors += 1
+                if self.errors == 1:
+                    print(f"\n[WARN] Wheel odometry read failed: {e}")
+                continue
+            with self._lock:
+                self.samples.append((time.time(), x, y, th))
+
+    def pose_at(self, t: float):
+        """
+        Odometry pose interpolated to time t, or None outside the
+        buffered span.  A scan newer than the last sample by up to two
+        polls gets the last sample.
+        """
+        with self._lock:
+            if (len(self.samples) < 2 or
+                    not self.samples[0][0] <= t <= self.samples[-1][0] + 2 * self.period):
+                return None
+            s = np.array(self.samples)
+        t  = min(t, s[-1, 0])
+        i  = min(int(np.searchsorted(s[:, 0], t)), len(s) - 1)
+        a, b = s[max(i - 1, 0)], s[i]
+        w  = 0.0 if b[0] == a[0] else (t - a[0]) / (b[0] - a[0])
+        dth = np.arctan2(np.sin(b[3] - a[3]), np.cos(b[3] - a[3]))
+        return (a[1] + w * (b[1] - a[1]), a[2] + w * (b[2] - a[2]), a[3] + w * dth)
+
+    def close(self, timeout: float = 1.0):
+        self._stop_evt.set()
+        self.join(timeout)
+
+
+class MotionPredictor:
+    """
+    Predicted (dx, dy, dtheta) from the last processed scan to the next,
+    in the last scan's frame.
+
+    Parameters
+    ----------
+    max_gap_s : no prediction across a longer gap (reconnect, stall)
+    wheel     : NaoqiOdometry (or anything with pose_at(t)), or None
+
+    Metrics
+    -------
+    from_wheel / from_velocity   predictions made from each source
+    """
+
+    def __init__(self, max_gap_s: float, wheel=None):
+        self.max_gap_s     = max_gap_s
+        self.wheel         = wheel
+        self.from_wheel    = 0
+        self.from_velocity = 0
+        self._stamp        = None
+        self._vel          = None     # (vx, vy, vtheta) per second
+
+    def predict(self, stamp) -> tuple:
+        zero = (0.0, 0.0, 0.0)
+        if stamp is None or self._stamp is None:
+            return zero
+        dt = stamp - self._stamp
+        if not 0.0 < dt <= self.max_gap_s:
+            return zero
+        if self.wheel is not None:
+            a, b = self.wheel.pose_at(self._stamp), self.wheel.pose_at(stamp)
+            if a is not None and b is not None:
+                self.from_wheel += 1
+                return between_xyt(a, b)
+        if self._vel is None:
+            return zero
+        self.from_velocity += 1
+        return tuple(v * dt for v in self._vel)
+
+    def update(self, stamp, delta, ok: bool):
+        """
+        Record the motion estimated for the scan at `stamp`.  A failed
+        match forgets the velocity, so a bad estimate is not carried on.
+        """
+        if stamp is None:
+            return
+        dt = None if self._stamp is None else stamp - self._stamp
+        self._vel = (tuple(d / dt for d in delta)
+                     if ok and dt is not None and 0.0 < dt <= self.max_gap_s else None)
+        self._stamp = stamp
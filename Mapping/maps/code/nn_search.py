@@ -0,0 +1,143 @@
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:          # scipy is optional — the grid hash needs only numpy
+    cKDTree = None
+
+# ═══════════════════════════════════════════════════════════════════
+#  NEAREST-NEIGHBOUR BACKENDS FOR ICP
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Every backend is built once per *target* scan and then answers
+#
+#      nn_idx, nn_dist = index.query(src_pts, max_dist)
+#
+#  nn_dist is +inf for source points with no target within max_dist,
+#  so callers can keep using   mask = nn_dist < max_dist.
+#
+#    "kdtree" : scipy cKDTree            O(N log M)  (needs scipy)
+#    "grid"   : uniform grid hash        O(N · k)    (pure numpy)
+#    "brute"  : dense (N, M) distances   O(N · M)    (reference only)
+
+DEFAULT_BACKEND = "kdtree"
+DEFAULT_CELL_M  = 0.5        # grid hash cell size — match ICP_MAX_DIST
+
+_KEY_OFFSET = 1 << 20        # keeps cell indices positive (±52 km at 5 cm)
+_KEY_STRIDE = 1 << 21
+
+_warned_no_scipy = False
+
+
+def _cell_keys(ci: np.ndarray, cj: np.ndarray) -> np.ndarray:
+    return (ci + _KEY_OFFSET) * _KEY_STRIDE + (cj + _KEY_OFFSET)
+
+
+class BruteForceIndex:
+    __slots__ = ('pts',)
+
+    def __init__(self, tgt_pts: np.ndarray):
+        self.pts = tgt_pts
+
+    def query(self, src: np.ndarray, max_dist: float):
+        diff    = src[:, np.newaxis, :] - self.pts[np.newaxis, :, :]
+        dists   = np.linalg.norm(diff, axis=2)
+        nn_idx  = np.argmin(dists, axis=1)
+        nn_dist = dists[np.arange(len(src)), nn_idx]
+        nn_dist[nn_dist >= max_dist] = np.inf
+        return nn_idx, nn_dist
+
+
+class KDTreeIndex:
+    __slots__ = ('pts', '_tree')
+
+    def __init__(self, tgt_pts: np.ndarray):
+        self.pts   = tgt_pts
+        self._tree = cKDTree(tgt_pts)
+
+    def query(self, src: np.ndarray, max_dist: float):
+        nn_dist, nn_idx = self._tree.query(src, k=1,
+                                           distance_upper_bound=max_dist)
+        # misses come back as (inf, M) — clamp the index so it stays valid
+        np.minimum(nn_idx, len(self.pts) - 1, out=nn_idx)
+        return nn_idx, nn_dist
+
+
+class GridHashIndex:
+    """
+    Target points bucketed by integer cell, stored as one sorted key
+    array.  A query looks up the (2r+1)² cells around each source point
+    with searchsorted and reduces the candidate distances per point, all
+    without a Python loop.
+    """
+    __slots__ = ('pts', 'cell', '_keys', '_order')
+
+    def __init__(self, tgt_pts: np.ndarray, cell: float = DEFAULT_CELL_M):
+        self.pts  = tgt_pts
+        self.cell = cell
+        cij         = np.floor(tgt_pts / cell).astype(np.int64)
+        keys        = _cell_keys(cij[:, 0], cij[:, 1])
+        self._order = np.argsort(keys, kind='stable')
+        self._keys  = keys[self._order]
+
+    def query(self, src: np.ndarray, max_dist: float):
+        n       = len(src)
+        nn_idx  = np.zeros(n, dtype=np.int64)
+        nn_dist = np.full(n, np.inf)
+        if n == 0 or len(self.pts) == 0:
+            return nn_idx, nn_dist
+
+        r      = int(np.ceil(max_dist / self.cell))
+        off    = np.arange(-r, r + 1)
+        oi, oj = (a.ravel() for a in np.meshgrid(off, off, indexing='ij'))
+
+        cij = np.floor(src / self.cell).astype(np.int64)
+        qk  = _cell_keys(cij[:, 0, None] + oi, cij[:, 1, None] + oj)   # (N, K)
+        lo  = np.searchsorted(self._keys, qk, side='left').ravel()
+        cnt = np.searchsorted(self._keys, qk, side='right').ravel() - lo
+
+        total = int(cnt.sum())
+        if total == 0:
+            return nn_idx, nn_dist
+
+        # flatten every (query, candidate) pair; qidx is non-decreasing
+        seg_start = np.cumsum(cnt) - cnt
+        pos       = np.repeat(lo - seg_start, cnt) + np.arange(total)
+        cand      = self._order[pos]
+        qidx      = np.repeat(np.repeat(np.arange(n), len(oi)), cnt)
+        d2        = ((src[qidx] - self.pts[cand]) ** 2).sum(axis=1)
+
+        q_cnt = np.bincount(qidx, minlength=n)
+        hit   = np.flatnonzero(q_cnt)
+        first = (np.cumsum(q_cnt) - q_cnt)[hit]
+        best  = np.minimum.reduceat(d2, first)
+
+        # first candidate that attains the per-query minimum
+        is_min = d2 == np.repeat(best, q_cnt[hit])
+        at_min = np.flatnonzero(is_min)
+        _, first_min = np.unique(qidx[at_min], return_index=True)
+        sel = at_min[first_min]
+
+        nn_idx[hit]  = cand[sel]
+        nn_dist[hit] = np.sqrt(best)
+        nn_dist[nn_dist >= max_dist] = np.inf
+        return nn_idx, nn_dist
+
+
+def build_nn_index(tgt_pts: np.ndarray,
+                   backend: str = DEFAULT_BACKEND,
+                   cell: float = DEFAULT_CELL_M):
+    """Build the correspondence index for one target scan."""
+    global _warned_no_scipy
+    if backend == "kdtree":
+        if cKDTree is not None:
+            return KDTreeIndex(tgt_pts)
+        if not _warned_no_scipy:
+            print("[WARN] scipy not installed — ICP falls back to grid hash")
+            _warned_no_scipy = True
+        backend = "grid"
+    if backend == "grid":
+        return GridHashIndex(tgt_pts, cell)
+    if backend == "brute":
+        return BruteForceIndex(tgt_pts)
+    raise ValueError(f"unknown NN backend: {backend!r}")
@@ -0,0 +1,108 @@
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  SCAN-CONTEXT PLACE RECOGNITION  (2-D adaptation of Kim & Kim 2018)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Each keyframe is summarised by two small vectors:
+#
+#    ring key       : histogram of return ranges over SC_RINGS annuli —
+#                     independent of heading, so it is the search key
+#    sector profile : mean range in each of SC_SECTORS angular bins —
+#                     a heading shift is a circular roll of this vector,
+#                     so the best roll gives a yaw guess for ICP
+#
+#  Both live in preallocated contiguous matrices (one row per keyframe
+#  slot), so a query is a single vectorised distance over all rows.
+
+SC_RINGS     = 20
+SC_SECTORS   = 60            # 6° bins
+SC_MAX_RANGE = 8.0           # metres — match DIST_MAX_MM
+SC_PREFILTER = 4             # ring-key shortlist = top_k × this
+
+
+def scan_descriptor(pts: np.ndarray,
+                    n_rings: int = SC_RINGS,
+                    n_sectors: int = SC_SECTORS,
+                    max_range: float = SC_MAX_RANGE):
+    """(ring_key, sector_profile) of an (N, 2) sensor-frame scan."""
+    r   = np.hypot(pts[:, 0], pts[:, 1])
+    ok  = r < max_range
+    r   = r[ok]
+    a   = np.arctan2(pts[ok, 1], pts[ok, 0])
+
+    ring = np.bincount((r * (n_rings / max_range)).astype(np.intp),
+                       minlength=n_rings)[:n_rings].astype(np.float32)
+    ring /= max(len(r), 1)
+
+    sec  = ((a + np.pi) * (n_sectors / (2 * np.pi))).astype(np.intp) % n_sectors
+    cnt  = np.bincount(sec, minlength=n_sectors)
+    prof = np.bincount(sec, weights=r, minlength=n_sectors) / np.maximum(cnt, 1)
+    return ring, (prof / max_range).astype(np.float32)
+
+
+class ScanContextIndex:
+    """
+    Fixed-capacity ring buffer of keyframe descriptors.  Slot i holds the
+    descriptor of the keyframe in `items[i]`; the oldest slot is reused
+    once the buffer is full, mirroring the KeyframeStore ring.
+    """
+
+    def __init__(self, capacity: int,
+                 n_rings: int = SC_RINGS, n_sectors: int = SC_SECTORS):
+        self.capacity  = capacity
+        self.n_sectors = n_sectors
+        self.ring_keys = np.zeros((capacity, n_rings), dtype=np.float32)
+        self.profiles  = np.zeros((capacity, n_sectors), dtype=np.float32)
+        self.seq       = np.full(capacity, -1, dtype=np.int64)   # insert order
+        self.pose_ids  = np.full(capacity, -1, dtype=np.int64)
+        self.items     = [None] * capacity
+        self._n_added  = 0
+
+    def __len__(self):
+        return min(self._n_added, self.capacity)
+
+    def add(self, pose_id: int, pts: np.ndarray, item=None):
+        slot = self._n_added % self.capacity
+        self.ring_keys[slot], self.profiles[slot] = scan_descriptor(pts)
+        self.seq[slot]      = self._n_added
+        self.pose_ids[slot] = pose_id
+        self.items[slot]    = item
+        self._n_added += 1
+
+    def query(self, pts: np.ndarray, top_k: int,
+              skip_recent: int = 0, min_pose_id: int = 0, frozen_below: int = 0):
+        """
+        Best `top_k` stored keyframes for a scan, excluding the
+        `skip_recent` newest ones and any with pose_id < min_pose_id
+        unless pose_id < frozen_below (a resumed session's keyframes).
+
+        Returns
+        -------
+        list of (item, pose_id, yaw) — yaw rotates the query scan onto
+        the candidate's heading and seeds ICP.  Best match first.
+        """
+        valid = np.flatnonzero((self.seq >= 0) &
+                               (self.seq < self._n_added - skip_recent) &
+                               ((self.pose_ids >= min_pose_id) |
+                                (self.pose_ids < frozen_below)))
+        if len(valid) == 0:
+            return []
+
+        ring, prof = scan_descriptor(pts)
+        d_ring = np.linalg.norm(self.ring_keys[valid] - ring, axis=1)
+        n_pre  = min(len(valid), top_k * SC_PREFILTER)
+        short  = valid[np.argpartition(d_ring, n_pre - 1)[:n_pre]]
+
+        # every circular shift of the query profile against every candidate
+        s     = self.n_sectors
+        rolls = prof[(np.arange(s)[None, :] - np.arange(s)[:, None]) % s]  # (shift, S)
+        d_sec = np.linalg.norm(self.profiles[short][:, None, :] - rolls[None],
+                               axis=2)                                        # (cand, shift)
+        shift = d_sec.argmin(axis=1)
+        score = d_sec[np.arange(len(short)), shift]
+
+        best = np.argsort(score)[:top_k]
+        yaw  = np.where(shift > s // 2, shift - s, shift) * (2 * np.pi / s)
+        return [(self.items[short[i]], int(self.pose_ids[short[i]]),
+                 float(yaw[i])) for i in best]
@@ -0,0 +1,343 @@
+import multiprocessing as mp
+import time
+from concurrent.futures import ProcessPoolExecutor, wait as _wait_futures
+from contextlib import contextmanager
+
+import gtsam
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  POSE-GRAPH BACKENDS
+# ═══════════════════════════════════════════════════════════════════
+#
+#  All backends share one small interface used by SLAMMapper:
+#
+#      add(factors, values)      odometry factor + initial guess
+#      add_loop_closure(factor)  constraint between two existing poses
+#      estimate(key) -> Pose2    best current estimate
+#      optimise_async()          batch only — incremental ones are no-ops
+#      marginalise(latest_id)    batch only — bound the live graph
+#      frontier_id               oldest pose a new factor may reference
+#      all_estimates()           {pose id: Pose2} of every pose still held
+#      stalls / max_call_ms      scan-side calls slower than stall_ms
+#
+#  The graph starts at pose `start_id` (0, or the next free id when a
+#  saved session is resumed) with `prior_factor` on it.
+#
+#    "batch"     : LM over a snapshot of the live window in a worker
+#                  process, with the hand-rolled marginalisation
+#    "isam2"     : gtsam.ISAM2 — each update relinearises only the
+#                  cliques a new factor touches; keeps the whole graph
+#    "fixed_lag" : gtsam.IncrementalFixedLagSmoother keyed on pose id —
+#                  iSAM2 with automatic marginalisation past the lag,
+#                  so per-scan cost stays flat on hour-long runs
+
+_ANCHOR_SIGMAS = np.array([0.01, 0.01, 0.005])
+
+
+def _graph_of(factors) -> gtsam.NonlinearFactorGraph:
+    g = gtsam.NonlinearFactorGraph()
+    for f in factors:
+        g.add(f)
+    return g
+
+
+def _values_of(values: dict) -> gtsam.Values:
+    v = gtsam.Values()
+    for key, pose in values.items():
+        v.insert(key, pose)
+    return v
+
+
+_pool = None
+
+
+def _worker_pool() -> ProcessPoolExecutor:
+    """
+    The batch worker process, shared by every BatchBackend in the process.
+    It is forked when the first backend is built — SLAMMapper builds it
+    before starting any thread, and fork() of a multi-threaded process
+    can copy a lock another thread holds — and reused when a resume
+    rebuilds the backend, so it is never forked again.
+    """
+    global _pool
+    if _pool is None:
+        ctx   = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+        _pool = ProcessPoolExecutor(max_workers=1, mp_context=ctx)
+        _pool.submit(int).result()          # fork it now, not on the first optimisation
+    return _pool
+
+
+def _optimise(graph, values, max_iter):
+    """Worker-process entry point: plain LM on a pickled snapshot."""
+    params = gtsam.LevenbergMarquardtParams()
+    params.setMaxIterations(max_iter)
+    return gtsam.LevenbergMarquardtOptimizer(graph, values, params).optimize()
+
+
+class _Backend:
+    """Latency accounting shared by every backend."""
+    stall_ms = 20.0
+
+    def __init__(self):
+        self.stalls      = 0
+        self.max_call_ms = 0.0
+
+    @contextmanager
+    def _timed(self):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            ms = 1e3 * (time.perf_counter() - t0)
+            self.max_call_ms = max(self.max_call_ms, ms)
+            if ms > self.stall_ms:
+                self.stalls += 1
+
+    def close(self):
+        pass
+
+
+class BatchBackend(_Backend):
+    """
+    Double-buffered LM.  The scan thread owns the live graph and
+    estimates and never takes a lock: optimise_async() copies a snapshot,
+    hands it to the worker process and returns at once, factors added
+    meanwhile simply accumulate in the live graph, and the next scan-side
+    call swaps the finished result in.  Poses newer than the snapshot
+    are carried along by the correction the optimiser applied to the
+    snapshot's newest pose.  (A thread would not do: gtsam holds the
+    GIL for the whole optimize() call.)
+    """
+
+    def __init__(self, prior_factor, start_pose, window: int, max_iter: int,
+                 start_id: int = 0):
+        super().__init__()
+        self.graph       = gtsam.NonlinearFactorGraph()
+        self.estimates   = gtsam.Values()
+        self.frontier_id = start_id
+        self.window      = window
+        self.max_iter    = max_iter
+        self.opt_count   = 0
+        self._pool       = _worker_pool()
+        self._future     = None
+        self._snap_key   = None     # newest pose in the in-flight snapshot
+        self._rerun      = False
+        self.graph.add(prior_factor)
+        self.estimates.insert(start_id, start_pose)
+
+    # ── scan-side API ────────────────────────────────────────────────
+
+    def add(self, factors, values: dict):
+        with self._timed():
+            self._swap()
+            for f in factors:
+                self.graph.add(f)
+            for key, pose in values.items():
+                self.estimates.insert(key, pose)
+
+    def add_loop_closure(self, factor):
+        self.add([factor], {})
+
+    def estimate(self, key) -> gtsam.Pose2:
+        with self._timed():
+            self._swap()
+            return self.estimates.atPose2(key)
+
+    def all_estimates(self) -> dict:
+        self._swap()
+        return {k: self.estimates.atPose2(k) for k in self.estimates.keys()}
+
+    def optimise_async(self, urgent: bool = False):
+        """Start LM on a snapshot; if one is running, `urgent` queues another."""
+        with self._timed():
+            self._swap()
+            if self._future is not None:
+                self._rerun = self._rerun or urgent
+                return
+            self._start()
+
+    def wait(self, timeout: float):
+        """Block until the in-flight optimisation lands (shutdown only)."""
+        if self._future is not None:
+            _wait_futures([self._future], timeout=timeout)
+            self._swap()
+
+    def close(self):
+        """Abandon the in-flight optimisation; the shared worker stays up."""
+        if self._future is not None:
+            self._future.cancel()
+            self._future = None
+
+    # ── double buffer ────────────────────────────────────────────────
+
+    def _start(self):
+        # Copied here, not by reference: the executor pickles its
+        # arguments later on its own thread, by when the scan thread may
+        # have added factors and values (possibly between the two).
+        graph  = gtsam.NonlinearFactorGraph(self.graph)
+        values = gtsam.Values(self.estimates)
+        self._snap_key = max(values.keys())
+        self._future   = self._pool.submit(_optimise, graph, values, self.max_iter)
+
+    def _swap(self):
+        fut = self._future
+        if fut is None or not fut.done():
+            return
+        self._future = None
+        try:
+            result = fut.result()
+        except Exception as e:
+            print(f"\n[WARN] Optimiser: {e}")
+            result = None
+
+        if result is not None:
+            self._merge(result)
+            self.opt_count += 1
+        if self._rerun:
+            self._rerun = False
+            self._start()
+
+    def _merge(self, result: gtsam.Values):
+        snap = self._snap_key
+        corr = gtsam.Pose2()
+        if result.exists(snap) and self.estimates.exists(snap):
+            corr = result.atPose2(snap).compose(self.estimates.atPose2(snap).inverse())
+
+        merged = gtsam.Values()
+        for key in self.estimates.keys():
+            if result.exists(key):
+                merged.insert(key, result.atPose2(key))
+            else:                       # added after the snapshot was taken
+                merged.insert(key, corr.compose(self.estimates.atPose2(key)))
+        self.estimates = merged
+
+    # ── marginalisation ──────────────────────────────────────────────
+
+    def marginalise(self, latest_id: int) -> bool:
+        """
+        Rebuild the factor graph keeping only the most recent `window`
+        poses.  Older poses are frozen; a tight prior anchors the new frontier.
+        Keeps graph at a fixed O(window) size for arbitrarily long runs.
+        """
+        with self._timed():
+            self._swap()
+            if latest_id - self.frontier_id <= self.window:
+                return False
+
+            new_frontier = latest_id - self.window
+            anchor_pose  = self.estimates.atPose2(new_frontier)
+            anchor_noise = gtsam.noiseModel.Diagonal.Sigmas(_ANCHOR_SIGMAS)
+
+            new_graph  = gtsam.NonlinearFactorGraph()
+            new_values = gtsam.Values()
+
+            new_graph.add(gtsam.PriorFactorPose2(new_frontier, anchor_pose, anchor_noise))
+
+            for pid in range(new_frontier, latest_id + 1):
+                if self.estimates.exists(pid):
+                    new_values.insert(pid, self.estimates.atPose2(pid))
+
+            for i in range(self.graph.size()):
+                factor = self.graph.at(i)
+                # factor.keys() may return a plain list OR a gtsam.KeyVector
+                # depending on the installed GTSAM Python binding version.
+                # Wrapping in list() normalises both cases safely.
+                keys = list(factor.keys())
+                if all(k >= new_frontier for k in keys):
+                    new_graph.add(factor)
+
+            self.graph       = new_graph
+            self.estimates   = new_values
+            self.frontier_id = new_frontier
+            return True
+
+
+class ISAM2Backend(_Backend):
+
+    def __init__(self, prior_factor, start_pose,
+                 relin_thresh: float, lc_extra_updates: int, start_id: int = 0):
+        super().__init__()
+        params = gtsam.ISAM2Params()
+        params.setRelinearizeThreshold(relin_thresh)
+        self.isam        = gtsam.ISAM2(params)
+        self.frontier_id = start_id
+        self.lc_extra    = lc_extra_updates
+        self.isam.update(_graph_of([prior_factor]), _values_of({start_id: start_pose}))
+
+    def add(self, factors, values: dict):
+        with self._timed():
+            self.isam.update(_graph_of(factors), _values_of(values))
+
+    def add_loop_closure(self, factor):
+        # a loop closure moves many poses at once — a couple of extra
+        # relinearisation passes let the correction land in this scan
+        self.add([factor], {})
+        for _ in range(self.lc_extra):
+            self.isam.update()
+
+    def estimate(self, key) -> gtsam.Pose2:
+        with self._timed():
+            return self.isam.calculateEstimatePose2(key)
+
+    def all_estimates(self) -> dict:
+        est = self.isam.calculateEstimate()
+        return {k: est.atPose2(k) for k in est.keys()}
+
+    def optimise_async(self, urgent: bool = False):
+        pass
+
+    def wait(self, timeout: float):
+        pass
+
+    def marginalise(self, latest_id: int) -> bool:
+        return False
+
+
+class FixedLagBackend(ISAM2Backend):
+    """iSAM2 whose variables older than `lag` poses are marginalised out."""
+
+    def __init__(self, prior_factor, start_pose, lag: int,
+                 relin_thresh: float, lc_extra_updates: int, start_id: int = 0):
+        _Backend.__init__(self)
+        params = gtsam.ISAM2Params()
+        params.setRelinearizeThreshold(relin_thresh)
+        self.isam        = gtsam.IncrementalFixedLagSmoother(float(lag), params)
+        self.lag         = lag
+        self.frontier_id = start_id
+        self.lc_extra    = lc_extra_updates
+        self._latest     = start_id
+        self.add([prior_factor], {start_id: start_pose})
+
+    def add(self, factors, values: dict):
+        with self._timed():
+            stamps = gtsam.FixedLagSmootherKeyTimestampMap()
+            for key in values:
+                stamps.insert((key, float(key)))     # "time" is the pose id
+                self._latest = max(self._latest, key)
+            self.isam.update(_graph_of(factors), _values_of(values), stamps)
+            self.frontier_id = max(self.frontier_id, self._latest - self.lag + 1)
+
+    def add_loop_closure(self, factor):
+        self.add([factor], {})
+        for _ in range(self.lc_extra):
+            self.add([], {})
+
+
+def make_backend(kind: str, prior_factor, start_pose, *,
+                 window: int, opt_max_iter: int, lag: int,
+                 relin_thresh: float, lc_extra_updates: int,
+                 stall_ms: float = _Backend.stall_ms, start_id: int = 0):
+    if kind == "batch":
+        backend = BatchBackend(prior_factor, start_pose, window, opt_max_iter,
+                               start_id)
+    elif kind == "isam2":
+        backend = ISAM2Backend(prior_factor, start_pose,
+                               relin_thresh, lc_extra_updates, start_id)
+    elif kind == "fixed_lag":
+        backend = FixedLagBackend(prior_factor, start_pose, lag,
+                                  relin_thresh, lc_extra_updates, start_id)
+    else:
+        raise ValueError(f"unknown graph backend: {kind!r}")
+    backend.stall_ms = stall_ms
+    return backend
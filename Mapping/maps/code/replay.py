@@ -0,0 +1,98 @@
+"""
+Replay a recorded scan log (scan_log.py) through the mapper — no LiDAR.
+
+world_building2_1.py records every run to RECORD_LOG.  Replaying that log
+reruns the same SLAM pipeline, so ICP_*, LC_*, GRAPH_* etc. can be tuned
+offline and runs compared on identical input:
+
+    python3 replay.py floor10_3.scanlog                 # real time
+    python3 replay.py floor10_3.scanlog --speed 4       # 4x real time
+    python3 replay.py floor10_3.scanlog --fast          # every scan, flat out
+    python3 replay.py floor10_3.scanlog --fast --sync   # repeatable
+    python3 replay.py more.scanlog --resume floor10_3.session.npz
+
+Real-time replay goes through the same scan ring as the live LiDAR, so
+scans the mapper is too slow for are dropped exactly as on the robot.
+--fast processes every scan back to back.  --sync additionally waits for
+the loop-closure worker and the optimiser after each scan and lifts the
+matcher time budgets, so two runs of the same log give the same map.
+"""
+import argparse
+import os
+import time
+
+import world_building2_1 as wb
+from lidar_reader import ScanRing
+from scan_log import LogPlayer, ScanLog
+
+
+def replay_fast(mapper, log: ScanLog, output_name: str, sync: bool):
+    """Every scan in order, no pacing.  Returns the number processed."""
+    proc_i = 0
+    try:
+        for i in range(len(log)):
+            t, angle_deg, dist_mm, _ = log.scan(i)
+            out = wb.process_scan(mapper, proc_i, angle_deg, dist_mm, output_name, t)
+            if out is None:
+                continue
+            if sync:
+                mapper.lc_worker.wait(timeout=60.0)
+                mapper.backend.wait(timeout=60.0)
+            if proc_i % 10 == 0:
+                wb.print_status(mapper, i + 1, proc_i, 0.0, *out)
+            proc_i += 1
+            mapper.scans_processed = proc_i
+    except KeyboardInterrupt:
+        print("\n\nCtrl-C — saving map…")
+    return proc_i
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("log", help="scan log written by world_building2_1.py")
+    ap.add_argument("-o", "--output", help="map name (default: <log>_replay)")
+    ap.add_argument("--speed", type=float, default=1.0,
+                    help="real-time multiplier (default 1)")
+    ap.add_argument("--fast", action="store_true",
+                    help="process every scan as fast as possible")
+    ap.add_argument("--sync", action="store_true",
+                    help="with --fast: wait for background workers, no time budgets")
+    ap.add_argument("--resume", metavar="SESSION",
+                    help="extend the map of a saved session (<name>.session.npz)")
+    args = ap.parse_args()
+    if args.sync and not args.fast:
+        ap.error("--sync needs --fast (it lifts the time budgets the real-time loop relies on)")
+
+    log  = ScanLog(args.log)
+    name = args.output or os.path.splitext(os.path.basename(args.log))[0] + "_replay"
+    if args.sync:
+        wb.CSM_BUDGET_MS    = float("inf")
+        wb.LC_CSM_BUDGET_MS = float("inf")
+
+    mapper = wb.SLAMMapper(resume=args.resume)
+    mapper.timers.install_dump_signal()
+    mode = ("fast, synchronous" if args.fast and args.sync else
+            "fast" if args.fast else f"{args.speed:g}x real time")
+    wb.print_banner(f"{args.log}  ({len(log)} scans, {log.duration:.0f} s, {mode})")
+    print()
+
+    t0 = time.perf_counter()
+    if args.fast:
+        n = replay_fast(mapper, log, name, args.sync)
+        wb.finish(mapper, None, name)
+    else:
+        player = LogPlayer(log, ScanRing(wb.SCAN_RING_SLOTS, wb.SCAN_MAX_POINTS),
+                           args.speed)
+        player.start()
+        wb.run_slam(mapper, player, name)
+        n = mapper.scans_processed
+        wb.finish(mapper, player, name)
+    wall = time.perf_counter() - t0
+
+    print(f"  Replay           :   {n} scans in {wall:.1f} s  "
+          f"({n / max(wall, 1e-9):.1f} scans/s, "
+          f"{log.duration / max(wall, 1e-9):.1f}x real time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  SHARED SCAN SETTINGS  (mapper and localiser)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  world_building2_1.py and localiser.py read the same LiDAR the same
+#  way.  What they share lives here so the localiser does not have to
+#  import the whole mapper (and GTSAM) to get at it; the mapper
+#  re-exports every name, so wb.<NAME> keeps working.
+
+PORT_NAME  = '/dev/ttyUSB0'
+BAUDRATE   = 256000
+
+# ── LiDAR filtering ─────────────────────────────────────────────────
+DIST_MIN_MM = 150           # drop returns < 15 cm  (self-noise)
+DIST_MAX_MM = 8000          # drop returns > 8 m    (spurious)
+
+# ── Scan input (reader thread + ring buffer, lidar_reader.py) ────────
+SCAN_RING_SLOTS = 8         # preallocated raw scans; newest is processed
+SCAN_MAX_POINTS = 2048      # samples per revolution (A2M12 ≈ 1600 @ 10 Hz)
+VOXEL_ICP_M     = 0.05      # ICP / CSM / keyframes: one point per 5 cm cell
+
+# ── Scan matching ────────────────────────────────────────────────────
+ICP_MIN_POINTS   = 20       # fewer points than this and a scan is not matched
+MOTION_MAX_GAP_S = 0.5      # no prediction across a longer gap (reconnect)
+
+# ── Reconnect logic ──────────────────────────────────────────────────
+# If the LiDAR throws an exception (descriptor bytes error), the code
+# will attempt to reconnect this many times before giving up.
+MAX_RECONNECT_ATTEMPTS = 5
+RECONNECT_DELAY_S      = 2.0
+
+MAP_FRAME = "map"           # frame id of the map and of poses in it
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  VOXEL-GRID DOWNSAMPLING
+# ═══════════════════════════════════════════════════════════════════
+#
+#  A LiDAR's angular sampling puts ten times more points per metre on a
+#  wall 1 m away than on one 10 m away; a stride keeps that imbalance.
+#  One point per grid cell instead spaces points evenly along the walls,
+#  so near walls stop dominating the ICP sums and distant structure —
+#  which constrains rotation best — keeps its points.
+
+def voxel_filter(pts: np.ndarray, cell: float) -> np.ndarray:
+    """First point (in scan order) of every occupied cell × cell square."""
+    k   = np.floor(pts / cell).astype(np.int64)
+    key = (k[:, 0] << 32) ^ (k[:, 1] & 0xFFFFFFFF)
+    _, first = np.unique(key, return_index=True)
+    return pts[np.sort(first)]
+
+
+def downsample(points, max_pts: int, cell: float = VOXEL_ICP_M) -> np.ndarray:
+    """
+    Voxel-grid downsample.  If more than max_pts cells are occupied the
+    cell is enlarged (points along walls thin roughly as 1 / cell) and
+    the filter rerun; a final stride trims whatever is still over.
+    """
+    arr = np.asarray(points, dtype=np.float64)
+    out = voxel_filter(arr, cell)
+    for _ in range(3):
+        if len(out) <= max_pts:
+            return out
+        cell *= len(out) / max_pts
+        out   = voxel_filter(arr, cell)
+    return out[::-(-len(out) // max_pts)] if len(out) > max_pts else out
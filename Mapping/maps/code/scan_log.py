@@ -0,0 +1,166 @@
+import os
+import struct
+import threading
+import time
+
+import numpy as np
+
+from scan_ingest import raw_arrays
+
+# ═══════════════════════════════════════════════════════════════════
+#  BINARY SCAN LOG  (record once, replay the SLAM offline)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  File layout, little-endian:
+#
+#      header   8s magic "HCRTSCAN", u32 version, u32 reserved
+#      record   f64 timestamp (s), u32 n, then n samples of
+#               u16 angle  (1/64 deg, RPLidar q6)
+#               u16 dist   (1/4 mm,   RPLidar q2)
+#               u8  quality
+#
+#  5 bytes a sample — about 130 MB for an hour of A2M12 at 10 Hz.  The
+#  reader memory-maps the file and indexes the record offsets once, so a
+#  scan is a zero-copy view and random access is O(1).
+
+MAGIC   = b"HCRTSCAN"
+VERSION = 1
+
+_HEADER = struct.Struct("<8sII")
+_RECORD = struct.Struct("<dI")
+SAMPLE  = np.dtype([('angle_q6', '<u2'), ('dist_q2', '<u2'), ('quality', 'u1')])
+
+_DIST_Q2_MAX = np.iinfo(np.uint16).max
+
+
+def run_log_path(path: str) -> str:
+    """`path` with the start time of this run before the extension, e.g.
+    floor10_3.scanlog → floor10_3_20250301-142501.scanlog."""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_{time.strftime('%Y%m%d-%H%M%S')}{ext}"
+
+
+class ScanLogWriter:
+    """
+    Append raw scans to a log.  Usable as a context manager.  An existing
+    file is never overwritten (FileExistsError) unless `overwrite` — a
+    recording cannot be captured again.
+    """
+
+    def __init__(self, path: str, overwrite: bool = False):
+        self.path  = path
+        self.count = 0
+        self._f    = open(path, "wb" if overwrite else "xb")
+        self._f.write(_HEADER.pack(MAGIC, VERSION, 0))
+
+    def write(self, t: float, scan):
+        """One iter_scans() revolution of (quality, angle_deg, dist_mm)."""
+        arr = raw_arrays(scan)
+        self.write_arrays(t, arr[:, 1], arr[:, 2], arr[:, 0])
+
+    def write_arrays(self, t: float, angle_deg, dist_mm, quality):
+        rec = np.empty(len(angle_deg), dtype=SAMPLE)
+        rec['angle_q6'] = np.rint(np.mod(angle_deg, 360.0) * 64) % (360 * 64)
+        rec['dist_q2']  = np.clip(np.rint(np.asarray(dist_mm) * 4), 0, _DIST_Q2_MAX)
+        rec['quality']  = np.clip(quality, 0, 255)
+        self._f.write(_RECORD.pack(t, len(rec)))
+        self._f.write(rec.tobytes())
+        self.count += 1
+
+    def flush(self):
+        self._f.flush()
+
+    def close(self):
+        if not self._f.closed:
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ScanLog:
+    """
+    Memory-mapped read access to a log.  A truncated last record (the
+    recorder was killed mid-write) is ignored.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mm  = np.memmap(path, dtype=np.uint8, mode='r')
+        if len(self._mm) < _HEADER.size:
+            raise ValueError(f"{path}: not a scan log")
+        magic, version, _ = _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path}: not a scan log")
+        if version != VERSION:
+            raise ValueError(f"{path}: unsupported scan log version {version}")
+
+        offsets, counts, stamps = [], [], []
+        pos, end = _HEADER.size, len(self._mm)
+        while pos + _RECORD.size <= end:
+            t, n = _RECORD.unpack_from(self._mm, pos)
+            body = pos + _RECORD.size
+            if body + n * SAMPLE.itemsize > end:
+                break
+            offsets.append(body)
+            counts.append(n)
+            stamps.append(t)
+            pos = body + n * SAMPLE.itemsize
+
+        self.offsets    = np.array(offsets, dtype=np.int64)
+        self.counts     = np.array(counts, dtype=np.int64)
+        self.timestamps = np.array(stamps, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    @property
+    def duration(self) -> float:
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) > 1 else 0.0
+
+    def samples(self, i: int) -> np.ndarray:
+        """Raw structured samples of scan i (a view into the map)."""
+        return np.frombuffer(self._mm, dtype=SAMPLE, count=int(self.counts[i]),
+                             offset=int(self.offsets[i]))
+
+    def scan(self, i: int):
+        """(timestamp, angle_deg, dist_mm, quality) of scan i, as float32 arrays."""
+        s = self.samples(i)
+        return (float(self.timestamps[i]),
+                s['angle_q6'].astype(np.float32) / 64.0,
+                s['dist_q2'].astype(np.float32) / 4.0,
+                s['quality'])
+
+
+class LogPlayer(threading.Thread):
+    """
+    Pushes a log into a scan ring (lidar_reader.ScanRing or anything with
+    its push_arrays() / close()) at its recorded rate × speed.
+    """
+
+    def __init__(self, log: ScanLog, ring, speed: float):
+        super().__init__(name="log-player", daemon=True)
+        self.log        = log
+        self.ring       = ring
+        self.speed      = speed
+        self.reconnects = 0
+        self.failed     = None
+        self._stop_evt  = threading.Event()
+
+    def run(self):
+        t_log0  = self.log.timestamps[0] if len(self.log) else 0.0
+        t_wall0 = time.monotonic()
+        for i in range(len(self.log)):
+            t, angle_deg, dist_mm, _ = self.log.scan(i)
+            delay = t_wall0 + (t - t_log0) / self.speed - time.monotonic()
+            if delay > 0 and self._stop_evt.wait(delay):
+                break
+            self.ring.push_arrays(angle_deg, dist_mm, t)
+        self.ring.close()
+
+    def stop(self, timeout: float = 2.0):
+        self._stop_evt.set()
+        self.join(timeout)
@@ -0,0 +1,140 @@
+# ═══════════════════════════════════════════════════════════════════
+#  LOAD SHEDDING  (per-scan latency budget for the live loop)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  The reader ring already drops whatever scans the loop is too slow
+#  for, but each drop doubles the motion ICP has to recover and the gap
+#  lands wherever the slow stage happened to be.  The scheduler instead
+#  gives every scan a budget, a share of one LiDAR revolution measured
+#  from the scan stamps, so the same config fits a Jetson and a Pi 5.
+#  When the loop runs over it, optional work is shed a step at a time:
+#
+#      level 0   everything
+#      level 1   lighter odometry: ICP at reduced point density, the
+#                  correlative (CSM) seed over a narrower window
+#      level 2   + only 1 keyframe in lc_every is searched for loop
+#                  closures (the rest are indexed unsearched, as when
+#                  the worker's backlog is full)
+#      level 3   + the map is painted from 1 scan in paint_every
+#
+#  The CSM seed is the costliest stage, but it is also what holds
+#  odometry to the map in a long corridor, so it is only narrowed,
+#  never dropped: on the simulated floor-10 route, ICP from the motion
+#  prior alone cost more map accuracy than the dropped scans it saved.
+#
+#  The load signals are moving averages of the scan time and of the
+#  scans the ring dropped per processed scan.  A step up needs `hold`
+#  scans since the last step, so the averages see the effect of one
+#  step before the next.  A step down needs `hold` drop-free scans in a
+#  row under relax × budget; the gap between the two thresholds keeps
+#  the level from flapping.
+#
+#  Only the real-time loop (run_slam) reports to the scheduler.  Fast
+#  replay and the benchmarks never do, so they stay at level 0 and
+#  repeatable.
+
+LEVELS = ("full", "lite odometry", "thin LC", "thin map")
+
+
+class ScanScheduler:
+    """
+    Shedding level for the next scan, from the measured load.
+
+    Parameters
+    ----------
+    budget      : share of one LiDAR revolution a scan may take
+    relax       : step down only below relax × budget
+    hold        : scans between steps (and drop-free scans to step down)
+    icp_scale   : reduced ICP density, as a share of the full point budget
+    csm_scale   : narrower CSM window, as a share of the full one
+    lc_every    : search 1 keyframe in N from level 2
+    paint_every : paint 1 scan in N from level 3
+    max_drop    : step up while the ring drops more scans than this per scan
+    period_ms   : revolution time assumed until stamps have measured it
+    alpha       : moving-average weight of the newest scan
+
+    Metrics
+    -------
+    level          current level (index into LEVELS)
+    scans_at       processed scans at each level
+    steps_up/down  level changes
+    """
+
+    def __init__(self, budget: float, relax: float, hold: int,
+                 icp_scale: float, csm_scale: float,
+                 lc_every: int, paint_every: int,
+                 max_drop: float = 0.1, period_ms: float = 100.0,
+                 alpha: float = 0.1):
+        self.budget      = budget
+        self.relax       = relax
+        self.hold        = hold
+        self.icp_scale   = icp_scale
+        self.csm_scale   = csm_scale
+        self.lc_every    = lc_every
+        self.paint_every = paint_every
+        self.max_drop    = max_drop
+        self.alpha       = alpha
+        self.period_ms   = period_ms
+        self.scan_ms     = 0.0           # moving averages
+        self.drops       = 0.0
+        self.level       = 0
+        self.scans_at    = [0] * len(LEVELS)
+        self.steps_up    = 0
+        self.steps_down  = 0
+        self._since_step = 0
+        self._calm       = 0             # drop-free scans under relax × budget in a row
+        self._stamp      = None
+
+    @property
+    def budget_ms(self) -> float:
+        return self.budget * self.period_ms
+
+    # ── decisions for the next scan ───────────────────────────────────
+
+    def icp_points(self, full: int) -> int:
+        return full if self.level < 1 else max(int(full * self.icp_scale), 1)
+
+    @property
+    def csm_window(self) -> float:
+        return 1.0 if self.level < 1 else self.csm_scale
+
+    def search_lc(self, kf_i: int) -> bool:
+        return self.level < 2 or kf_i % self.lc_every == 0
+
+    def paint(self, proc_i: int) -> bool:
+        return self.level < 3 or proc_i % self.paint_every == 0
+
+    # ── feedback from the loop ────────────────────────────────────────
+
+    def observe(self, scan_ms: float, skipped: int, stamp: float | None = None):
+        """
+        Account one processed scan: its time through process_scan, the
+        scans the ring dropped before it and its stamp (seconds).
+        """
+        self.scans_at[self.level] += 1
+        if stamp is not None and self._stamp is not None and stamp > self._stamp:
+            period = 1e3 * (stamp - self._stamp) / (skipped + 1)
+            self.period_ms += self.alpha * (period - self.period_ms)
+        self._stamp   = stamp
+        self.scan_ms += self.alpha * (scan_ms - self.scan_ms)
+        self.drops   += self.alpha * (skipped - self.drops)
+        self._since_step += 1
+
+        over = self.scan_ms > self.budget_ms or self.drops > self.max_drop
+        calm = self.scan_ms < self.relax * self.budget_ms and skipped == 0
+        self._calm = self._calm + 1 if calm else 0
+
+        if over and self.level < len(LEVELS) - 1 and self._since_step >= self.hold:
+            self.level      += 1
+            self.steps_up   += 1
+            self._since_step = 0
+        elif self._calm >= self.hold and self.level > 0:
+            self.level      -= 1
+            self.steps_down += 1
+            self._since_step = 0
+            self._calm       = 0
+
+    def summary(self) -> str:
+        total = max(sum(self.scans_at), 1)
+        return "  ".join(f"{name} {100.0 * n / total:.0f}%"
+                         for name, n in zip(LEVELS, self.scans_at) if n)
@@ -0,0 +1,328 @@
+"""
+Simulated RPLidar scans ray-cast through a station map (map_server PGM).
+
+Builds a closed route through the map's free space, drives a robot along
+it at walking-tip speed and ray-casts a scan per step, with range noise,
+dropouts and people walking about.  Used by bench_slam.py; on its own it
+writes a scan log that replay.py can play back:
+
+    python3 sim_scans.py floor5lab_map_edited --seconds 120 --out sim.scanlog
+
+Ground-truth poses go to <out>.gt.csv (t, x, y, theta in the map frame).
+"""
+import argparse
+import os
+from collections import deque
+
+import cv2
+import numpy as np
+
+from map_writer import read_map_files
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# the station maps live next to the code and at the repository root
+MAP_DIRS = [os.path.join(HERE, ".."), os.path.join(HERE, "..", "..", "..")]
+STATION_MAPS = ["floor10lab_map_edited", "floor5lab_map_edited", "pitube_map2_edited"]
+
+# ── Robot / sensor ──────────────────────────────────────────────────
+SPEED_MPS       = 0.3       # the mapper's speed tip
+TURN_RATE_DPS   = 30.0      # sharper turns are made on the spot
+SCAN_RATE_HZ    = 10.0
+N_BEAMS         = 720
+MAX_RANGE_M     = 12.0      # A2M12 spec; the mapper itself cuts at 8 m
+NOISE_MM        = 10.0
+DROPOUT         = 0.02      # fraction of beams with no return
+ROUTE_CLEARANCE = 0.45      # metres from walls the route keeps
+ROUTE_SMOOTH_M  = 1.0
+
+# ── People ──────────────────────────────────────────────────────────
+PERSON_RADIUS_M = 0.20
+PERSON_SPEED    = 1.0       # m/s
+
+
+def find_map(name: str) -> str:
+    """Path of a map yaml given a path or a bare station map name."""
+    if os.path.exists(name):
+        return name
+    stem = name[:-5] if name.endswith(".yaml") else name
+    for d in MAP_DIRS:
+        path = os.path.join(d, stem + ".yaml")
+        if os.path.exists(path):
+            return os.path.normpath(path)
+    raise FileNotFoundError(f"no map yaml for {name!r} in {MAP_DIRS}")
+
+
+class StationMap:
+    """
+    A map_server map as boolean masks.  Row 0 of `occupied` / `free` is
+    the image's bottom row, so cell (row, col) = (y, x) like the mapper.
+    """
+
+    def __init__(self, yaml_path: str):
+        occ_p, meta   = read_map_files(yaml_path)
+        self.name     = os.path.splitext(os.path.basename(yaml_path))[0]
+        self.res      = float(meta["resolution"])
+        self.origin   = np.array(meta["origin"][:2], dtype=np.float64)
+        self.occupied = occ_p > float(meta.get("occupied_thresh", 0.65))
+        self.free     = occ_p < float(meta.get("free_thresh", 0.196))
+        self.shape    = occ_p.shape
+
+    def to_cell(self, xy: np.ndarray) -> np.ndarray:
+        """(…, 2) world metres → (…, 2) integer (col, row)."""
+        return np.floor((xy - self.origin) / self.res).astype(np.intp)
+
+    def to_world(self, cr: np.ndarray) -> np.ndarray:
+        return (cr + 0.5) * self.res + self.origin
+
+    def clearance(self) -> np.ndarray:
+        """Metres from every free cell to the nearest non-free cell."""
+        return cv2.distanceTransform(self.free.astype(np.uint8),
+                                     cv2.DIST_L2, 5) * self.res
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  ROUTE
+# ═══════════════════════════════════════════════════════════════════
+
+def _grid_path(ok: np.ndarray, start, goal):
+    """Shortest 8-connected path of (row, col) cells over `ok`, or None."""
+    h, w  = ok.shape
+    dist  = np.full(ok.shape, -1, dtype=np.int32)
+    dist[start] = 0
+    q = deque([start])
+    nbrs = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+    while q:
+        r, c = q.popleft()
+        if (r, c) == goal:
+            break
+        d = dist[r, c] + 1
+        for dr, dc in nbrs:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < h and 0 <= cc < w and ok[rr, cc] and dist[rr, cc] < 0:
+                dist[rr, cc] = d
+                q.append((rr, cc))
+    if dist[goal] < 0:
+        return None
+
+    path = [goal]
+    r, c = goal
+    while (r, c) != start:
+        for dr, dc in nbrs:
+            rr, cc = r + dr, c + dc
+            if 0 <= rr < h and 0 <= cc < w and dist[rr, cc] == dist[r, c] - 1:
+                r, c = rr, cc
+                break
+        path.append((r, c))
+    return path[::-1]
+
+
+def closed_route(smap: StationMap, n_waypoints: int, rng) -> np.ndarray:
+    """
+    (M, 2) world polyline visiting random well-clear waypoints of the
+    largest free region and returning to the first one.
+    """
+    ok = smap.clearance() >= ROUTE_CLEARANCE
+    n, labels, stats, _ = cv2.connectedComponentsWithStats(ok.astype(np.uint8), 8)
+    if n < 2:
+        raise ValueError(f"{smap.name}: no free space with {ROUTE_CLEARANCE} m clearance")
+    big = 1 + int(np.argmax(stats[1:, cv2.CC_STAT_AREA]))
+    ok  = labels == big
+    cells = np.argwhere(ok)
+    picks = [tuple(cells[i]) for i in rng.choice(len(cells), n_waypoints, replace=False)]
+
+    # nearest-neighbour tour so the route does not criss-cross the map
+    tour, rest = [picks[0]], picks[1:]
+    while rest:
+        last = np.array(tour[-1])
+        k = int(np.argmin([np.hypot(*(np.array(p) - last)) for p in rest]))
+        tour.append(rest.pop(k))
+    tour.append(tour[0])
+
+    cells_rc = []
+    for a, b in zip(tour[:-1], tour[1:]):
+        seg = _grid_path(ok, a, b)
+        cells_rc.extend(seg if not cells_rc else seg[1:])
+    rc = np.array(cells_rc, dtype=np.float64)
+    return smap.to_world(rc[:, ::-1])
+
+
+def sample_trajectory(route: np.ndarray, speed: float, rate: float,
+                      turn_rate_dps: float = TURN_RATE_DPS,
+                      smooth_m: float = ROUTE_SMOOTH_M) -> np.ndarray:
+    """
+    (N, 3) poses at `rate` Hz along a smoothed route, heading along the
+    direction of travel.  Where that turns faster than `turn_rate_dps`
+    (dead ends, doubling back) the robot stops and rotates in place.
+    """
+    seg  = np.hypot(*np.diff(route, axis=0).T)
+    s    = np.concatenate([[0.0], np.cumsum(seg)])
+    step = 0.05
+    u    = np.arange(0.0, s[-1], step)
+    xy   = np.column_stack([np.interp(u, s, route[:, 0]), np.interp(u, s, route[:, 1])])
+
+    k = max(1, int(smooth_m / step))
+    kern = np.ones(2 * k + 1) / (2 * k + 1)
+    pad  = np.concatenate([xy[-k:], xy, xy[:k]])          # the route is closed
+    xy   = np.column_stack([np.convolve(pad[:, i], kern, 'valid') for i in (0, 1)])
+
+    seg = np.hypot(*np.diff(xy, axis=0).T)
+    s   = np.concatenate([[0.0], np.cumsum(seg)])
+    t   = np.arange(0.0, s[-1], speed / rate)
+    x, y = np.interp(t, s, xy[:, 0]), np.interp(t, s, xy[:, 1])
+    th   = np.unwrap(np.arctan2(np.gradient(y), np.gradient(x)))
+
+    max_dth = np.radians(turn_rate_dps) / rate
+    poses = [(x[0], y[0], th[0])]
+    for i in range(1, len(x)):
+        dth = th[i] - poses[-1][2]
+        for k in range(1, int(np.ceil(abs(dth) / max_dth))):
+            poses.append((x[i - 1], y[i - 1], poses[-1][2] + np.sign(dth) * max_dth))
+        poses.append((x[i], y[i], th[i]))
+    poses = np.array(poses)
+    poses[:, 2] = np.arctan2(np.sin(poses[:, 2]), np.cos(poses[:, 2]))
+    return poses
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  PEOPLE
+# ═══════════════════════════════════════════════════════════════════
+
+class Crowd:
+    """People walking straight lines, turning away from walls at random."""
+
+    def __init__(self, smap: StationMap, n: int, near: np.ndarray, rng):
+        self.smap = smap
+        self.rng  = rng
+        self.ok   = smap.clearance() >= PERSON_RADIUS_M + 0.05
+        idx       = rng.choice(len(near), n) if n else np.empty(0, np.intp)
+        self.pos  = near[idx, :2] + rng.normal(0, 1.0, (n, 2))
+        self.head = rng.uniform(-np.pi, np.pi, n)
+        for i in range(n):
+            self.pos[i] = self._nearest_ok(self.pos[i])
+
+    def _free(self, xy) -> bool:
+        c, r = self.smap.to_cell(xy)
+        h, w = self.ok.shape
+        return 0 <= r < h and 0 <= c < w and bool(self.ok[r, c])
+
+    def _nearest_ok(self, xy):
+        for _ in range(200):
+            if self._free(xy):
+                return xy
+            xy = xy + self.rng.normal(0, 0.5, 2)
+        return xy
+
+    def step(self, dt: float):
+        for i in range(len(self.pos)):
+            for _ in range(8):
+                nxt = self.pos[i] + PERSON_SPEED * dt * np.array(
+                    [np.cos(self.head[i]), np.sin(self.head[i])])
+                if self._free(nxt):
+                    self.pos[i] = nxt
+                    break
+                self.head[i] = self.rng.uniform(-np.pi, np.pi)
+            self.head[i] += self.rng.normal(0, 0.05)
+
+
+# ═══════════════════════════════════════════════════════════════════
+#  RAY CASTING
+# ═══════════════════════════════════════════════════════════════════
+
+class LidarSim:
+    """Ray-caster returning scans in RPLidar convention (CW degrees, mm)."""
+
+    def __init__(self, smap: StationMap, rng, n_beams: int = N_BEAMS,
+                 max_range: float = MAX_RANGE_M, noise_mm: float = NOISE_MM,
+                 dropout: float = DROPOUT):
+        self.smap      = smap
+        self.rng       = rng
+        self.n_beams   = n_beams
+        self.noise_mm  = noise_mm
+        self.dropout   = dropout
+        self._steps    = np.arange(0.0, max_range, smap.res * 0.5)
+
+    def scan(self, pose, people: np.ndarray | None = None):
+        """
+        Returns
+        -------
+        angle_deg, dist_mm : (n_beams,) float32, dist 0 = no return
+        """
+        x, y, th = pose
+        phase = self.rng.uniform(0, 2 * np.pi / self.n_beams)
+        beam  = np.linspace(0, 2 * np.pi, self.n_beams, endpoint=False) + phase
+        dx, dy = np.cos(beam + th), np.sin(beam + th)
+
+        # walls: march every beam through the grid at half-cell steps
+        px = x + dx[:, None] * self._steps
+        py = y + dy[:, None] * self._steps
+        c, r = ((px - self.smap.origin[0]) / self.smap.res).astype(np.intp), \
+               ((py - self.smap.origin[1]) / self.smap.res).astype(np.intp)
+        h, w = self.smap.shape
+        inside = (c >= 0) & (c < w) & (r >= 0) & (r < h)
+        hit    = np.zeros_like(inside)
+        hit[inside] = self.smap.occupied[r[inside], c[inside]]
+        first = hit.argmax(axis=1)
+        rng_m = np.where(hit.any(axis=1), self._steps[first], np.inf)
+
+        # people: analytic ray / circle intersection
+        if people is not None and len(people):
+            ox = people[None, :, 0] - x
+            oy = people[None, :, 1] - y
+            b  = dx[:, None] * ox + dy[:, None] * oy
+            disc = b * b - (ox * ox + oy * oy - PERSON_RADIUS_M ** 2)
+            with np.errstate(invalid='ignore'):
+                t = np.where(disc >= 0, b - np.sqrt(disc), np.inf)
+            t[t <= 0] = np.inf
+            rng_m = np.minimum(rng_m, t.min(axis=1))
+
+        dist = rng_m * 1000.0 + self.rng.normal(0, self.noise_mm, self.n_beams)
+        dist[~np.isfinite(rng_m) | (self.rng.random(self.n_beams) < self.dropout)] = 0.0
+        angle = np.degrees(-beam) % 360.0               # CCW beam → A2M12 CW
+        return angle.astype(np.float32), np.maximum(dist, 0).astype(np.float32)
+
+
+def simulate(map_name: str, seconds: float, n_people: int, seed: int,
+             noise_mm: float = NOISE_MM, dropout: float = DROPOUT,
+             n_waypoints: int = 6):
+    """
+    Yield (t, gt_pose, angle_deg, dist_mm) for one run along a closed
+    route; the route is repeated if `seconds` outlasts it.
+    """
+    rng   = np.random.default_rng(seed)
+    smap  = StationMap(find_map(map_name))
+    traj  = sample_trajectory(closed_route(smap, n_waypoints, rng),
+                              SPEED_MPS, SCAN_RATE_HZ)
+    crowd = Crowd(smap, n_people, traj, rng)
+    lidar = LidarSim(smap, rng, noise_mm=noise_mm, dropout=dropout)
+    dt    = 1.0 / SCAN_RATE_HZ
+    for i in range(int(seconds * SCAN_RATE_HZ)):
+        pose = traj[i % len(traj)]
+        crowd.step(dt)
+        angle_deg, dist_mm = lidar.scan(pose, crowd.pos)
+        yield i * dt, pose, angle_deg, dist_mm
+
+
+def main():
+    from scan_log import ScanLogWriter
+
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("map", help=f"map yaml or one of {STATION_MAPS}")
+    ap.add_argument("--seconds", type=float, default=120.0)
+    ap.add_argument("--people", type=int, default=3)
+    ap.add_argument("--noise-mm", type=float, default=NOISE_MM)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", required=True, help="scan log to write")
+    args = ap.parse_args()
+
+    with ScanLogWriter(args.out, overwrite=True) as log, open(args.out + ".gt.csv", "w") as gt:
+        gt.write("t,x,y,theta\n")
+        for t, pose, angle_deg, dist_mm in simulate(
+                args.map, args.seconds, args.people, args.seed, args.noise_mm):
+            log.write_arrays(t, angle_deg, dist_mm, np.where(dist_mm > 0, 15, 0))
+            gt.write(f"{t:.2f},{pose[0]:.4f},{pose[1]:.4f},{pose[2]:.5f}\n")
+    print(f"{log.count} scans → {args.out}  (+ {args.out}.gt.csv)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import math
+import os
+import signal
+import time
+
+import numpy as np
+
+# ═══════════════════════════════════════════════════════════════════
+#  PER-STAGE TIMERS  (fixed-size latency histograms)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Every stage of the scan loop runs inside `with timers.stage(name):`.
+#  A span's duration goes into that stage's histogram — log-spaced bins
+#  from 10 µs to 10 s, so memory is fixed however long the robot runs
+#  and percentiles stay within a few percent.  Spans may nest; a stage
+#  is charged only its own time, so the stages of a scan add up to the
+#  scan.  Besides the histograms the timers keep the breakdown of the
+#  current scan (`last`) and of the slowest scan so far (`worst`), which
+#  is what points at the stage behind a serial overrun.
+#
+#  SIGUSR1 prints the summary at any time:   kill -USR1 <pid>
+
+_LO_MS      = 0.01
+_DECADES    = 6
+_PER_DECADE = 20
+_N_BINS     = _DECADES * _PER_DECADE + 2      # + underflow, overflow bins
+_EDGES_MS   = _LO_MS * 10.0 ** (np.arange(_N_BINS - 1) / _PER_DECADE)
+
+
+class _Span:
+    __slots__ = ('timers', 'name', 't0', 'child_ms')
+
+    def __init__(self, timers, name):
+        self.timers   = timers
+        self.name     = name
+        self.child_ms = 0.0
+
+    def __enter__(self):
+        self.child_ms = 0.0
+        self.timers._stack.append(self)
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        ms = 1e3 * (time.perf_counter() - self.t0)
+        stack = self.timers._stack
+        stack.pop()
+        if stack:
+            stack[-1].child_ms += ms
+        self.timers.record(self.name, ms - self.child_ms)
+        return False
+
+
+class StageTimers:
+    """
+    Latency histograms for a fixed set of stages plus the whole scan.
+
+    Parameters
+    ----------
+    stages  : stage names, in pipeline order
+    slow_ms : scans slower than this are counted in `slow_scans`
+    """
+
+    def __init__(self, stages, slow_ms: float):
+        self.stages     = tuple(stages)
+        self.slow_ms    = slow_ms
+        self.hist       = {s: np.zeros(_N_BINS, dtype=np.int64)
+                           for s in ("scan", *self.stages)}
+        self.total_ms   = dict.fromkeys(self.hist, 0.0)
+        self.max_ms     = dict.fromkeys(self.hist, 0.0)
+        self.last       = {}        # stage → ms in the current / last scan
+        self.worst      = {}        # breakdown of the slowest scan
+        self.slow_scans = 0
+        self._spans     = {s: _Span(self, s) for s in self.stages}
+        self._stack     = []
+        self._t_scan    = 0.0
+
+    def stage(self, name: str) -> _Span:
+        return self._spans[name]
+
+    def record(self, name: str, ms: float):
+        i = (0 if ms < _LO_MS else
+             min(_N_BINS - 1, 1 + int(math.log10(ms / _LO_MS) * _PER_DECADE)))
+        self.hist[name][i] += 1
+        self.total_ms[name] += ms
+        if ms > self.max_ms[name]:
+            self.max_ms[name] = ms
+        self.last[name] = self.last.get(name, 0.0) + ms
+
+    def begin_scan(self):
+        self.last.clear()
+        self._t_scan = time.perf_counter()
+
+    def end_scan(self):
+        ms = 1e3 * (time.perf_counter() - self._t_scan)
+        if ms > self.max_ms["scan"]:
+            self.worst = dict(self.last, scan=ms)
+        self.record("scan", ms)
+        self.slow_scans += ms > self.slow_ms
+
+    def count(self, name: str = "scan") -> int:
+        return int(self.hist[name].sum())
+
+    def percentile(self, name: str, q: float) -> float:
+        """Upper edge of the bin holding the q-th percentile, in ms."""
+        h = self.hist[name]
+        n = h.sum()
+        if n == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(h), q / 100.0 * n))
+        return float(min(_EDGES_MS[min(i, len(_EDGES_MS) - 1)], self.max_ms[name]))
+
+    def summary(self) -> str:
+        n = self.count()
+        lines = [f"  {'stage':<13}{'mean':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+                 f"{'max':>8}{'worst':>8}   ms  ({n} scans, "
+                 f"{self.slow_scans} over {self.slow_ms:.0f} ms)"]
+        for s in (*self.stages, "scan"):
+            c = self.count(s)
+            lines.append(
+                f"  {s:<13}{self.total_ms[s] / max(c, 1):8.2f}"
+                f"{self.percentile(s, 50):8.2f}{self.percentile(s, 95):8.2f}"
+                f"{self.percentile(s, 99):8.2f}{self.max_ms[s]:8.2f}"
+                f"{self.worst.get(s, 0.0):8.2f}")
+        return "\n".join(lines)
+
+    def install_dump_signal(self, signum=getattr(signal, "SIGUSR1", None)):
+        """
+        Print the summary on `signum` (main thread only; not on Windows).
+        Worker processes forked later inherit the handler but stay quiet.
+        """
+        if signum is None:
+            return
+        owner = os.getpid()
+
+        def dump(*_):
+            if os.getpid() == owner:
+                print("\n[PROF]\n" + self.summary(), flush=True)
+        signal.signal(signum, dump)
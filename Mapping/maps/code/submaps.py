@@ -0,0 +1,261 @@
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from map_rerender import RerenderResult, _pose_moved
+from occupancy_grid import TiledLogOddsMap
+
+# ═══════════════════════════════════════════════════════════════════
+#  SUBMAPS  (local grids the global map is composed from)
+# ═══════════════════════════════════════════════════════════════════
+#
+#  Every scan is also painted into the active submap.  This is a small
+#  TiledLogOddsMap in the frame of its anchor, the graph pose at which
+#  the submap was started.  After SUBMAP_SCANS scans it is finished and
+#  never written again.  Its occupied cells then become one loop-closure
+#  target, a dense patch of wall built from tens of scans, where a
+#  keyframe holds one.  A finished submap also makes far fewer
+#  index entries than keyframes do.
+#
+#  When optimisation moves an anchor, its whole submap moves with it.
+#  The composer repaints the global tiles under the submap's old and
+#  new footprint as the clamped log-odds sum of every retained submap
+#  that reaches them.  Each submap is resampled once at its anchor's
+#  current pose.  Unlike the keyframe re-renderer, this reproduces
+#  every scan, not just one in LC_KEYFRAME_EVERY.
+#
+#  A dense target has a cost: it reaches past the ends of any one scan,
+#  so ICP fitness saturates and a scan slid along a corridor still
+#  scores 1.0.  Two things keep such matches out.  The correlative
+#  search is centred on the submap's scan track, not its anchor, and
+#  widened by the track's extent, so the true pose is always inside
+#  the window.  And a correct match should not have beams passing
+#  through a wall the submap saw many times.
+
+
+class Submap:
+    """
+    A local log-odds grid.  `grid` cells are in the anchor's frame: cell
+    (cx, cy) covers anchor-frame [cx·res, (cx+1)·res).
+    """
+    __slots__ = ('anchor_id', 'pose', 'odom_dist', 'grid', 'scans', 'track', 'finished')
+
+    def __init__(self, anchor_id, pose, odom_dist, grid):
+        self.anchor_id = anchor_id
+        self.pose      = pose           # anchor pose it is composed into the map with
+        self.odom_dist = odom_dist      # metres driven before the anchor
+        self.grid      = grid
+        self.scans     = 0
+        self.track     = []             # anchor-frame (x, y) of every painted scan
+        self.finished  = False
+
+    def cells(self, thresh: int) -> np.ndarray:
+        """(N, 2) anchor-frame cells (cx, cy) with log-odds ≥ thresh."""
+        cells, (cx0, cy0) = self.grid.mosaic()
+        iy, ix = np.nonzero(cells >= thresh)
+        return np.column_stack([ix + cx0, iy + cy0])
+
+    def points(self, occ_thresh: int, res: float) -> np.ndarray:
+        """(N, 2) occupied cell centres in the anchor frame."""
+        return (self.cells(occ_thresh) + 0.5) * res
+
+    def reach(self):
+        """
+        ((x, y), r): centre of the box around the scan positions and its
+        half-extent.  A scan matching the submap was taken within about r
+        of the centre, wherever the anchor itself is.
+        """
+        xy = np.asarray(self.track)
+        lo, hi = xy.min(axis=0), xy.max(axis=0)
+        return tuple((lo + hi) / 2), float((hi - lo).max() / 2)
+
+
+def see_through(pose_xyt, pts: np.ndarray, walls: np.ndarray, rays, res: float,
+                margin: float) -> float:
+    """
+    Share of the beams of scan `pts` at `pose_xyt` (submap frame) that pass
+    through a wall cell.  Beams are shortened by `margin` metres so a hit
+    next to its own wall does not count.
+    """
+    if len(walls) == 0:
+        return 0.0
+    x, y, th = pose_xyt
+    c, s = np.cos(th), np.sin(th)
+    r    = np.hypot(pts[:, 0], pts[:, 1])
+    k    = np.maximum(1.0 - margin / np.maximum(r, 1e-9), 0.0)
+    ex   = x + k * (c * pts[:, 0] - s * pts[:, 1])
+    ey   = y + k * (s * pts[:, 0] + c * pts[:, 1])
+    rx, ry = int(np.floor(x / res)), int(np.floor(y / res))
+    px, py = np.floor(ex / res).astype(np.intp), np.floor(ey / res).astype(np.intp)
+    fx, fy = rays.trace(rx, ry, px, py)
+
+    wx0, wy0 = walls.min(axis=0)
+    grid = np.zeros(walls.max(axis=0) - (wx0, wy0) + 1, dtype=bool)   # (x, y)
+    grid[walls[:, 0] - wx0, walls[:, 1] - wy0] = True
+    gx, gy = fx - wx0, fy - wy0
+    ok   = (gx >= 0) & (gx < grid.shape[0]) & (gy >= 0) & (gy < grid.shape[1])
+    hit  = np.zeros(len(fx), dtype=bool)
+    hit[ok] = grid[gx[ok], gy[ok]]
+    n    = np.minimum(np.maximum(np.abs(px - rx), np.abs(py - ry)), rays.max_len)
+    beam = np.repeat(np.arange(len(n)), n)
+    return float(np.unique(beam[hit]).size) / max(len(n), 1)
+
+
+def _footprint(cells: np.ndarray, cx0: int, cy0: int, pose_xyt, res: float):
+    """Global cells (x, y) under the known cells of a local mosaic placed at a pose."""
+    iy, ix = np.nonzero(cells)
+    lx, ly = (ix + cx0 + 0.5) * res, (iy + cy0 + 0.5) * res
+    x, y, th = pose_xyt
+    c, s = np.cos(th), np.sin(th)
+    gx = np.floor((x + c * lx - s * ly) / res).astype(np.intp)
+    gy = np.floor((y + s * lx + c * ly) / res).astype(np.intp)
+    return gx, gy
+
+
+class SubmapComposer(threading.Thread):
+    """
+    Background recomposition of the tiles under moved submaps.  Same
+    interface as KeyframeRerenderer: one job at a time, submit() while
+    busy is refused, the scan loop polls for the result.
+
+    Parameters
+    ----------
+    tile, rule : geometry and log-odds rule of the live TiledLogOddsMap
+    lo, hi     : log-odds clamp applied to the sum of the submaps
+    res        : map resolution, metres per cell
+    """
+
+    def __init__(self, tile: int, rule, lo: int, hi: int, res: float,
+                 move_m: float, move_deg: float):
+        super().__init__(name="submap-composer", daemon=True)
+        self.tile       = tile
+        self.rule       = rule
+        self.lo, self.hi = lo, hi
+        self.res        = res
+        self.move_m     = move_m
+        self.move_rad   = np.radians(move_deg)
+        self.jobs       = 0
+        self.tiles_done = 0
+        self.max_ms     = 0.0
+        self._job       = None
+        self._result    = None
+        self._closed    = False
+        self._cond      = threading.Condition()
+        self.start()
+
+    @property
+    def busy(self) -> bool:
+        return self._job is not None or self._result is not None
+
+    def submit(self, submaps, born: dict, min_born: int) -> bool:
+        """
+        Queue a recomposition if any submap moved.
+
+        submaps  : [(anchor_id, painted_xyt, current_xyt, grid snapshot)]
+        born     : copy of the live map's tile → allocating stamp
+        min_born : tiles born before this stamp are never recomposed
+
+        Returns
+        -------
+        True if a job was queued
+        """
+        moved = [s for s in submaps
+                 if _pose_moved(s[1], s[2], self.move_m, self.move_rad)]
+        with self._cond:
+            if not moved or self.busy or self._closed:
+                return False
+            self._job = (submaps, moved, born, min_born)
+            self._cond.notify_all()
+        return True
+
+    def poll(self):
+        """The finished job's RerenderResult, or None."""
+        with self._cond:
+            res, self._result = self._result, None
+            self._cond.notify_all()
+        return res
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Block until the running job (if any) has a result to poll."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._job is None, timeout)
+
+    def close(self, timeout: float = 10.0):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self.join(timeout)
+
+    def run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._job is not None or self._closed)
+                if self._job is None:
+                    return
+                job = self._job
+            try:
+                res = self._compose(*job)
+            except Exception as e:
+                print(f"\n[WARN] Submap composition failed: {e}")
+                res = None
+            with self._cond:
+                self._job, self._result = None, res
+                self._cond.notify_all()
+
+    def _compose(self, submaps, moved, born, min_born):
+        t0   = time.perf_counter()
+        t    = self.tile
+        keys = TiledLogOddsMap(t, self.rule).tile_keys
+        mosaics = {s[0]: s[3].mosaic() for s in submaps}
+
+        dirty = set()
+        for anchor_id, painted, pose, _ in moved:
+            cells, (cx0, cy0) = mosaics[anchor_id]
+            for xyt in (painted, pose):
+                dirty |= keys(*_footprint(cells, cx0, cy0, xyt, self.res))
+        dirty = {k for k in dirty if born.get(k, min_born) >= min_born}
+        if not dirty:
+            return RerenderResult({}, [(s[0], s[2]) for s in moved], 0, 0.0)
+
+        tx0 = min(k[0] for k in dirty)
+        ty0 = min(k[1] for k in dirty)
+        w   = (max(k[0] for k in dirty) - tx0 + 1) * t
+        h   = (max(k[1] for k in dirty) - ty0 + 1) * t
+        acc = np.zeros((h, w), dtype=np.int16)
+        wx0, wy0 = tx0 * t, ty0 * t
+
+        used = 0
+        for anchor_id, _, pose, _ in submaps:
+            cells, (cx0, cy0) = mosaics[anchor_id]
+            gx, gy = _footprint(cells, cx0, cy0, pose, self.res)
+            if len(gx) == 0 or not keys(gx, gy) & dirty:
+                continue
+            # the part of the window this submap reaches
+            x0, x1 = max(int(gx.min()) - 1, wx0), min(int(gx.max()) + 2, wx0 + w)
+            y0, y1 = max(int(gy.min()) - 1, wy0), min(int(gy.max()) + 2, wy0 + h)
+            # window pixel (x, y) → mosaic pixel, both at cell centres
+            x, y, th = pose
+            c, s = np.cos(th), np.sin(th)
+            ox, oy = x0 + 0.5 - x / self.res, y0 + 0.5 - y / self.res
+            M = np.array([[c, s, c * ox + s * oy - 0.5 - cx0],
+                          [-s, c, -s * ox + c * oy - 0.5 - cy0]])
+            acc[y0 - wy0:y1 - wy0, x0 - wx0:x1 - wx0] += cv2.warpAffine(
+                cells.astype(np.int16), M, (x1 - x0, y1 - y0),
+                flags=cv2.INTER_NEAREST | cv2.WARP_INVERSE_MAP,
+                borderMode=cv2.BORDER_CONSTANT, borderValue=0)
+            used += 1
+
+        np.clip(acc, self.lo, self.hi, out=acc)
+        tiles = {}
+        for kx, ky in dirty:
+            r, cc = (ky - ty0) * t, (kx - tx0) * t
+            block = acc[r:r + t, cc:cc + t].astype(np.int8)
+            tiles[(kx, ky)] = block if block.any() else None
+
+        ms = 1e3 * (time.perf_counter() - t0)
+        self.jobs       += 1
+        self.tiles_done += len(tiles)
+        self.max_ms      = max(self.max_ms, ms)
+        return RerenderResult(tiles, [(s[0], s[2]) for s in moved], used, ms)
@@ -5,6 +5,8 @@ import time
 import cv2
 import yaml
 
+from nn_search import build_nn_index
+
 # ─────────────────────────────────────────────
 #  CONFIGURATION
 # ─────────────────────────────────────────────
@@ -53,13 +55,12 @@ def icp_2d(src_pts, tgt_pts,
     # Accumulated transform (starts at identity)
     T = np.eye(3)
 
+    # Spatial index over the target, built once (see nn_search.py)
+    index = build_nn_index(tgt, cell=max_dist)
+
     for _ in range(max_iter):
-        # --- 1. Find nearest neighbours (brute-force, fast enough for <500 pts)
-        # Expand dims for broadcasting: (N,1,2) - (1,M,2) → (N,M,2)
-        diff  = src[:, np.newaxis, :] - tgt[np.newaxis, :, :]
-        dists = np.linalg.norm(diff, axis=2)          # (N, M)
-        nn_idx  = np.argmin(dists, axis=1)             # closest tgt for each src
-        nn_dist = dists[np.arange(len(src)), nn_idx]   # distances
+        # --- 1. Find nearest neighbours (inf where none within max_dist)
+        nn_idx, nn_dist = index.query(src, max_dist)
 
         # Keep only close-enough correspondences
         mask = nn_dist < max_dist
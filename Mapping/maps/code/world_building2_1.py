@@ -1,68 +1,163 @@
+import argparse
+import os
 import numpy as np
 import gtsam
-from rplidar import RPLidar
-import threading
 import time
-import cv2
-import yaml
 from collections import deque
+from functools import partial
+
+from correlative_matcher import CorrelativeMatcher, LikelihoodField, compose_xyt
+from lidar_mux import MuxSource
+from lidar_reader import LidarReader, ScanRing
+from loop_closure import LoopClosureWorker
+from map_publisher import RosMapPublisher
+from keyframe_store import KeyframeStore
+from map_rerender import KeyframeRerenderer
+from map_session import load_session, save_session
+from map_writer import MapWriter, write_map_files
+from motion_model import MotionPredictor, NaoqiOdometry
+from nn_search import build_nn_index
+from scan_config import (BAUDRATE, DIST_MAX_MM, DIST_MIN_MM, ICP_MIN_POINTS,
+                         MAP_FRAME, MAX_RECONNECT_ATTEMPTS, MOTION_MAX_GAP_S,
+                         PORT_NAME, RECONNECT_DELAY_S, SCAN_MAX_POINTS,
+                         SCAN_RING_SLOTS, downsample)
+from scan_ingest import ScanParser
+from scan_log import ScanLogWriter, run_log_path
+from scan_scheduler import ScanScheduler
+from stage_timer import StageTimers
+from submaps import Submap, SubmapComposer, see_through
+from occupancy_grid import LogOddsGrid, RayTable, TiledLogOddsMap, scan_to_world
+from pose_graph import make_backend
 
 # ═══════════════════════════════════════════════════════════════════
 #  CONFIGURATION  ← only section you need to edit
 # ═══════════════════════════════════════════════════════════════════
-
-PORT_NAME  = '/dev/ttyUSB0'
-BAUDRATE   = 256000
+#
+#  The LiDAR port, range filter, scan ring, ICP voxel cell,
+#  ICP_MIN_POINTS, MOTION_MAX_GAP_S, reconnect settings and MAP_FRAME
+#  are shared with localiser.py and live in scan_config.py.
 
 # ── Map ─────────────────────────────────────────────────────────────
-RESOLUTION = 0.05          # metres per pixel  (5 cm)
-MAP_SIZE_M = 40.0          # ← increased from 20 m to 40 m (800 × 800 px)
-MAP_PIXELS = int(MAP_SIZE_M / RESOLUTION)
-
-# ── LiDAR filtering ─────────────────────────────────────────────────
-DIST_MIN_MM = 150           # drop returns < 15 cm  (self-noise)
-DIST_MAX_MM = 8000          # drop returns > 8 m    (spurious)
-
-# ── Scan processing (buffer-overflow prevention) ─────────────────────
-PROCESS_EVERY_N = 2         # only process 1-in-N raw scans
-MAX_POINTS_ICP  = 120       # downsample to this many pts for ICP
-MAX_POINTS_MAP  = 300       # denser set for map painting
+RESOLUTION  = 0.05         # metres per pixel  (5 cm)
+TILE_PIXELS = 64           # tiles allocated on first touch (3.2 × 3.2 m, 4 KB)
+
+# ── Occupancy (int8 log-odds, 1 unit = 0.1) ──────────────────────────
+LOGODDS_HIT         = 9     # +0.9 per hit   (p ≈ 0.71)
+LOGODDS_MISS        = -4    # -0.4 per miss  (p ≈ 0.40)
+LOGODDS_MIN         = -40   # clamp at p ≈ 0.02 / 0.98 so cells can
+LOGODDS_MAX         = 40    #   still flip when the world changes
+LOGODDS_OCC_THRESH  = 6     # exported as obstacle when p ≥ 0.65
+LOGODDS_FREE_THRESH = -6    # exported as free when     p ≤ 0.35
+
+# ── Scan point budgets (scan_config.downsample) ──────────────────────
+MAX_POINTS_ICP  = 720       # point budgets — the voxel grid is coarsened
+MAX_POINTS_MAP  = 720       #   until a scan fits (see downsample())
+VOXEL_MAP_M     = RESOLUTION   # painting: one hit per map cell
 
 # ── ICP ──────────────────────────────────────────────────────────────
 ICP_MAX_ITER        = 15
 ICP_MAX_DIST        = 0.5   # metres
-ICP_MIN_POINTS      = 20
 ICP_FITNESS_THRESH  = 0.30
+ICP_NN_BACKEND      = "kdtree"   # "kdtree" | "grid" | "brute"  (nn_search.py)
+
+# ── Motion prior (ICP / CSM initial guess, motion_model.py) ──────────
+MOTION_PRIOR     = True     # extrapolate the last scan-to-scan velocity
+WHEEL_ODOM_URL   = ""       # naoqi session for Pepper's odometry, e.g.
+WHEEL_ODOM_HZ    = 50       #   "tcp://192.168.1.10:9559"  ("" = off)
+
+# ── Correlative scan matcher (branch and bound, correlative_matcher.py) ─
+CSM_ENABLED        = True
+CSM_BUDGET_MS      = 20.0   # per-scan budget, field rebuild included (a time
+                            #   slice lost to a worker thread can still overrun it)
+CSM_WINDOW_M       = 0.3    # ± translation searched around the last pose
+CSM_WINDOW_DEG     = 15.0   # ± rotation
+CSM_MIN_SCORE      = 0.45   # mean likelihood needed to trust a match
+CSM_SIGMA_M        = 0.05   # likelihood-field falloff
+CSM_DEPTH          = 4      # pyramid levels: top level = 16 cells (80 cm)
+CSM_MAX_POINTS     = 360
+CSM_FIELD_REFRESH  = 10     # rebuild the map field every N scans …
+CSM_FIELD_SLACK_M  = 1.0    # … or once the robot is this far from its centre
 
 # ── Open-space detection ─────────────────────────────────────────────
 OPEN_SPACE_SECTOR_THRESH = 0.5   # < 50 % sectors filled → open space
 N_SECTORS                = 12
 
-# ── Graph memory management ──────────────────────────────────────────
+# ── Graph memory management (batch backend) ──────────────────────────
 MARGINALISE_EVERY = 50      # freeze old poses every N processed scans
 GRAPH_WINDOW      = 30      # keep this many recent poses live
 
 # ── Keyframe / loop-closure ──────────────────────────────────────────
-MAX_KEYFRAMES      = 300    # sliding window (deque) — ~600 KB fixed
+MAX_KEYFRAMES      = 300    # preallocated ring (keyframe_store.py) — ~1.7 MB fixed
 LC_KEYFRAME_EVERY  = 15     # store 1 keyframe per N processed scans
 LC_SEARCH_SKIP     = 5      # ignore the N most-recent keyframes in LC search
 LC_MATCH_THRESH    = 0.65   # min ICP fitness to accept a loop closure
-LC_MAX_DIST_M      = 3.0    # only attempt LC within this radius (m)
+LC_TOP_K           = 3      # ICP-verify this many scan-context candidates
+LC_MAX_BACKLOG     = 4      # worker queue depth before keyframes go unsearched
 LC_NOISE_SIGMAS    = np.array([0.10, 0.10, 0.03])
+LC_CSM_WINDOW_M    = 1.0    # correlative verifier window around the
+LC_CSM_WINDOW_DEG  = 20.0   #   scan-context yaw guess
+LC_CSM_MIN_SCORE   = 0.55
+LC_CSM_BUDGET_MS   = 200.0  # off the scan loop, so a looser budget
+LC_GATE_BASE_M     = 1.0    # reject a closure that moves the pose further
+LC_GATE_DRIFT      = 0.10   #   than base + this × the distance driven in between
+
+# ── Map re-render from optimised keyframe poses ─────────────────────
+REMAP_ENABLED     = True
+REMAP_CHECK_EVERY = 20     # compare keyframe poses with their painted ones every N scans
+REMAP_MOVE_M      = 0.10   # repaint a keyframe's tiles once its pose moved this far …
+REMAP_MOVE_DEG    = 2.0    # … or turned this much
+
+# ── Submaps (submaps.py) ─────────────────────────────────────────────
+SUBMAPS        = False      # compose the map from local submaps; LC matches against them
+                            #   (off: no accuracy gain over keyframes on the station runs yet)
+SUBMAP_SCANS   = 50         # processed scans per submap (~1.5 m at the speed tip)
+MAX_SUBMAPS    = 200        # sliding window (deque); older map tiles stay as composed
+SUBMAP_LC_SKIP = 1          # ignore the N newest finished submaps in LC search
+SUBMAP_WALL    = 25         # log-odds of a submap cell seen as wall by many scans …
+LC_SEE_THROUGH = 0.15       # … reject a submap match with more beams than this through one
 
 # ── GTSAM optimiser ──────────────────────────────────────────────────
-OPTIMISE_EVERY = 10
+GRAPH_BACKEND  = "batch"    # "batch" | "isam2" | "fixed_lag"  (pose_graph.py)
+OPTIMISE_EVERY = 10         # batch: LM every N processed scans
 OPT_MAX_ITER   = 20
-
-# ── Reconnect logic ──────────────────────────────────────────────────
-# If the LiDAR throws an exception (descriptor bytes error), the code
-# will attempt to reconnect this many times before giving up.
-MAX_RECONNECT_ATTEMPTS = 5
-RECONNECT_DELAY_S      = 2.0
+ISAM2_RELIN_THRESH = 0.01   # relinearise a pose once its delta exceeds this
+ISAM2_LC_UPDATES   = 2      # extra iSAM2 passes after a loop closure
+FIXED_LAG_POSES    = 600    # fixed_lag: smoother window (~60 s at 10 Hz)
+GRAPH_STALL_MS     = 20.0   # graph calls slower than this count as stalls
+
+# ── Resumable sessions (map_session.py) ─────────────────────────────
+SAVE_SESSION      = True    # also write <name>.session.npz for --resume
+RESUME_WINDOW_M   = 1.0     # relocalise the first scan within this of the
+RESUME_WINDOW_DEG = 180.0   #   saved final pose (or the map origin), any heading
+RESUME_MIN_SCORE  = 0.50
+RESUME_BUDGET_MS  = 3000.0  # one-off search, before mapping starts
+
+# ── Live map on ROS 2 (map_publisher.py; needs rclpy, nav_msgs, map_msgs) ─
+ROS_PUBLISH_MAP   = False   # /map + /map_updates for RViz / Nav2 while mapping
+MAP_PUBLISH_HZ    = 1.0     # snapshots handed to the publisher per second
+MAP_FULL_EVERY_S  = 10.0    # full grid for late subscribers; patches in between
+
+# ── Profiling ────────────────────────────────────────────────────────
+PROFILE_SUMMARY_S = 60        # print per-stage latency every N s (0 = off)
+PROFILE_SLOW_MS   = 100.0     # scans slower than one A2M12 revolution
+PIPELINE_STAGES   = ("parse", "icp", "csm", "factor", "marginalise",
+                     "loop_closure", "optimise", "keyframe", "map", "autosave")
+
+# ── Load shedding (scan_scheduler.py; live / real-time replay only) ──
+SCHED_ENABLED     = True
+SCHED_BUDGET      = 0.9     # share of one LiDAR revolution a scan may take
+SCHED_RELAX       = 0.6     # step back down below this share …
+SCHED_HOLD        = 20      # … for N drop-free scans; also the min gap between steps
+SCHED_ICP_SCALE   = 0.5     # lighter odometry: ICP on this × MAX_POINTS_ICP …
+SCHED_CSM_SCALE   = 0.5     # … and a CSM window this × CSM_WINDOW_M / _DEG
+SCHED_LC_EVERY    = 2       # thinned LC: search 1 keyframe in N
+SCHED_PAINT_EVERY = 2       # thinned map: paint 1 scan in N
 
 # ── Output ───────────────────────────────────────────────────────────
 AUTOSAVE_EVERY = 100        # write .pgm every N processed scans (0 = off)
 OUTPUT_NAME    = "floor10_3"
+RECORD_LOG     = f"{OUTPUT_NAME}.scanlog"   # raw scans for replay.py ("" = off); each run
+                                           #   adds its start time: <name>_<date-time>.scanlog
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -81,23 +176,32 @@ def _rss_mb() -> float:
 
 
 # ═══════════════════════════════════════════════════════════════════
-#  2-D ICP  (pure numpy)
+#  2-D ICP  (numpy + spatial index)
 # ═══════════════════════════════════════════════════════════════════
 
 def icp_2d(src_pts: np.ndarray, tgt_pts: np.ndarray,
            max_iter: int = ICP_MAX_ITER,
            tolerance: float = 1e-5,
-           max_dist: float = ICP_MAX_DIST):
+           max_dist: float = ICP_MAX_DIST,
+           tgt_index=None):
+    """
+    Point-to-point ICP.  Pass a prebuilt `tgt_index` (nn_search) when the
+    same target is matched more than once; otherwise one is built here.
+
+    Returns
+    -------
+    (dx, dy, dtheta, fitness, iterations)
+    """
     src  = src_pts.copy()
     tgt  = tgt_pts
     T    = np.eye(3)
     mask = np.zeros(len(src), dtype=bool)
+    if tgt_index is None:
+        tgt_index = build_nn_index(tgt, ICP_NN_BACKEND, ICP_MAX_DIST)
 
-    for _ in range(max_iter):
-        diff    = src[:, np.newaxis, :] - tgt[np.newaxis, :, :]
-        dists   = np.linalg.norm(diff, axis=2)
-        nn_idx  = np.argmin(dists, axis=1)
-        nn_dist = dists[np.arange(len(src)), nn_idx]
+    n_iter = 0
+    for n_iter in range(1, max_iter + 1):
+        nn_idx, nn_dist = tgt_index.query(src, max_dist)
         mask    = nn_dist < max_dist
         if mask.sum() < 4:
             break
@@ -123,15 +227,42 @@ def icp_2d(src_pts: np.ndarray, tgt_pts: np.ndarray,
             break
 
     fitness = float(mask.sum()) / max(len(src_pts), 1)
-    return T[0, 2], T[1, 2], np.arctan2(T[1, 0], T[0, 0]), fitness
-
-
-def downsample(points, max_pts: int) -> np.ndarray:
-    arr = np.array(points, dtype=np.float64)
-    if len(arr) <= max_pts:
-        return arr
-    step = max(1, len(arr) // max_pts)
-    return arr[::step][:max_pts]
+    return T[0, 2], T[1, 2], np.arctan2(T[1, 0], T[0, 0]), fitness, n_iter
+
+
+def verify_loop_closure(src_pts: np.ndarray, kf_pts: np.ndarray, kf_index,
+                        yaw: float, submap=None, *, matcher: CorrelativeMatcher,
+                        rays: RayTable):
+    """
+    Correlative search of the current scan against a keyframe (or submap)
+    around the scan-context yaw, refined by ICP.  Runs in the loop-closure
+    worker.  A submap target is (walls, centre, reach): the search is
+    centred on its scan track and widened by `reach`, and a match whose
+    beams cross its strong `walls` cells (see_through) is rejected.
+
+    Returns
+    -------
+    ((dx, dy, dtheta), fitness)  keyframe → current,  or None if the
+    correlative score is below the matcher's min_score
+    """
+    (x0, y0), win = (0.0, 0.0), LC_CSM_WINDOW_M
+    if submap is not None:
+        walls, (x0, y0), reach = submap
+        win += reach
+    field = LikelihoodField.from_points(kf_pts, RESOLUTION, CSM_SIGMA_M,
+                                        CSM_DEPTH, win)
+    seed, _ = matcher.match(field, downsample(src_pts, CSM_MAX_POINTS),
+                            (x0, y0, yaw), win, np.radians(LC_CSM_WINDOW_DEG))
+    if seed is None:
+        return None
+    dx, dy, dt, fitness, _ = icp_2d(scan_to_world(seed, src_pts), kf_pts,
+                                    max_iter=20, max_dist=ICP_MAX_DIST * 1.5,
+                                    tgt_index=kf_index)
+    rel = compose_xyt((dx, dy, dt), seed)
+    if submap is not None and see_through(rel, src_pts, walls, rays, RESOLUTION,
+                                         3 * RESOLUTION) > LC_SEE_THROUGH:
+        return None
+    return rel, fitness
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -152,12 +283,14 @@ def scan_sector_coverage(pts: np.ndarray, n: int = N_SECTORS) -> float:
 # ═══════════════════════════════════════════════════════════════════
 
 class Keyframe:
-    __slots__ = ('pose_id', 'pose', 'pts')
+    """One KeyframeStore slot, as handed to loop-closure checks."""
+    __slots__ = ('pose_id', 'pose', 'pts', 'odom_dist')
 
-    def __init__(self, pose_id, pose, pts):
-        self.pose_id = pose_id
-        self.pose    = pose
-        self.pts     = pts
+    def __init__(self, pose_id, pose, pts, odom_dist):
+        self.pose_id   = pose_id
+        self.pose      = pose           # pose its scan is painted into the map with
+        self.pts       = pts
+        self.odom_dist = odom_dist      # metres driven before this keyframe
 
 
 # ═══════════════════════════════════════════════════════════════════
@@ -166,12 +299,9 @@ class Keyframe:
 
 class SLAMMapper:
 
-    def __init__(self):
+    def __init__(self, resume: str | None = None):
         # ── GTSAM ──────────────────────────────────────────────────────
-        self.graph             = gtsam.NonlinearFactorGraph()
-        self.current_estimates = gtsam.Values()
-        self.pose_id           = 0
-        self._frontier_id      = 0
+        self.pose_id = 0
 
         self._prior_noise    = gtsam.noiseModel.Diagonal.Sigmas(np.array([0.05, 0.05, 0.02]))
         self._odo_noise      = gtsam.noiseModel.Diagonal.Sigmas(np.array([0.15, 0.15, 0.05]))
@@ -179,174 +309,415 @@ class SLAMMapper:
         self._fallback_noise = gtsam.noiseModel.Diagonal.Sigmas(np.array([0.50, 0.50, 0.20]))
         self._lc_noise       = gtsam.noiseModel.Diagonal.Sigmas(LC_NOISE_SIGMAS)
 
-        start = gtsam.Pose2(0.0, 0.0, 0.0)
-        self.graph.add(gtsam.PriorFactorPose2(0, start, self._prior_noise))
-        self.current_estimates.insert(0, start)
-
-        # ── Occupancy grid (127=unknown | 0=obstacle | 255=free) ────────
-        self.grid_map = np.full((MAP_PIXELS, MAP_PIXELS), 127, dtype=np.uint8)
+        self.backend = self._make_backend(0, gtsam.Pose2(0.0, 0.0, 0.0))
 
-        # ── ICP state ──────────────────────────────────────────────────
-        self.prev_scan_pts = None
+        # ── Occupancy map (tiled int8 log-odds, exported via grid_map) ──
+        self.occupancy = TiledLogOddsMap(
+            TILE_PIXELS,
+            LogOddsGrid(LOGODDS_HIT, LOGODDS_MISS, LOGODDS_MIN, LOGODDS_MAX))
+        self._rays    = RayTable(int(np.ceil(DIST_MAX_MM / 1000.0 / RESOLUTION)) + 2)
 
-        # ── Keyframe sliding-window deque ───────────────────────────────
-        self.keyframes: deque[Keyframe] = deque(maxlen=MAX_KEYFRAMES)
+        # ── Scan ingestion (range gate + trig tables, A2M12 CW → CCW) ──
+        self.parser = ScanParser(DIST_MIN_MM, DIST_MAX_MM, ccw=True)
 
-        # ── Async optimiser ─────────────────────────────────────────────
-        self._opt_lock   = threading.Lock()
-        self._opt_thread = None
+        # ── ICP state ──────────────────────────────────────────────────
+        self.prev_scan_pts   = None
+        self.prev_scan_index = None     # NN index, built once per target
+        self.icp_iters       = np.zeros(ICP_MAX_ITER + 1, dtype=np.int64)
+
+        # ── Motion prior (constant velocity, or Pepper's wheel odometry) ─
+        self.wheel_odom = None
+        if WHEEL_ODOM_URL:
+            try:
+                self.wheel_odom = NaoqiOdometry(WHEEL_ODOM_URL, WHEEL_ODOM_HZ)
+            except Exception as e:
+                print(f"\n[WARN] No wheel odometry ({e}) — constant velocity only.")
+        self.motion = MotionPredictor(MOTION_MAX_GAP_S, self.wheel_odom)
+
+        # ── Correlative matcher: ICP seed + open-space fallback ─────────
+        self.csm            = CorrelativeMatcher(CSM_BUDGET_MS, CSM_MIN_SCORE)
+        self._csm_field     = None
+        self._csm_centre    = (0.0, 0.0)
+        self._csm_age       = 0
+        self.csm_odom_count = 0         # scans where CSM stood in for ICP
+
+        # ── Keyframe ring (preallocated, keyframe_store.py) ─────────────
+        self.keyframes = KeyframeStore(MAX_KEYFRAMES, MAX_POINTS_ICP)
+
+        # ── Loop-closure worker (own scan-context index, same capacity) ──
+        self.lc_worker = LoopClosureWorker(
+            partial(verify_loop_closure,
+                    matcher=CorrelativeMatcher(LC_CSM_BUDGET_MS, LC_CSM_MIN_SCORE),
+                    rays=self._rays),
+            capacity=MAX_KEYFRAMES, top_k=LC_TOP_K,
+            skip_recent=SUBMAP_LC_SKIP if SUBMAPS else LC_SEARCH_SKIP,
+            match_thresh=LC_MATCH_THRESH, max_backlog=LC_MAX_BACKLOG,
+            nn_backend=ICP_NN_BACKEND, nn_cell=ICP_MAX_DIST)
 
         # ── Stats ───────────────────────────────────────────────────────
         self.scans_processed   = 0
         self.icp_ok_count      = 0
         self.icp_fail_count    = 0
         self.lc_count          = 0
+        self.lc_stale          = 0
+        self.lc_rejected       = 0
+        self.odom_dist         = 0.0
         self.marginalise_count = 0
         self._t_start          = time.time()
         self._last_mem_log     = time.time()
+        self._last_prof_log    = time.time()
+        self.timers            = StageTimers(PIPELINE_STAGES, PROFILE_SLOW_MS)
+        self.scheduler         = ScanScheduler(SCHED_BUDGET, SCHED_RELAX, SCHED_HOLD,
+                                               SCHED_ICP_SCALE, SCHED_CSM_SCALE,
+                                               SCHED_LC_EVERY, SCHED_PAINT_EVERY)
+
+        # ── Background map saves (autosave / reconnect) ─────────────────
+        self.map_writer = MapWriter()
+
+        # ── Submaps: every scan also goes into the active local grid ────
+        self.submaps: deque[Submap] = deque(maxlen=MAX_SUBMAPS)
+
+        # ── Tile re-render after keyframe (or submap) poses move ────────
+        if SUBMAPS:
+            self.rerenderer = SubmapComposer(TILE_PIXELS, self.occupancy.rule,
+                                             LOGODDS_MIN, LOGODDS_MAX, RESOLUTION,
+                                             REMAP_MOVE_M, REMAP_MOVE_DEG)
+        else:
+            self.rerenderer = KeyframeRerenderer(TILE_PIXELS, self.occupancy.rule,
+                                                 self._scan_cells,
+                                                 REMAP_MOVE_M, REMAP_MOVE_DEG)
+        self.rerender_tiles = 0
+
+        # ── Live map for RViz / Nav2 (optional) ─────────────────────────
+        self.map_pub       = None
+        self._last_map_pub = 0.0
+        if ROS_PUBLISH_MAP:
+            try:
+                self.map_pub = RosMapPublisher(
+                    RESOLUTION, TILE_PIXELS, LOGODDS_OCC_THRESH, LOGODDS_FREE_THRESH,
+                    MAP_FULL_EVERY_S, frame_id=MAP_FRAME)
+            except Exception as e:
+                print(f"\n[WARN] No ROS 2 map publishing ({e}).")
+
+        # ── Resumed session: poses below session_start are frozen ───────
+        self.session_start = 0
+        self._reloc_from   = None       # candidate start poses, until relocalised
+        self.reloc_score   = None
+        if resume:
+            self._resume(resume)
 
     # ── helpers ──────────────────────────────────────────────────────
 
-    def _world_to_pixel(self, wx, wy):
-        c = MAP_PIXELS // 2
-        return int(c + wx / RESOLUTION), int(c + wy / RESOLUTION)
-
-    # ── graph marginalisation ─────────────────────────────────────────
+    @property
+    def grid_map(self) -> np.ndarray:
+        """Cropped PGM image (127=unknown | 0=obstacle | 255=free)."""
+        return self.occupancy.to_pgm(LOGODDS_OCC_THRESH, LOGODDS_FREE_THRESH)[0]
+
+    @staticmethod
+    def _world_to_cell(wx, wy):
+        return int(np.floor(wx / RESOLUTION)), int(np.floor(wy / RESOLUTION))
+
+    # ── pose graph ────────────────────────────────────────────────────
+
+    def _make_backend(self, start_id: int, start: gtsam.Pose2):
+        return make_backend(
+            GRAPH_BACKEND, gtsam.PriorFactorPose2(start_id, start, self._prior_noise),
+            start, window=GRAPH_WINDOW, opt_max_iter=OPT_MAX_ITER, lag=FIXED_LAG_POSES,
+            relin_thresh=ISAM2_RELIN_THRESH, lc_extra_updates=ISAM2_LC_UPDATES,
+            stall_ms=GRAPH_STALL_MS, start_id=start_id)
+
+    def current_pose(self) -> gtsam.Pose2:
+        return self.backend.estimate(self.pose_id)
+
+    def add_odometry(self, delta, noise) -> gtsam.Pose2:
+        """Append the next pose, seeded by composing delta onto the last one."""
+        new_p = self.current_pose().compose(delta)
+        self.pose_id   += 1
+        self.odom_dist += np.hypot(delta.x(), delta.y())
+        self.backend.add(
+            [gtsam.BetweenFactorPose2(self.pose_id - 1, self.pose_id, delta, noise)],
+            {self.pose_id: new_p})
+        return new_p
 
     def marginalise_old_poses(self):
-        """
-        Rebuild the factor graph keeping only the most recent GRAPH_WINDOW
-        poses.  Older poses are frozen; a tight prior anchors the new frontier.
-        Keeps graph at a fixed O(GRAPH_WINDOW) size for arbitrarily long runs.
-        """
-        if self.pose_id - self._frontier_id <= GRAPH_WINDOW:
-            return
-
-        new_frontier = self.pose_id - GRAPH_WINDOW
-        anchor_pose  = self.current_estimates.atPose2(new_frontier)
-        anchor_noise = gtsam.noiseModel.Diagonal.Sigmas(np.array([0.01, 0.01, 0.005]))
-
-        new_graph  = gtsam.NonlinearFactorGraph()
-        new_values = gtsam.Values()
-
-        new_graph.add(gtsam.PriorFactorPose2(new_frontier, anchor_pose, anchor_noise))
-
-        for pid in range(new_frontier, self.pose_id + 1):
-            if self.current_estimates.exists(pid):
-                new_values.insert(pid, self.current_estimates.atPose2(pid))
-
-        for i in range(self.graph.size()):
-            factor = self.graph.at(i)
-            # factor.keys() may return a plain list OR a gtsam.KeyVector
-            # depending on the installed GTSAM Python binding version.
-            # Wrapping in list() normalises both cases safely.
-            keys = list(factor.keys())
-            if all(k >= new_frontier for k in keys):
-                new_graph.add(factor)
-
-        self.graph             = new_graph
-        self.current_estimates = new_values
-        self._frontier_id      = new_frontier
-        self.marginalise_count += 1
+        """Batch backend only — the incremental ones bound themselves."""
+        if self.backend.marginalise(self.pose_id):
+            self.marginalise_count += 1
 
     # ── odometry ─────────────────────────────────────────────────────
 
-    def get_odometry(self, pts_full: np.ndarray):
-        pts        = downsample(pts_full, MAX_POINTS_ICP)
+    def get_odometry(self, pts_full: np.ndarray, stamp: float | None = None):
+        """
+        Scan-to-scan ICP, seeded by a correlative scan-to-map search
+        centred on the motion prior (or by the prior alone when the
+        search finds nothing).  When ICP fails (typically open space) but
+        the correlative match is good, the seed itself becomes the
+        odometry.  `stamp` is the scan time in seconds; without it the
+        prior is the identity.
+        """
+        delta, noise, ok = self._match(pts_full, stamp)
+        self.motion.update(stamp, (delta.x(), delta.y(), delta.theta()), ok)
+        return delta, noise, ok
+
+    def _match(self, pts_full, stamp):
+        pts        = downsample(pts_full, self.scheduler.icp_points(MAX_POINTS_ICP))
         open_space = scan_sector_coverage(pts) < OPEN_SPACE_SECTOR_THRESH
 
         if self.prev_scan_pts is None or len(self.prev_scan_pts) < ICP_MIN_POINTS:
-            self.prev_scan_pts = pts
+            if self._reloc_from is not None:
+                self._relocalise(pts)
+            self._set_icp_target(pts)
             return gtsam.Pose2(0.0, 0.0, 0.0), self._fallback_noise, False
 
-        dx, dy, dtheta, fitness = icp_2d(pts, self.prev_scan_pts)
-        self.prev_scan_pts = pts
+        prior = gtsam.Pose2(*self.motion.predict(stamp)) if MOTION_PRIOR \
+            else gtsam.Pose2(0.0, 0.0, 0.0)
+        with self.timers.stage("csm"):
+            seed = self._csm_seed(pts, prior)
+        guess = prior if seed is None else seed
+        src   = scan_to_world((guess.x(), guess.y(), guess.theta()), pts)
+        dx, dy, dtheta, fitness, n_iter = icp_2d(src, self.prev_scan_pts,
+                                                 tgt_index=self.prev_scan_index)
+        self.icp_iters[n_iter] += 1
+        self._set_icp_target(pts)
 
         if fitness < ICP_FITNESS_THRESH:
             self.icp_fail_count += 1
+            if seed is not None:
+                self.csm_odom_count += 1
+                return seed, self._open_noise, True
             return (gtsam.Pose2(0.0, 0.0, 0.0),
                     self._open_noise if open_space else self._fallback_noise,
                     False)
 
         self.icp_ok_count += 1
-        return (gtsam.Pose2(dx, dy, dtheta),
+        delta = gtsam.Pose2(dx, dy, dtheta).compose(guess)
+        return (delta,
                 self._open_noise if open_space else self._odo_noise,
                 True)
 
-    # ── loop closure ─────────────────────────────────────────────────
+    def _csm_seed(self, pts, prior: gtsam.Pose2):
+        """Correlative match of the scan against the map around last pose ∘ prior, as a delta."""
+        if not CSM_ENABLED or not self.occupancy.tiles:
+            return None
+        t0    = time.perf_counter()              # a field rebuild counts against the budget
+        prev  = self.current_pose()
+        guess = prev.compose(prior)
+        field = self._csm_field_at(guess.x(), guess.y())
+        win   = self.scheduler.csm_window        # narrowed under load
+        pose, _ = self.csm.match(field, downsample(pts, CSM_MAX_POINTS),
+                                 (guess.x(), guess.y(), guess.theta()),
+                                 win * CSM_WINDOW_M, np.radians(win * CSM_WINDOW_DEG), t0)
+        return None if pose is None else prev.between(gtsam.Pose2(*pose))
+
+    def icp_iter_stats(self):
+        """(mean iterations, share of matches that hit ICP_MAX_ITER)."""
+        n = max(self.icp_iters.sum(), 1)
+        return (float(self.icp_iters @ np.arange(len(self.icp_iters))) / n,
+                self.icp_iters[-1] / n)
+
+    def _csm_field_at(self, x, y) -> LikelihoodField:
+        """Likelihood field of the mapped obstacles around (x, y), cached."""
+        self._csm_age += 1
+        if (self._csm_field is not None and self._csm_age < CSM_FIELD_REFRESH
+                and np.hypot(x - self._csm_centre[0],
+                             y - self._csm_centre[1]) < CSM_FIELD_SLACK_M):
+            return self._csm_field
+
+        half = DIST_MAX_MM / 1000.0 + CSM_WINDOW_M + CSM_FIELD_SLACK_M
+        cx0, cy0 = self._world_to_cell(x - half, y - half)
+        n   = int(np.ceil(2 * half / RESOLUTION))
+        occ = self.occupancy.window(cx0, cy0, n, n) >= LOGODDS_OCC_THRESH
+        self._csm_field  = LikelihoodField(occ, (cx0 * RESOLUTION, cy0 * RESOLUTION),
+                                           RESOLUTION, CSM_SIGMA_M, CSM_DEPTH)
+        self._csm_centre = (x, y)
+        self._csm_age    = 0
+        return self._csm_field
+
+    def _set_icp_target(self, pts):
+        self.prev_scan_pts   = pts
+        self.prev_scan_index = build_nn_index(pts, ICP_NN_BACKEND, ICP_MAX_DIST)
 
-    def try_loop_closure(self, cur_pose, cur_pts) -> bool:
-        kf_list = list(self.keyframes)
-        if len(kf_list) <= LC_SEARCH_SKIP:
-            return False
-
-        best_fitness = LC_MATCH_THRESH
-        best_kf = best_dx = best_dy = best_dt = None
+    # ── loop closure ─────────────────────────────────────────────────
 
-        for kf in kf_list[:-LC_SEARCH_SKIP]:
-            if kf.pose_id < self._frontier_id:
+    def apply_loop_closures(self) -> int:
+        """
+        Add the constraints the worker has verified since the last scan.
+        Never waits: a keyframe still being searched is picked up on a
+        later scan.
+        """
+        added = 0
+        for lc in self.lc_worker.poll():
+            kf  = self._submap(lc.kf_id) or self._keyframe(lc.kf_id)
+            cur = self._keyframe(lc.cur_id)
+            # a resumed session's keyframe is fixed: the match pins the
+            # current pose directly instead of joining two graph poses
+            frozen = lc.kf_id < self.session_start
+            # either end may have been marginalised while the worker ran
+            if (kf is None or cur is None or lc.cur_id < self.backend.frontier_id
+                    or (lc.kf_id < self.backend.frontier_id and not frozen)):
+                self.lc_stale += 1
                 continue
-            d = np.hypot(cur_pose.x() - kf.pose.x(),
-                         cur_pose.y() - kf.pose.y())
-            if d > LC_MAX_DIST_M:
+
+            # a match much further away than odometry can have drifted is a
+            # look-alike place (symmetric corridors, repeated pillars)
+            rel   = gtsam.Pose2(*lc.rel)
+            moved = (kf.pose if frozen else self.backend.estimate(lc.kf_id)).compose(rel)
+            est   = self.backend.estimate(lc.cur_id)
+            if (np.hypot(moved.x() - est.x(), moved.y() - est.y())
+                    > LC_GATE_BASE_M + LC_GATE_DRIFT * (cur.odom_dist - kf.odom_dist)):
+                self.lc_rejected += 1
                 continue
-            dx, dy, dt, fitness = icp_2d(cur_pts, kf.pts,
-                                         max_iter=20,
-                                         max_dist=ICP_MAX_DIST * 1.5)
-            if fitness > best_fitness:
-                best_fitness = fitness
-                best_kf, best_dx, best_dy, best_dt = kf, dx, dy, dt
-
-        if best_kf is None:
-            return False
-
-        self.graph.add(gtsam.BetweenFactorPose2(
-            best_kf.pose_id, self.pose_id,
-            gtsam.Pose2(best_dx, best_dy, best_dt),
-            self._lc_noise))
-        self.lc_count += 1
-        return True
+
+            self.backend.add_loop_closure(
+                gtsam.PriorFactorPose2(lc.cur_id, moved, self._lc_noise) if frozen else
+                gtsam.BetweenFactorPose2(lc.kf_id, lc.cur_id, rel, self._lc_noise))
+            added += 1
+        self.lc_count += added
+        return added
+
+    def _keyframe(self, pose_id):
+        kfs = self.keyframes
+        i   = kfs.find(pose_id)
+        if i is None:
+            return None
+        return Keyframe(pose_id, gtsam.Pose2(*kfs.poses[i]), kfs.pts(i), float(kfs.odom[i]))
+
+    def _submap(self, anchor_id):
+        for sub in reversed(self.submaps):
+            if sub.anchor_id == anchor_id:
+                return sub
+        return None
 
     def maybe_add_keyframe(self, proc_i, pose, pts):
         if proc_i % LC_KEYFRAME_EVERY == 0:
-            self.keyframes.append(Keyframe(self.pose_id, pose, pts.copy()))
+            self.keyframes.append(self.pose_id, (pose.x(), pose.y(), pose.theta()),
+                                  pts, self.odom_dist)
+            # under load (scan_scheduler.py) most keyframes go unsearched
+            search = self.scheduler.search_lc(proc_i // LC_KEYFRAME_EVERY)
+            if search or not SUBMAPS:
+                self.lc_worker.submit(self.pose_id, pts,
+                                      min_pose_id=self.backend.frontier_id,
+                                      frozen_below=self.session_start,
+                                      search=search, index=not SUBMAPS)
 
     # ── async optimiser ───────────────────────────────────────────────
 
-    def trigger_optimise(self):
-        if self._opt_thread and self._opt_thread.is_alive():
-            return
-
-        def _run():
-            with self._opt_lock:
-                try:
-                    params = gtsam.LevenbergMarquardtParams()
-                    params.setMaxIterations(OPT_MAX_ITER)
-                    result = gtsam.LevenbergMarquardtOptimizer(
-                        self.graph, self.current_estimates, params).optimize()
-                    self.current_estimates = result
-                except Exception as e:
-                    print(f"\n[WARN] Optimiser: {e}")
-
-        self._opt_thread = threading.Thread(target=_run, daemon=True)
-        self._opt_thread.start()
+    def trigger_optimise(self, after_loop_closure: bool = False):
+        """
+        Kick the background LM (batch backend; a no-op for iSAM2).  Never
+        waits: after a loop closure a busy optimiser just queues a rerun.
+        """
+        self.backend.optimise_async(urgent=after_loop_closure)
 
     # ── map update ────────────────────────────────────────────────────
 
     def update_map(self, pose, pts_full: np.ndarray):
-        pts   = downsample(pts_full, MAX_POINTS_MAP)
-        rx,ry = self._world_to_pixel(pose.x(), pose.y())
-        cos_t = np.cos(pose.theta())
-        sin_t = np.sin(pose.theta())
-
-        for lx, ly in pts:
-            gx = pose.x() + lx * cos_t - ly * sin_t
-            gy = pose.y() + lx * sin_t + ly * cos_t
-            px, py = self._world_to_pixel(gx, gy)
-            if not (0 <= px < MAP_PIXELS and 0 <= py < MAP_PIXELS):
-                continue
-            cv2.line(self.grid_map, (rx, ry), (px, py), 255, 1)
-            self.grid_map[py, px] = 0
+        """
+        Batch update: one transform for the whole scan, all free cells
+        traced at once from the ray table, then one log-odds miss/hit
+        pass over the tiles the scan touches.
+        """
+        pts = downsample(pts_full, MAX_POINTS_MAP, VOXEL_MAP_M)
+        fx, fy, px, py = self._scan_cells((pose.x(), pose.y(), pose.theta()), pts)
+        self.occupancy.update(fx, fy, px, py, stamp=self.pose_id)
+        if SUBMAPS:
+            self._insert_submap(pose, pts)
+
+    def _insert_submap(self, pose, pts):
+        """
+        Paint the scan into the active submap, relative to its anchor's
+        current estimate; start a submap here if none is active.  A full
+        one is finished and handed to the loop-closure index.
+        """
+        sub = self.submaps[-1] if self.submaps else None
+        if sub is None or sub.finished:
+            sub = Submap(self.pose_id, pose, self.odom_dist,
+                         TiledLogOddsMap(TILE_PIXELS, self.occupancy.rule))
+            self.submaps.append(sub)
+        anchor = (self.backend.estimate(sub.anchor_id)
+                  if sub.anchor_id >= self.backend.frontier_id else sub.pose)
+        rel = anchor.between(pose)
+        sub.grid.update(*self._scan_cells((rel.x(), rel.y(), rel.theta()), pts))
+        sub.track.append((rel.x(), rel.y()))
+        sub.scans += 1
+        if sub.scans >= SUBMAP_SCANS:
+            sub.finished = True
+            self.lc_worker.submit(sub.anchor_id,
+                                  sub.points(LOGODDS_OCC_THRESH, RESOLUTION),
+                                  search=False,
+                                  target=(sub.cells(SUBMAP_WALL), *sub.reach()))
+
+    def _scan_cells(self, pose_xyt, pts):
+        """Global (free x, free y, hit x, hit y) cells of a scan at a pose."""
+        rx, ry = self._world_to_cell(pose_xyt[0], pose_xyt[1])
+        world  = scan_to_world(pose_xyt, pts)
+        cells  = np.floor(world / RESOLUTION).astype(np.intp)
+        px, py = cells[:, 0], cells[:, 1]
+        fx, fy = self._rays.trace(rx, ry, px, py)
+        return fx, fy, px, py
+
+    def maybe_rerender(self, proc_i):
+        """
+        Every REMAP_CHECK_EVERY scans hand the keyframes (or submaps) to the
+        re-renderer, which repaints the tiles of those whose estimate left
+        the painted pose.  Poses behind the graph frontier are frozen and
+        not queried.
+        """
+        if not REMAP_ENABLED or proc_i % REMAP_CHECK_EVERY or self.rerenderer.busy:
+            return
+        if SUBMAPS:
+            items = [(s.anchor_id, (s.pose.x(), s.pose.y(), s.pose.theta()),
+                      s.grid.snapshot()) for s in self.submaps]
+        else:
+            kfs   = self.keyframes
+            order = kfs.slots()
+            pts   = kfs.points[order]       # a copy: the ring may wrap mid-job
+            items = [(int(kfs.pose_ids[i]), tuple(kfs.poses[i]), pts[j, :kfs.counts[i]])
+                     for j, i in enumerate(order)]
+        if not items:
+            return
+        frontier, jobs = self.backend.frontier_id, []
+        for pose_id, painted, data in items:
+            cur = painted
+            if pose_id >= frontier:
+                est = self.backend.estimate(pose_id)
+                cur = (est.x(), est.y(), est.theta())
+            jobs.append((pose_id, painted, cur, data))
+        self.rerenderer.submit(jobs, dict(self.occupancy.born), items[0][0])
+
+    def apply_rerender(self) -> int:
+        """Swap in tiles the re-renderer has finished.  Returns the count."""
+        res = self.rerenderer.poll()
+        if res is None:
+            return 0
+        for key, tile in res.tiles.items():
+            if tile is None:
+                self.occupancy.tiles.pop(key, None)
+                self.occupancy.born.pop(key, None)
+            else:
+                self.occupancy.tiles[key] = tile
+                self.occupancy.born.setdefault(key, self.pose_id)
+        for pose_id, xyt in res.moved:
+            if SUBMAPS:
+                sub = self._submap(pose_id)
+                if sub is not None:
+                    sub.pose = gtsam.Pose2(*xyt)
+            else:
+                i = self.keyframes.find(pose_id)
+                if i is not None:
+                    self.keyframes.poses[i] = xyt
+        self._csm_field = None          # the seed field was cut from the old tiles
+        self.rerender_tiles += len(res.tiles)
+        return len(res.tiles)
+
+    def maybe_publish_map(self, force: bool = False):
+        """Hand a map snapshot to the ROS publisher at MAP_PUBLISH_HZ."""
+        now = time.monotonic()
+        if self.map_pub is None or (not force and
+                                    now - self._last_map_pub < 1.0 / MAP_PUBLISH_HZ):
+            return
+        self.map_pub.submit(self.occupancy.snapshot())
+        self._last_map_pub = now
 
     # ── memory log ────────────────────────────────────────────────────
 
@@ -354,27 +725,118 @@ class SLAMMapper:
         now = time.time()
         if now - self._last_mem_log > 60:
             rss  = _rss_mb()
-            live = self.pose_id - self._frontier_id
+            live = self.pose_id - self.backend.frontier_id
             print(f"\n[MEM] RSS={rss:.0f} MB | "
                   f"live_poses={live} | "
                   f"keyframes={len(self.keyframes)}/{MAX_KEYFRAMES} | "
+                  f"submaps={len(self.submaps)} | "
+                  f"tiles={len(self.occupancy.tiles)} | "
                   f"margin={self.marginalise_count} | "
-                  f"LC={self.lc_count}")
+                  f"LC={self.lc_count} "
+                  f"(backlog {self.lc_worker.backlog}, "
+                  f"{self.lc_worker.mean_latency_ms():.0f} ms) | "
+                  f"csm={self.csm_odom_count} "
+                  f"(max {self.csm.max_ms:.0f} ms, {self.csm.timeouts} t/o) | "
+                  f"stalls={self.backend.stalls} "
+                  f"(max {self.backend.max_call_ms:.1f} ms)")
             self._last_mem_log = now
 
+    def _log_profile(self):
+        now = time.time()
+        if PROFILE_SUMMARY_S and now - self._last_prof_log > PROFILE_SUMMARY_S:
+            print("\n[PROF]\n" + self.timers.summary())
+            self._last_prof_log = now
+
     # ── save ─────────────────────────────────────────────────────────
 
-    def save_output(self, name: str = OUTPUT_NAME):
-        pgm = f"{name}.pgm"
-        yml = f"{name}.yaml"
-        cv2.imwrite(pgm, self.grid_map)
-        origin = [-(MAP_PIXELS//2)*RESOLUTION,
-                  -(MAP_PIXELS//2)*RESOLUTION, 0.0]
-        with open(yml, 'w') as f:
-            yaml.dump({"image": pgm, "resolution": RESOLUTION,
-                       "origin": origin, "negate": 0,
-                       "occupied_thresh": 0.65, "free_thresh": 0.196},
-                      f, default_flow_style=False)
+    def _render(self, occupancy: TiledLogOddsMap):
+        """map_server image + yaml fields of an occupancy map (or snapshot)."""
+        img, (cx0, cy0) = occupancy.to_pgm(LOGODDS_OCC_THRESH, LOGODDS_FREE_THRESH)
+        return img, {"resolution": RESOLUTION,
+                     "origin": [cx0 * RESOLUTION, cy0 * RESOLUTION, 0.0],
+                     "negate": 0, "occupied_thresh": 0.65, "free_thresh": 0.196}
+
+    def write_map(self, name: str):
+        """Write <name>.pgm + <name>.yaml now, cropped to the explored area."""
+        img, meta = self._render(self.occupancy)
+        pgm, yml  = write_map_files(name, img, meta)
+        return pgm, yml, img.shape
+
+    def save_map_async(self, name: str):
+        """Snapshot the map and let the writer thread save it."""
+        snap = self.occupancy.snapshot()
+        self.map_writer.submit(name, lambda: self._render(snap))
+
+    def save_session(self, name: str) -> str:
+        """Write <name>.session.npz for a later --resume."""
+        path = f"{name}.session.npz"
+        est  = {k: (p.x(), p.y(), p.theta())
+                for k, p in self.backend.all_estimates().items()}
+        kf   = self.keyframes
+        kfs  = [(int(kf.pose_ids[i]), tuple(kf.poses[i]), float(kf.odom[i]), kf.pts(i))
+                for i in kf.slots()]
+        save_session(path, RESOLUTION, self.occupancy, kfs, est,
+                     self.pose_id, self.odom_dist)
+        return path
+
+    def _resume(self, path: str):
+        """
+        Load a saved session.  Its map and keyframes stay as they are; the
+        new poses continue after its last pose id, and the first scan is
+        relocalised against the map before a new graph is started there.
+        """
+        s = load_session(path, RESOLUTION, TILE_PIXELS)
+        self.occupancy.tiles = s.tiles
+        self.occupancy.born  = s.born
+        for pose_id, xyt, odom_dist, pts in s.keyframes:
+            self.keyframes.append(pose_id, xyt, pts, odom_dist)
+            self.lc_worker.submit(pose_id, pts, search=False)
+        self.lc_worker.wait(timeout=30.0)     # index them before the first search
+
+        self.session_start = s.pose_id + 1
+        self.pose_id       = self.session_start
+        self.odom_dist     = s.odom_dist
+        self._reloc_from   = [gtsam.Pose2(*s.last_pose), gtsam.Pose2(0.0, 0.0, 0.0)]
+        self.backend.close()
+        self.backend = self._make_backend(self.pose_id, self._reloc_from[0])
+        print(f"[INFO] Resuming {path}: {len(s.tiles)} tiles, "
+              f"{len(s.keyframes)} keyframes, poses from {self.pose_id}")
+
+    def _relocalise(self, pts):
+        """
+        Correlative search for the first resumed scan around the saved final
+        pose, then around the map origin (where the first session started,
+        e.g. a dock).  The new graph starts where it matches; without a
+        match it starts at the saved pose, right if the robot was not moved.
+        """
+        cands, self._reloc_from = self._reloc_from, None
+        matcher = CorrelativeMatcher(RESUME_BUDGET_MS, RESUME_MIN_SCORE)
+        scan    = downsample(pts, CSM_MAX_POINTS)
+        half    = DIST_MAX_MM / 1000.0 + RESUME_WINDOW_M
+        n       = int(np.ceil(2 * half / RESOLUTION))
+        for prev in cands:
+            cx0, cy0 = self._world_to_cell(prev.x() - half, prev.y() - half)
+            occ   = self.occupancy.window(cx0, cy0, n, n) >= LOGODDS_OCC_THRESH
+            field = LikelihoodField(occ, (cx0 * RESOLUTION, cy0 * RESOLUTION),
+                                    RESOLUTION, CSM_SIGMA_M, CSM_DEPTH)
+            pose, self.reloc_score = matcher.match(
+                field, scan, (prev.x(), prev.y(), prev.theta()),
+                RESUME_WINDOW_M, np.radians(RESUME_WINDOW_DEG))
+            if pose is not None:
+                break
+        else:
+            print(f"\n[WARN] Relocalisation failed (score {self.reloc_score:.2f}) "
+                  f"— continuing from the saved pose.")
+            return
+        start = gtsam.Pose2(*pose)
+        self.backend.close()
+        self.backend = self._make_backend(self.pose_id, start)
+        print(f"\n[INFO] Relocalised at x={start.x():+.2f} y={start.y():+.2f} "
+              f"th={np.degrees(start.theta()):+.1f}d  (score {self.reloc_score:.2f})")
+
+    def save_output(self, name: str = OUTPUT_NAME, reader=None):
+        pgm, yml, (h, w) = self.write_map(name)
+        session = self.save_session(name) if SAVE_SESSION else None
 
         elapsed = time.time() - self._t_start
         total   = self.icp_ok_count + self.icp_fail_count
@@ -382,197 +844,300 @@ class SLAMMapper:
         rss     = _rss_mb()
         print(f"\n{'='*56}")
         print(f"  Map saved        ->  {pgm}  +  {yml}")
-        print(f"  Map size         :   {MAP_SIZE_M:.0f} x {MAP_SIZE_M:.0f} m  "
-              f"({MAP_PIXELS} x {MAP_PIXELS} px)")
+        if session:
+            print(f"  Session saved    ->  {session}  (--resume to extend the map)")
+        print(f"  Map size         :   {w * RESOLUTION:.1f} x {h * RESOLUTION:.1f} m  "
+              f"({w} x {h} px)")
+        print(f"  Tiles            :   {len(self.occupancy.tiles)}  "
+              f"({self.occupancy.memory_bytes() / 1024:.0f} KB)")
         print(f"  Scans processed  :   {self.scans_processed}")
+        if reader is not None:
+            ring = reader.ring
+            print(f"  LiDAR scans      :   {ring.written} read, {ring.dropped} dropped "
+                  f"({ring.drop_pct:.0f}%), {reader.reconnects} reconnects")
         print(f"  ICP success      :   {self.icp_ok_count}/{total}  ({pct:.0f}%)")
-        print(f"  Loop closures    :   {self.lc_count}")
+        it_mean, it_cap = self.icp_iter_stats()
+        print(f"  ICP iterations   :   mean {it_mean:.1f}  ({100 * it_cap:.0f}% hit "
+              f"the {ICP_MAX_ITER} cap; prior from velocity {self.motion.from_velocity}, "
+              f"wheels {self.motion.from_wheel})")
+        lcw = self.lc_worker
+        print(f"  CSM odometry     :   {self.csm_odom_count} scans  "
+              f"(worst {self.csm.max_ms:.1f} ms, {self.csm.timeouts} over "
+              f"{CSM_BUDGET_MS:.0f} ms budget)")
+        print(f"  Loop closures    :   {self.lc_count}  "
+              f"({lcw.searched} keyframes searched, {lcw.skipped} skipped, "
+              f"{lcw.indexed_only} index only, {lcw.backlog} pending, "
+              f"{self.lc_stale} stale, {self.lc_rejected} rejected)")
+        print(f"  LC latency       :   mean {lcw.mean_latency_ms():.0f} ms  "
+              f"worst {lcw.max_latency_ms:.0f} ms")
         print(f"  Marginalisations :   {self.marginalise_count}")
+        print(f"  Graph stalls     :   {self.backend.stalls}  "
+              f"(> {GRAPH_STALL_MS:.0f} ms, worst {self.backend.max_call_ms:.1f} ms)")
+        if SCHED_ENABLED and any(self.scheduler.scans_at):
+            sc = self.scheduler
+            print(f"  Load shedding    :   {sc.summary()}  ({sc.steps_up} up, "
+                  f"{sc.steps_down} down; budget {sc.budget_ms:.0f} ms)")
+        rr = self.rerenderer
+        print(f"  Map re-renders   :   {rr.jobs}  ({self.rerender_tiles} tiles, "
+              f"worst {rr.max_ms:.0f} ms)")
+        if SUBMAPS:
+            sub_kb = sum(sm.grid.memory_bytes() for sm in self.submaps) / 1024
+            print(f"  Submaps          :   {len(self.submaps)} kept  "
+                  f"({sum(sm.finished for sm in self.submaps)} finished, {sub_kb:.0f} KB)")
+        if self.map_pub is not None:
+            mp = self.map_pub
+            print(f"  ROS map publish  :   {mp.fulls} grids ({mp.full_bytes / 1e3:.0f} kB), "
+                  f"{mp.patches} patches ({mp.patch_bytes / 1e3:.0f} kB), "
+                  f"worst {mp.max_ms:.0f} ms")
+        mw = self.map_writer
+        print(f"  Background saves :   {mw.saves}  ({mw.superseded} superseded, "
+              f"{mw.failures} failed, worst {mw.max_ms:.0f} ms)")
         print(f"  Peak RSS         :   {rss:.0f} MB")
         print(f"  Runtime          :   {elapsed:.0f}s")
         print(f"{'='*56}")
-
-
-# ═══════════════════════════════════════════════════════════════════
-#  LIDAR CONTEXT MANAGER  (handles reconnection on packet errors)
-# ═══════════════════════════════════════════════════════════════════
-
-def connect_lidar():
-    """Connect and return a running RPLidar instance."""
-    lidar = RPLidar(PORT_NAME, baudrate=BAUDRATE)
-    time.sleep(0.5)   # let the motor spin up
-    return lidar
-
-
-def disconnect_lidar(lidar):
-    try:
-        lidar.stop()
-        lidar.disconnect()
-    except Exception:
-        pass
+        print(self.timers.summary())
 
 
 # ═══════════════════════════════════════════════════════════════════
 #  ENTRY POINT
 # ═══════════════════════════════════════════════════════════════════
 
-def main():
-    mapper = SLAMMapper()
+def process_scan(mapper: SLAMMapper, proc_i: int, angle_deg: np.ndarray,
+                 dist_mm: np.ndarray, output_name: str = OUTPUT_NAME,
+                 stamp: float | None = None):
+    """
+    One pass of the SLAM pipeline on a raw revolution (RPLidar degrees
+    and millimetres) taken at `stamp` (seconds, for the motion prior).
+    Shared by the live loop and replay.py.
+
+    Returns
+    -------
+    (cur_pose, icp_ok),  or None if the scan had too few valid returns
+    """
+    timers = mapper.timers
+    timers.begin_scan()
+
+    # ── 1. Parse & filter ─────────────────────────────────────────────
+    with timers.stage("parse"):
+        pts_arr = mapper.parser.points(angle_deg, dist_mm)
+        if len(pts_arr) < ICP_MIN_POINTS:
+            return None
+
+    # ── 2. ICP odometry (the CSM seed is timed as its own stage) ──────
+    with timers.stage("icp"):
+        delta, noise, icp_ok = mapper.get_odometry(pts_arr, stamp)
+
+    # ── 3. Add odometry factor ────────────────────────────────────────
+    with timers.stage("factor"):
+        mapper.add_odometry(delta, noise)
+
+    # ── 4. Marginalise old poses ──────────────────────────────────────
+    if proc_i % MARGINALISE_EVERY == 0 and proc_i > 0:
+        with timers.stage("marginalise"):
+            mapper.marginalise_old_poses()
+
+    # ── 5. Loop closures found by the worker since last scan ──────────
+    with timers.stage("loop_closure"):
+        lc_found = mapper.apply_loop_closures() > 0
+
+    with timers.stage("optimise"):
+        cur_pose = mapper.current_pose()
+        if lc_found:
+            mapper.trigger_optimise(after_loop_closure=True)
+            # incremental backends have already applied the correction
+            cur_pose = mapper.current_pose()
+        elif proc_i % OPTIMISE_EVERY == 0:
+            mapper.trigger_optimise()
+
+    # ── 6. Store keyframe (queued for loop-closure search) ────────────
+    with timers.stage("keyframe"):
+        icp_pts = downsample(pts_arr, MAX_POINTS_ICP)
+        mapper.maybe_add_keyframe(proc_i, cur_pose, icp_pts)
+
+    # ── 7. Map update (thinned under load, scan_scheduler.py) ─────────
+    with timers.stage("map"):
+        if mapper.scheduler.paint(proc_i):
+            mapper.update_map(cur_pose, pts_arr)
+        mapper.apply_rerender()
+        mapper.maybe_rerender(proc_i)
+        mapper.maybe_publish_map()
+
+    # ── 8. Auto-save ──────────────────────────────────────────────────
+    if AUTOSAVE_EVERY and proc_i > 0 and proc_i % AUTOSAVE_EVERY == 0:
+        with timers.stage("autosave"):
+            mapper.save_map_async(output_name)
+        print(f"\n[SAVE] Auto-save queued at scan {proc_i}")
+
+    # ── 9. Memory / profile log ───────────────────────────────────────
+    mapper._log_memory()
+    mapper._log_profile()
+    timers.end_scan()
+    return cur_pose, icp_ok
+
+
+def print_status(mapper: SLAMMapper, raw_i: int, proc_i: int, drop_pct: float,
+                 cur_pose, icp_ok: bool):
+    lc_tag = f" LC={mapper.lc_count}" if mapper.lc_count else ""
+    if mapper.lc_worker.backlog:
+        lc_tag += f" lcq={mapper.lc_worker.backlog}"
+    if mapper.scheduler.level:
+        lc_tag += f" shed={mapper.scheduler.level}"
+    print(
+        f"raw={raw_i:6d}  proc={proc_i:5d}  "
+        f"drop={drop_pct:3.0f}%  "
+        f"ICP={'ok' if icp_ok else '--'}  "
+        f"x={cur_pose.x():+.2f}m  y={cur_pose.y():+.2f}m  "
+        f"th={np.degrees(cur_pose.theta()):+5.1f}d  "
+        f"kf={len(mapper.keyframes)}{lc_tag}",
+        end='\r'
+    )
+
+
+def run_slam(mapper: SLAMMapper, source, output_name: str = OUTPUT_NAME):
+    """
+    Process the newest scan of `source.ring` until the source stops or
+    Ctrl-C.  `source` is the LidarReader, lidar_mux.MuxSource or
+    replay.py's log player — anything with a ring, `failed`, `reconnects`
+    and is_alive().
+    """
+    ring   = source.ring
+    proc_i = 0
+    last_i = None
+    saved_reconnects = 0
 
+    try:
+        while True:
+            # ── 0. Newest scan from the reader thread ─────────────────────
+            item = ring.take_newest(timeout=1.0)
+            if item is None:
+                if source.failed is not None or not source.is_alive():
+                    break
+                continue
+            raw_i, stamp, angle_deg, dist_mm = item
+
+            # Save what we have whenever the reader had to reconnect
+            if source.reconnects != saved_reconnects:
+                saved_reconnects = source.reconnects
+                mapper.save_map_async(f"{output_name}_reconnect_{saved_reconnects}")
+                print(f"\n[INFO] Saving partial map after reconnect {saved_reconnects}.")
+
+            out = process_scan(mapper, proc_i, angle_deg, dist_mm, output_name, stamp)
+            skipped = raw_i - last_i - 1 if last_i is not None else 0
+            last_i  = raw_i
+            if out is None:
+                continue
+            if SCHED_ENABLED:
+                mapper.scheduler.observe(mapper.timers.last["scan"], skipped, stamp)
+            print_status(mapper, raw_i, proc_i, ring.drop_pct, *out)
+
+            proc_i += 1
+            mapper.scans_processed = proc_i
+
+    except KeyboardInterrupt:
+        print("\n\nCtrl-C — saving map…")
+
+    except Exception as e:
+        # The reader thread owns every serial error, so anything raised
+        # here is a code bug and must surface immediately.
+        import traceback
+        print(f"\n[ERROR] Processing exception — stopping: {e}")
+        traceback.print_exc()
+
+
+def finish(mapper: SLAMMapper, source=None, output_name: str = OUTPUT_NAME):
+    """Stop the scan source and the background workers, then save."""
+    if source is not None:
+        source.stop()
+    mapper.backend.wait(timeout=5.0)    # let an in-flight optimisation land
+    mapper.backend.close()
+    mapper.lc_worker.close()
+    if mapper.rerenderer.wait(timeout=10.0):
+        mapper.apply_rerender()
+    mapper.rerenderer.close()
+    mapper.map_writer.close()           # an autosave must not land after the final save
+    if mapper.map_pub is not None:
+        mapper.maybe_publish_map(force=True)
+        mapper.map_pub.close()
+    if mapper.wheel_odom is not None:
+        mapper.wheel_odom.close()
+    mapper.save_output(output_name, reader=source)
+
+
+def print_banner(source_desc: str):
     print("=" * 60)
     print("  GTSAM 2-D SLAM  —  RPLidar A2M12")
     print("=" * 60)
-    print(f"  Map size         : {MAP_SIZE_M:.0f} x {MAP_SIZE_M:.0f} m  "
-          f"({MAP_PIXELS} x {MAP_PIXELS} px)")
-    print(f"  Processing       : every {PROCESS_EVERY_N} raw scans")
+    print(f"  Scan source      : {source_desc}")
+    print(f"  Map              : unbounded, {TILE_PIXELS} px tiles "
+          f"@ {RESOLUTION * 100:.0f} cm")
+    print(f"  Processing       : newest of a {SCAN_RING_SLOTS}-slot scan ring")
     print(f"  ICP pts / Map pts: {MAX_POINTS_ICP} / {MAX_POINTS_MAP}")
-    print(f"  Graph window     : {GRAPH_WINDOW} poses  "
-          f"(marginalise every {MARGINALISE_EVERY} scans)")
-    print(f"  Keyframe store   : {MAX_KEYFRAMES} sliding window")
+    print("  Motion prior     : "
+          + ("off" if not MOTION_PRIOR else
+             f"wheel odometry {WHEEL_ODOM_URL}, else constant velocity" if WHEEL_ODOM_URL
+             else "constant velocity"))
+    if GRAPH_BACKEND == "batch":
+        print(f"  Graph window     : {GRAPH_WINDOW} poses  "
+              f"(marginalise every {MARGINALISE_EVERY} scans)")
+    else:
+        print(f"  Graph backend    : {GRAPH_BACKEND}"
+              + (f"  (lag {FIXED_LAG_POSES} poses)" if GRAPH_BACKEND == "fixed_lag" else ""))
+    print(f"  Keyframe store   : {MAX_KEYFRAMES} ring, "
+          f"{MAX_KEYFRAMES * MAX_POINTS_ICP * 8 / 1e6:.1f} MB preallocated")
+    if SUBMAPS:
+        print(f"  Submaps          : {SUBMAP_SCANS} scans each, "
+              f"{MAX_SUBMAPS} sliding window")
+    print(f"  Loop closure     : background worker, top-{LC_TOP_K} scan-context")
     print(f"  Auto-save        : every {AUTOSAVE_EVERY} processed scans")
-    print(f"  Reconnect        : up to {MAX_RECONNECT_ATTEMPTS} attempts")
-    print("  Speed tip        : < 0.3 m/s,  < 15 deg/s")
-    print("  Ctrl-C to stop and save.\n")
+    if SCHED_ENABLED:
+        print(f"  Load shedding    : scan budget {SCHED_BUDGET:.0%} of a revolution")
+    if ROS_PUBLISH_MAP:
+        print(f"  ROS 2 map        : /map + /map_updates at {MAP_PUBLISH_HZ:g} Hz "
+              f"(full grid every {MAP_FULL_EVERY_S:g} s)")
+    print(f"  Profiling        : stage summary every {PROFILE_SUMMARY_S} s, "
+          f"kill -USR1 {os.getpid()} for one now")
 
-    raw_i  = 0
-    proc_i = 0
-    reconnect_attempts = 0
-    lidar = None
 
-    while True:
+def main():
+    ap = argparse.ArgumentParser(description="GTSAM 2-D SLAM with an RPLidar A2M12")
+    ap.add_argument("--resume", metavar="SESSION",
+                    help="extend the map saved in SESSION (<name>.session.npz)")
+    ap.add_argument("--shm", metavar="NAME",
+                    help="read the shared scan ring of a running lidar_mux.py "
+                         "instead of opening the serial port")
+    args = ap.parse_args()
+
+    if args.shm:
+        # The driver owns the port, the reconnects and any recording
+        # (lidar_mux.py --record); this process only reads its ring.
         try:
-            # ── Connect ──────────────────────────────────────────────────
-            print(f"[INFO] Connecting to LiDAR on {PORT_NAME}…")
-            lidar = connect_lidar()
-            print("[INFO] LiDAR connected.\n")
-            reconnect_attempts = 0   # reset on successful connect
-
-            for scan in lidar.iter_scans():
-                raw_i += 1
-
-                # ── Drop scans to stay ahead of serial buffer ─────────────
-                if raw_i % PROCESS_EVERY_N != 0:
-                    continue
-
-                # ── 1. Parse & filter ─────────────────────────────────────
-                points = []
-                for (_, angle_deg, dist_mm) in scan:
-                    if not (DIST_MIN_MM < dist_mm < DIST_MAX_MM):
-                        continue
-                    d = dist_mm / 1000.0
-                    a = -np.radians(angle_deg)   # A2M12 CW → CCW
-                    points.append([d * np.cos(a), d * np.sin(a)])
-
-                if len(points) < ICP_MIN_POINTS:
-                    continue
-
-                pts_arr = np.array(points, dtype=np.float64)
-
-                # ── 2. ICP odometry ───────────────────────────────────────
-                delta, noise, icp_ok = mapper.get_odometry(pts_arr)
-
-                # ── 3. Add odometry factor ────────────────────────────────
-                with mapper._opt_lock:
-                    prev  = mapper.current_estimates.atPose2(mapper.pose_id)
-                    new_p = prev.compose(delta)
-                    mapper.pose_id += 1
-                    mapper.current_estimates.insert(mapper.pose_id, new_p)
-                    mapper.graph.add(gtsam.BetweenFactorPose2(
-                        mapper.pose_id - 1, mapper.pose_id, delta, noise))
-
-                # ── 4. Marginalise old poses ──────────────────────────────
-                if proc_i % MARGINALISE_EVERY == 0 and proc_i > 0:
-                    with mapper._opt_lock:
-                        mapper.marginalise_old_poses()
-
-                # ── 5. Loop closure ───────────────────────────────────────
-                with mapper._opt_lock:
-                    cur_pose = mapper.current_estimates.atPose2(mapper.pose_id)
-
-                icp_pts = downsample(pts_arr, MAX_POINTS_ICP)
-                with mapper._opt_lock:
-                    lc_found = mapper.try_loop_closure(cur_pose, icp_pts)
-
-                if lc_found:
-                    if mapper._opt_thread and mapper._opt_thread.is_alive():
-                        mapper._opt_thread.join(timeout=2.0)
-                    mapper.trigger_optimise()
-                elif proc_i % OPTIMISE_EVERY == 0:
-                    mapper.trigger_optimise()
-
-                # ── 6. Store keyframe ─────────────────────────────────────
-                mapper.maybe_add_keyframe(proc_i, cur_pose, icp_pts)
-
-                # ── 7. Map update ─────────────────────────────────────────
-                mapper.update_map(cur_pose, pts_arr)
-
-                # ── 8. Auto-save ──────────────────────────────────────────
-                if AUTOSAVE_EVERY and proc_i > 0 and proc_i % AUTOSAVE_EVERY == 0:
-                    cv2.imwrite(f"{OUTPUT_NAME}.pgm", mapper.grid_map)
-                    print(f"\n[SAVE] Auto-saved at scan {proc_i}")
-
-                # ── 9. Memory log ─────────────────────────────────────────
-                mapper._log_memory()
-
-                # ── 10. Status line ───────────────────────────────────────
-                lc_tag = f" LC={mapper.lc_count}" if mapper.lc_count else ""
-                print(
-                    f"raw={raw_i:6d}  proc={proc_i:5d}  "
-                    f"ICP={'ok' if icp_ok else '--'}  "
-                    f"x={cur_pose.x():+.2f}m  y={cur_pose.y():+.2f}m  "
-                    f"th={np.degrees(cur_pose.theta()):+5.1f}d  "
-                    f"kf={len(mapper.keyframes)}{lc_tag}",
-                    end='\r'
-                )
-
-                proc_i += 1
-                mapper.scans_processed = proc_i
-
-        except KeyboardInterrupt:
-            print("\n\nCtrl-C — saving map…")
-            break
+            reader = MuxSource(args.shm)
+        except FileNotFoundError:
+            print(f"[ERROR] No shared scan ring '{args.shm}' — start lidar_mux.py first.")
+            return
 
-        except Exception as e:
-            # Only reconnect on known serial / LiDAR transport errors.
-            # Any other exception (AttributeError, ValueError, etc.) is a
-            # code bug and must surface immediately rather than loop forever.
-            lidar_keywords = (
-                "descriptor", "bytes", "serial", "timeout",
-                "connection", "rplidar", "checksum", "sync",
-            )
-            err_str = str(e).lower()
-            is_lidar_error = any(kw in err_str for kw in lidar_keywords)
-
-            if not is_lidar_error:
-                import traceback
-                print(f"\n[ERROR] Non-LiDAR exception — stopping: {e}")
-                traceback.print_exc()
-                break   # fall through to save_output, don't reconnect
-
-            # ── Reconnect on LiDAR packet errors ─────────────────────────
-            reconnect_attempts += 1
-            print(f"\n[WARN] LiDAR error (attempt {reconnect_attempts}/"
-                  f"{MAX_RECONNECT_ATTEMPTS}): {e}")
-
-            disconnect_lidar(lidar)
-            lidar = None
-
-            if reconnect_attempts >= MAX_RECONNECT_ATTEMPTS:
-                print("[ERROR] Too many reconnect failures — saving and exiting.")
-                break
+    mapper = SLAMMapper(resume=args.resume)
+    mapper.timers.install_dump_signal()
 
-            # Save what we have so far before reconnecting
-            cv2.imwrite(f"{OUTPUT_NAME}_reconnect_{reconnect_attempts}.pgm",
-                        mapper.grid_map)
-            print(f"[INFO] Partial map saved. Retrying in {RECONNECT_DELAY_S}s…")
-            time.sleep(RECONNECT_DELAY_S)
-            # Continue outer while loop → reconnects
+    record = run_log_path(RECORD_LOG) if RECORD_LOG and not args.shm else ""
+    if args.shm:
+        print_banner(f"shared ring '{args.shm}' (lidar_mux.py)")
+    else:
+        print_banner(f"{PORT_NAME}  (recording → {record})" if record else PORT_NAME)
+        print(f"  Reconnect        : up to {MAX_RECONNECT_ATTEMPTS} attempts")
+    print("  Speed tip        : < 0.3 m/s,  < 15 deg/s")
+    print("  Ctrl-C to stop and save.\n")
 
-    # ── Final cleanup ─────────────────────────────────────────────────
-    if lidar:
-        disconnect_lidar(lidar)
-    mapper.save_output()
+    if not args.shm:
+        recorder = ScanLogWriter(record) if record else None
+        reader   = LidarReader(PORT_NAME, BAUDRATE,
+                               ScanRing(SCAN_RING_SLOTS, SCAN_MAX_POINTS),
+                               MAX_RECONNECT_ATTEMPTS, RECONNECT_DELAY_S,
+                               recorder=recorder)
+        reader.start()
+    run_slam(mapper, reader)
+    finish(mapper, reader)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -6,6 +6,8 @@ import time
 import cv2
 import yaml
 
+from nn_search import build_nn_index
+
 # ═══════════════════════════════════════════════════════════════════
 #  CONFIGURATION  — tune these without touching the rest of the code
 # ═══════════════════════════════════════════════════════════════════
@@ -62,12 +64,10 @@ def icp_2d(src_pts: np.ndarray, tgt_pts: np.ndarray,
     tgt  = tgt_pts
     T    = np.eye(3)
     mask = np.zeros(len(src), dtype=bool)
+    index = build_nn_index(tgt, cell=max_dist)   # once per target scan
 
     for _ in range(max_iter):
-        diff    = src[:, np.newaxis, :] - tgt[np.newaxis, :, :]  # (N,M,2)
-        dists   = np.linalg.norm(diff, axis=2)                    # (N,M)
-        nn_idx  = np.argmin(dists, axis=1)
-        nn_dist = dists[np.arange(len(src)), nn_idx]
+        nn_idx, nn_dist = index.query(src, max_dist)
 
         mask = nn_dist < max_dist
         if mask.sum() < 4:
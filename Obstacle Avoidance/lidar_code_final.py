@@ -1,8 +1,15 @@
+import os
+import sys
 import numpy as np
 from rplidar import RPLidar
 import time
 from sklearn.cluster import DBSCAN
 
+# shared scan parser: next to this file in the docker, in the mapper code in the repo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "..", "Mapping", "maps", "code"))
+from scan_ingest import ScanParser
+
 import rclpy
 
 from geometry_msgs.msg import Twist
@@ -11,6 +18,7 @@ from std_msgs.msg import String
 
 PORT_NAME = '/dev/ttyUSB0'
 BAUDRATE = 256000
+LIDAR_SHM = "" # Shared scan ring of a running lidar_mux.py, e.g. "hcrt_scans" ("" = open PORT_NAME here)
 SAFE_DISTANCE = 0.30 # Edited from 0.75 for integration test
 SELF_FILTER_DIST = 0.15
 MAX_DETECTION_RANGE = 4.0
@@ -69,9 +77,45 @@ def find_safe_move(obstacles_dict):
             if is_safe: return candidate
     return None
 
+class SerialScans:
+    # Owns the LiDAR itself - nothing else can read it while this runs
+    def __init__(self, parser):
+        self.parser = parser
+        self.lidar = RPLidar(PORT_NAME, baudrate=BAUDRATE)
+
+    def __iter__(self):
+        for scan in self.lidar.iter_scans():
+            yield self.parser.parse(scan)
+
+    def close(self):
+        self.lidar.stop(); self.lidar.disconnect()
+
+
+class SharedScans:
+    # Newest revolution from lidar_mux.py's ring, parsed in place (no copy)
+    def __init__(self, parser):
+        from lidar_mux import ShmScanRing
+        self.parser = parser
+        self.ring = ShmScanRing.attach(LIDAR_SHM)
+
+    def __iter__(self):
+        while True:
+            item = self.ring.take_newest(timeout=1.0)
+            if item is None:
+                if not self.ring.driver_alive: return
+                continue
+            _, _, angle_deg, dist_mm = item
+            yield self.parser.points(angle_deg, dist_mm)
+
+    def close(self):
+        self.ring.detach()
+
+
 def main():
+    # raw clockwise frame (ccw=False), which the avoidance logic is tuned in
+    parser = ScanParser(SELF_FILTER_DIST * 1000, MAX_DETECTION_RANGE * 1000, ccw=False)
     try:
-        lidar = RPLidar(PORT_NAME, baudrate=BAUDRATE)
+        scans = SharedScans(parser) if LIDAR_SHM else SerialScans(parser)
         print("System Online. Walk toward LiDAR to test...")
     except Exception as e:
         print(f"Error: {e}"); return
@@ -90,14 +134,12 @@ def main():
     pos_msg = String()
 
     try:
-        for scan in lidar.iter_scans():
-            points = [[d/1000 * np.cos(np.radians(a)), d/1000 * np.sin(np.radians(a))]
-                      for (_, a, d) in scan if SELF_FILTER_DIST < d/1000 < MAX_DETECTION_RANGE]
-            if not points: continue
+        for points in scans:
+            if len(points) == 0: continue
 
             # Cluster
             clustering = DBSCAN(eps=0.25, min_samples=3).fit(points)
-            new_centers = [np.mean(np.array(points)[clustering.labels_ == cid], axis=0)
+            new_centers = [np.mean(points[clustering.labels_ == cid], axis=0)
                            for cid in set(clustering.labels_) if cid != -1]
 
             # Cluster memory - compares new to old cluster to track between scans
@@ -155,6 +197,6 @@ def main():
                 last_print_time = time.time()
 
     except KeyboardInterrupt: print("\nStopping...")
-    finally: lidar.stop(); lidar.disconnect()
+    finally: scans.close()
 
 if __name__ == "__main__": main()